@@ -1,40 +1,450 @@
+import asyncio
+import concurrent.futures
+import hashlib
 import json
 import logging
-from urllib.request import urlopen
+import os
+import ssl
+import tempfile
+import time
+from collections import Counter
+from contextlib import nullcontext
+from threading import Lock
+from typing import Mapping, NamedTuple, Optional
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
 
-from utils import CITIES, ERR_MESSAGE_TEMPLATE
+from limiter import AdaptiveLimiter, AsyncAdaptiveLimiter
+from resilience import (CircuitBreakers,
+                        CircuitOpenError,
+                        LatencyTracker,
+                        ResponseStatusError,
+                        RetryPolicy,
+                        is_retryable,
+                        is_throttled)
+from stream_parser import ForecastStreamParser
+from utils import CITIES, ERR_MESSAGE_TEMPLATE, PROJECTED_HOUR_FIELDS
 
 
 logger = logging.getLogger()
 
+CHUNK_SIZE = 64 * 1024
+
+
+class CacheEntry(NamedTuple):
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    stored_at: float
+
+
+class ResponseCache:
+    """
+    Persistent cache of API responses keyed by url
+
+    Every entry is one file: a json line with validators followed by the raw body.
+    Files are written atomically and evicted by least recent use when the
+    directory grows over max_size bytes.
+    """
+
+    def __init__(
+            self,
+            directory: str = '.forecast_cache',
+            ttl: float = 3 * 60 * 60,
+            max_size: int = 100 * 1024 * 1024
+    ) -> None:
+        """
+        :param directory: directory for cache files
+        :param ttl: seconds while an entry is used without revalidation
+        :param max_size: max total size of cache files in bytes
+        """
+        self._directory = directory
+        self._ttl = ttl
+        self._max_size = max_size
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        os.makedirs(directory, exist_ok=True)
+        self._size = sum(size for _, size, _ in self._scan())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def _get_path(self, url: str) -> str:
+        return os.path.join(
+            self._directory, hashlib.sha256(url.encode('utf-8')).hexdigest()
+        )
+
+    def get(self, url: str) -> Optional[CacheEntry]:
+        """
+        :param url: url of request
+        :return: stored entry, fresh or stale, None if there is no one
+        """
+        path = self._get_path(url)
+        try:
+            with open(path, 'rb') as file:
+                meta = json.loads(file.readline())
+                body = file.read()
+            # mtime is the recency used by eviction
+            os.utime(path)
+        except (OSError, ValueError):
+            return None
+        return CacheEntry(body, meta['etag'], meta['last_modified'], meta['stored_at'])
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        return time.time() - entry.stored_at < self._ttl
+
+    @staticmethod
+    def get_conditional_headers(entry: Optional[CacheEntry]) -> dict:
+        headers = {}
+        if entry and entry.etag:
+            headers['If-None-Match'] = entry.etag
+        if entry and entry.last_modified:
+            headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def open(self, url: str, headers: dict) -> 'CacheWriter':
+        """
+        :param url: url of request
+        :param headers: response headers with lower-case names
+        :return: writer of the body, the entry appears after commit
+        """
+        return CacheWriter(self, url, headers)
+
+    def put(self, url: str, body: bytes, headers: dict) -> CacheEntry:
+        """
+        :param url: url of request
+        :param body: raw response body
+        :param headers: response headers with lower-case names
+        :return: stored entry
+        """
+        writer = self.open(url, headers)
+        writer.write(body)
+        writer.commit()
+        return CacheEntry(body, writer.etag, writer.last_modified, writer.stored_at)
+
+    def _add_size(self, size: int) -> None:
+        with self._lock:
+            self._size += size
+            if self._size > self._max_size:
+                self._evict()
+
+    def refresh(self, url: str, entry: CacheEntry, headers: dict) -> CacheEntry:
+        """
+        Store the entry again after the host answered 304 Not Modified.
+
+        :param url: url of request
+        :param entry: revalidated entry
+        :param headers: headers of the 304 response with lower-case names
+        :return: stored entry
+        """
+        self.count('revalidations')
+        return self.put(url, entry.body, {
+            'etag': headers.get('etag', entry.etag),
+            'last-modified': headers.get('last-modified', entry.last_modified)
+        })
+
+    def _scan(self) -> list:
+        files = []
+        with os.scandir(self._directory) as entries:
+            for dir_entry in entries:
+                if dir_entry.name.endswith('.tmp') or not dir_entry.is_file():
+                    continue
+                stat = dir_entry.stat()
+                files.append((stat.st_mtime, stat.st_size, dir_entry.path))
+        return files
+
+    def _evict(self) -> None:
+        # the directory could be shared with other processes, so sizes are read again
+        files = sorted(self._scan())
+        self._size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self._size <= self._max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+            self.evictions += 1
+
+    def count(self, counter: str) -> None:
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def stats(self) -> dict:
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'revalidations': self.revalidations,
+            'evictions': self.evictions
+        }
+
+
+class CacheWriter:
+    """
+    Writer of one cache entry by chunks into a temporary file.
+
+    The entry replaces the old one atomically on commit.
+    """
+
+    def __init__(self, cache: ResponseCache, url: str, headers: dict) -> None:
+        """
+        :param cache: cache of the entry
+        :param url: url of request
+        :param headers: response headers with lower-case names
+        """
+        self._cache = cache
+        self._url = url
+        self.etag = headers.get('etag')
+        self.last_modified = headers.get('last-modified')
+        self.stored_at = time.time()
+        descriptor, self._temp_path = tempfile.mkstemp(dir=cache._directory, suffix='.tmp')
+        self._file = os.fdopen(descriptor, 'wb')
+        self._size = self._file.write(json.dumps({
+            'url': url,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'stored_at': self.stored_at
+        }).encode('utf-8') + b'\n')
+
+    def write(self, chunk: bytes) -> None:
+        self._size += self._file.write(chunk)
+
+    def commit(self) -> None:
+        path = self._cache._get_path(self._url)
+        try:
+            self._file.close()
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(self._temp_path, path)
+        except OSError:
+            logger.exception('Can not write cache entry for %s', self._url)
+            self.abort()
+            return
+        self._cache._add_size(self._size - old_size)
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.unlink(self._temp_path)
+
+
+class _ResponseBody:
+    """Consumer of body chunks returning decoded json and filling the cache."""
+
+    def __init__(
+            self,
+            stream: bool,
+            cache_writer: Optional[CacheWriter] = None,
+            hour_fields: tuple = PROJECTED_HOUR_FIELDS
+    ) -> None:
+        self._parser = ForecastStreamParser(hour_fields) if stream else None
+        self._chunks = []
+        self._cache_writer = cache_writer
+
+    def write(self, chunk: bytes) -> None:
+        if self._cache_writer:
+            self._cache_writer.write(chunk)
+        if self._parser:
+            self._parser.feed(chunk)
+        else:
+            self._chunks.append(chunk)
+
+    def close(self):
+        """
+        :return: response data as json, projected forecasts in stream mode
+        """
+        try:
+            result = self._parser.close() if self._parser else json.loads(b''.join(self._chunks))
+        except BaseException:
+            self.abort()
+            raise
+        if self._cache_writer:
+            self._cache_writer.commit()
+        return result
+
+    def abort(self) -> None:
+        if self._cache_writer:
+            self._cache_writer.abort()
+
 
 class YandexWeatherAPI:
     """
     Base class for requests
     """
 
-    @staticmethod
-    def _do_req(url):
+    def __init__(
+            self,
+            cities: Optional[Mapping[str, str]] = None,
+            cache: Optional[ResponseCache] = None,
+            stream: bool = False,
+            hour_fields: tuple = PROJECTED_HOUR_FIELDS,
+            timeout: float = 10.0,
+            retry: Optional[RetryPolicy] = None,
+            breakers: Optional[CircuitBreakers] = None,
+            hedge: bool = False,
+            limiter: Optional[AdaptiveLimiter] = None
+    ) -> None:
+        """
+        :param cities: mapping of cities to urls like city_registry.CityRegistry, utils.CITIES by default
+        :param cache: cache of responses, requests always go to the network without it
+        :param stream: parse responses while reading and keep only projected forecasts
+        :param hour_fields: fields of hours kept in stream mode
+        :param timeout: seconds to wait for the host on every socket operation of a request
+        :param retry: retries of timeouts, network errors and overloaded hosts, RetryPolicy() by default
+        :param breakers: circuit breakers of hosts, CircuitBreakers() by default
+        :param hedge: send a duplicate of a request slower than 95% of recent ones
+            and take the first response
+        :param limiter: adaptive limit of requests in flight shared by threads, no limit by default
+        """
+        self._cities = CITIES if cities is None else cities
+        self._cache = cache
+        self.stream = stream
+        self.hour_fields = hour_fields
+        self._timeout = timeout
+        self._retry = retry or RetryPolicy()
+        self._breakers = breakers or CircuitBreakers()
+        self._hedge = hedge
+        self._limiter = limiter
+        self._latencies = LatencyTracker()
+        self._hedge_executor = None
+        self._counters = Counter()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_hedge_executor'] = None
+        return state
+
+    def stats(self) -> dict:
+        """
+        :return: numbers of retries, hedged requests and requests rejected by open circuits,
+            metrics of the limiter
+        """
+        stats = dict(self._counters)
+        if self._limiter:
+            stats.update(self._limiter.stats())
+        return stats
+
+    def _open_body(self, url: str, headers: dict) -> _ResponseBody:
+        cache_writer = None
+        if self._cache:
+            self._cache.count('misses')
+            cache_writer = self._cache.open(url, headers)
+        return _ResponseBody(self.stream, cache_writer, self.hour_fields)
+
+    def _parse_cached(self, entry: CacheEntry):
+        body = _ResponseBody(self.stream, hour_fields=self.hour_fields)
+        view = memoryview(entry.body)
+        for start in range(0, len(view), CHUNK_SIZE):
+            body.write(view[start:start + CHUNK_SIZE])
+        return body.close()
+
+    def _get_cached(self, url: str) -> Optional[CacheEntry]:
+        if not self._cache:
+            return None
+        return self._cache.get(url)
+
+    def _read_body(self, url: str, req) -> object:
+        body = self._open_body(url, {name.lower(): value for name, value in req.headers.items()})
+        try:
+            # without streaming the body is read at once as before
+            while chunk := req.read(CHUNK_SIZE if self.stream else None):
+                body.write(chunk)
+            return body.close()
+        except BaseException:
+            body.abort()
+            raise
+
+    def _request_once(self, url: str, entry: Optional[CacheEntry]):
+        started = time.monotonic()
+        headers = ResponseCache.get_conditional_headers(entry)
+        try:
+            with self._limiter.request() if self._limiter else nullcontext():
+                with urlopen(Request(url, headers=headers), timeout=self._timeout) as req:
+                    if req.status != 200:
+                        raise ResponseStatusError(req.status, req.reason)
+                    result = self._read_body(url, req)
+        except HTTPError as error:
+            if error.code != 304 or not entry:
+                raise
+            entry = self._cache.refresh(url, entry, {
+                name.lower(): value for name, value in error.headers.items()
+            })
+            result = self._parse_cached(entry)
+        self._latencies.add(time.monotonic() - started)
+        return result
+
+    def _get_hedge_executor(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._hedge_executor is None:
+            self._hedge_executor = concurrent.futures.ThreadPoolExecutor(thread_name_prefix='hedge')
+        return self._hedge_executor
+
+    def _request_hedged(self, url: str, entry: Optional[CacheEntry]):
+        if not self._hedge or (delay := self._latencies.get_hedge_delay()) is None:
+            return self._request_once(url, entry)
+        executor = self._get_hedge_executor()
+        first = executor.submit(self._request_once, url, entry)
+        try:
+            return first.result(timeout=delay)
+        except concurrent.futures.TimeoutError:
+            pass
+        self._counters['hedged'] += 1
+        # the slower request can not be interrupted, it ends by its own timeout
+        second = executor.submit(self._request_once, url, entry)
+        done, _ = concurrent.futures.wait((first, second), return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                return future.result()
+        return (second if first in done else first).result()
+
+    def _request_with_retries(self, url: str, entry: Optional[CacheEntry]):
+        host = urlsplit(url).netloc
+        breaker = self._breakers.get(host)
+        for attempt in range(self._retry.attempts):
+            if attempt:
+                self._counters['retries'] += 1
+                time.sleep(self._retry.get_delay(attempt))
+            if not breaker.allow():
+                self._counters['rejected'] += 1
+                raise CircuitOpenError('Circuit is open for {}'.format(host))
+            try:
+                result = self._request_hedged(url, entry)
+            except Exception as error:
+                if not is_retryable(error):
+                    raise
+                if not is_throttled(error):
+                    breaker.record_failure()
+                if attempt == self._retry.attempts - 1:
+                    raise
+                logger.warning('Attempt %s of %s for %s failed: %r', attempt + 1, self._retry.attempts, url, error)
+                continue
+            breaker.record_success()
+            return result
+
+    def _do_req(self, url):
         """Base request method"""
         try:
-            with urlopen(url) as req:
-                resp = req.read().decode("utf-8")
-                resp = json.loads(resp)
-            if req.status != 200:
-                raise Exception(
-                    "Error during execute request. {}: {}".format(
-                        resp.status, resp.reason
-                    )
-                )
-            return resp
+            entry = self._get_cached(url)
+            if entry and self._cache.is_fresh(entry):
+                self._cache.count('hits')
+                return self._parse_cached(entry)
+            return self._request_with_retries(url, entry)
         except Exception as ex:
             logger.error(ex)
             raise Exception(ERR_MESSAGE_TEMPLATE)
 
-    @staticmethod
-    def _get_url_by_city_name(city_name: str) -> str:
+    def _get_url_by_city_name(self, city_name: str) -> str:
         try:
-            return CITIES[city_name]
+            return self._cities[city_name]
         except KeyError:
             raise Exception("Please check that city {} exists".format(city_name))
 
@@ -45,3 +455,285 @@ class YandexWeatherAPI:
         """
         city_url = self._get_url_by_city_name(city_name)
         return self._do_req(city_url)
+
+
+class _Response(NamedTuple):
+    status: int
+    reason: str
+    headers: dict
+    body: _ResponseBody
+    keep_alive: bool
+
+
+class AsyncYandexWeatherAPI(YandexWeatherAPI):
+    """
+    Asyncio requests over keep-alive HTTP/1.1 connections reused per host
+    """
+
+    def __init__(
+            self,
+            cities: Optional[Mapping[str, str]] = None,
+            concurrency: int = 50,
+            connections_per_host: int = 10,
+            cache: Optional[ResponseCache] = None,
+            stream: bool = False,
+            hour_fields: tuple = PROJECTED_HOUR_FIELDS,
+            timeout: float = 10.0,
+            retry: Optional[RetryPolicy] = None,
+            breakers: Optional[CircuitBreakers] = None,
+            hedge: bool = False,
+            limiter: Optional[AsyncAdaptiveLimiter] = None
+    ) -> None:
+        """
+        :param cities: mapping of cities to urls like city_registry.CityRegistry, utils.CITIES by default
+        :param concurrency: max number of requests in flight without limiter
+        :param connections_per_host: max number of idle connections kept open for one host
+        :param cache: cache of responses, requests always go to the network without it
+        :param stream: parse responses while reading and keep only projected forecasts
+        :param hour_fields: fields of hours kept in stream mode
+        :param timeout: seconds to wait for the whole response of a request
+        :param retry: retries of failed requests, see YandexWeatherAPI
+        :param breakers: circuit breakers of hosts, see YandexWeatherAPI
+        :param hedge: send a duplicate of slow requests, see YandexWeatherAPI
+        :param limiter: adaptive limit of requests in flight replacing concurrency
+        """
+        super().__init__(cities, cache, stream, hour_fields, timeout, retry, breakers, hedge, limiter)
+        self._concurrency = concurrency
+        self._connections_per_host = connections_per_host
+        self._semaphore = None
+        self._idle = {}
+        self._ssl_context = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self) -> None:
+        """Close every idle connection."""
+        for connections in self._idle.values():
+            for _, writer in connections:
+                writer.close()
+        self._idle.clear()
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # created lazily so that the semaphore is bound to the running loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self._concurrency)
+        return self._semaphore
+
+    def _limit_request(self):
+        """:return: async context manager holding a place among requests in flight"""
+        if self._limiter:
+            return self._limiter.request()
+        return self._get_semaphore()
+
+    async def _open_connection(self, scheme: str, host: str, port: int):
+        if scheme == 'https':
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            return await asyncio.open_connection(host, port, ssl=self._ssl_context)
+        return await asyncio.open_connection(host, port)
+
+    def _release_connection(self, key: tuple, connection: tuple) -> None:
+        connections = self._idle.setdefault(key, [])
+        if len(connections) < self._connections_per_host:
+            connections.append(connection)
+        else:
+            connection[1].close()
+
+    @staticmethod
+    async def _read_chunked(reader: asyncio.StreamReader, body: _ResponseBody) -> None:
+        while True:
+            size_line = await reader.readline()
+            size = int(size_line.split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                # trailer headers end with an empty line
+                while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    pass
+                return
+            body.write(await reader.readexactly(size))
+            await reader.readexactly(2)
+
+    @staticmethod
+    async def _read_length(reader: asyncio.StreamReader, length: int, body: _ResponseBody) -> None:
+        while length > 0:
+            chunk = await reader.read(min(length, CHUNK_SIZE))
+            if not chunk:
+                raise asyncio.IncompleteReadError(b'', length)
+            body.write(chunk)
+            length -= len(chunk)
+
+    @staticmethod
+    async def _read_to_end(reader: asyncio.StreamReader, body: _ResponseBody) -> None:
+        while chunk := await reader.read(CHUNK_SIZE):
+            body.write(chunk)
+
+    async def _read_response(self, reader: asyncio.StreamReader, open_body) -> _Response:
+        """
+        :param open_body: callable with status and headers returning consumer of the body
+        """
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Connection closed by host')
+        version, status, *reason = status_line.decode('latin-1').rstrip('\r\n').split(' ', 2)
+        status = int(status)
+        headers = {}
+        while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        keep_alive = (
+            version == 'HTTP/1.1'
+            and headers.get('connection', '').lower() != 'close'
+        )
+        body = open_body(status, headers)
+        try:
+            if status in (204, 304):
+                pass
+            elif headers.get('transfer-encoding', '').lower() == 'chunked':
+                await self._read_chunked(reader, body)
+            elif 'content-length' in headers:
+                await self._read_length(reader, int(headers['content-length']), body)
+            else:
+                await self._read_to_end(reader, body)
+                keep_alive = False
+        except BaseException:
+            body.abort()
+            raise
+        return _Response(status, reason[0] if reason else '', headers, body, keep_alive)
+
+    async def _request(self, url: str, headers: dict, open_body) -> _Response:
+        """
+        :param url: url of request
+        :param headers: additional request headers
+        :param open_body: callable with status and headers returning consumer of the body
+        """
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path = '{}?{}'.format(path, parts.query)
+        request = (
+            'GET {} HTTP/1.1\r\n'
+            'Host: {}\r\n'
+            'Accept-Encoding: identity\r\n'
+            'Connection: keep-alive\r\n'
+            '{}\r\n'
+        ).format(
+            path,
+            parts.netloc,
+            ''.join('{}: {}\r\n'.format(name, value) for name, value in headers.items())
+        ).encode('latin-1')
+        idle = self._idle.get(key)
+        # a reused connection could have been closed by the host, then retry on a new one
+        for reused in ((True, False) if idle else (False,)):
+            if reused and idle:
+                reader, writer = idle.pop()
+            else:
+                reader, writer = await self._open_connection(*key)
+            try:
+                writer.write(request)
+                await writer.drain()
+                response = await self._read_response(reader, open_body)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:
+                    continue
+                raise
+            except BaseException:
+                # a request cancelled by timeout or hedging leaves the connection in an unknown state
+                writer.close()
+                raise
+            if response.keep_alive:
+                self._release_connection(key, (reader, writer))
+            else:
+                writer.close()
+            return response
+
+    async def _async_request_once(self, url: str, entry: Optional[CacheEntry]):
+        def open_body(status: int, headers: dict) -> _ResponseBody:
+            if status == 200:
+                return self._open_body(url, headers)
+            return _ResponseBody(stream=False)
+
+        async with self._limit_request():
+            started = time.monotonic()
+            response = await asyncio.wait_for(
+                self._request(url, ResponseCache.get_conditional_headers(entry), open_body),
+                self._timeout
+            )
+        if response.status == 304 and entry:
+            entry = self._cache.refresh(url, entry, response.headers)
+            result = self._parse_cached(entry)
+        elif response.status != 200:
+            raise ResponseStatusError(response.status, response.reason)
+        else:
+            result = response.body.close()
+        self._latencies.add(time.monotonic() - started)
+        return result
+
+    async def _async_request_hedged(self, url: str, entry: Optional[CacheEntry]):
+        if not self._hedge or (delay := self._latencies.get_hedge_delay()) is None:
+            return await self._async_request_once(url, entry)
+        first = asyncio.ensure_future(self._async_request_once(url, entry))
+        done, _ = await asyncio.wait((first,), timeout=delay)
+        if done:
+            return first.result()
+        self._counters['hedged'] += 1
+        second = asyncio.ensure_future(self._async_request_once(url, entry))
+        try:
+            done, _ = await asyncio.wait((first, second), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+            return await (second if first in done else first)
+        finally:
+            for task in (first, second):
+                task.cancel()
+
+    async def _async_request_with_retries(self, url: str, entry: Optional[CacheEntry]):
+        host = urlsplit(url).netloc
+        breaker = self._breakers.get(host)
+        for attempt in range(self._retry.attempts):
+            if attempt:
+                self._counters['retries'] += 1
+                await asyncio.sleep(self._retry.get_delay(attempt))
+            if not breaker.allow():
+                self._counters['rejected'] += 1
+                raise CircuitOpenError('Circuit is open for {}'.format(host))
+            try:
+                result = await self._async_request_hedged(url, entry)
+            except Exception as error:
+                if not is_retryable(error):
+                    raise
+                if not is_throttled(error):
+                    breaker.record_failure()
+                if attempt == self._retry.attempts - 1:
+                    raise
+                logger.warning('Attempt %s of %s for %s failed: %r', attempt + 1, self._retry.attempts, url, error)
+                continue
+            breaker.record_success()
+            return result
+
+    async def _do_async_req(self, url: str):
+        """Base async request method"""
+        try:
+            entry = self._get_cached(url)
+            if entry and self._cache.is_fresh(entry):
+                self._cache.count('hits')
+                return self._parse_cached(entry)
+            return await self._async_request_with_retries(url, entry)
+        except Exception as ex:
+            logger.error(ex)
+            raise Exception(ERR_MESSAGE_TEMPLATE)
+
+    async def get_forecasting(self, city_name: str):
+        """
+        :param city_name: key as str
+        :return: response data as json
+        """
+        city_url = self._get_url_by_city_name(city_name)
+        return await self._do_async_req(city_url)
@@ -0,0 +1,371 @@
+"""
+Offline benchmarks of the weather pipeline against the local stub server.
+
+Usage: python benchmark.py fetch --cities 1000 --latency 0.02
+       python benchmark.py ipc
+       python benchmark.py calc --cities 10000 --workers 1 2 4 --engine numpy
+       python benchmark.py engines --cities 10000
+       python benchmark.py dates
+       python benchmark.py memory --cities 200
+       python benchmark.py postprocess --cities 100000
+       python benchmark.py profiles --cities 2000 --profiles 8
+       python benchmark.py backpressure --cities 1000 --capacity 0 100
+"""
+import argparse
+import json
+import os
+import pickle
+import resource
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from multiprocessing import Event, Process, Queue
+from queue import SimpleQueue
+from threading import Lock
+
+from api_client import YandexWeatherAPI
+from conditions import load_condition_registry
+from pipeline import run_stages
+from profiles import ScoringPlan, ScoringProfile
+from stub_server import RESPONSE_FILE, make_cities, run_stub_server
+from tasks import (AsyncDataFetchingTask,
+                   DataAggregationTask,
+                   DataAnalyzingTask,
+                   DataCalculationPool,
+                   DataCalculationTask,
+                   DataFetchingTask)
+from utils import CITIES, project_forecast
+
+
+def _drain(queue: Queue) -> int:
+    count = 0
+    while queue.get() is not None:
+        count += 1
+    return count
+
+
+def _time_fetching_task(task_class, cities: dict[str, str], **kwargs) -> tuple:
+    queue = Queue()
+    task = task_class(cities=cities, queue=queue, **kwargs)
+    started = time.perf_counter()
+    task.start()
+    # the queue is drained before join, otherwise the feeder thread blocks the exit
+    count = _drain(queue)
+    task.join()
+    return count, time.perf_counter() - started
+
+
+def bench_fetch(count: int, concurrency: int, latency: float) -> None:
+    with run_stub_server(latency=latency) as server:
+        cities = make_cities(server.base_url, count)
+        for name, task_class, kwargs in (
+                ('thread pool + urlopen', DataFetchingTask, {}),
+                ('asyncio + keep-alive', AsyncDataFetchingTask, {'concurrency': concurrency}),
+        ):
+            fetched, elapsed = _time_fetching_task(task_class, cities, **kwargs)
+            print('{:<24} {:>6} cities {:>8.2f} s {:>10.1f} cities/s'.format(
+                name, fetched, elapsed, fetched / elapsed
+            ))
+
+
+def bench_ipc() -> None:
+    with open(RESPONSE_FILE, encoding='utf-8') as file:
+        data = json.load(file)
+    full = dict(data, city_name='CITY0')
+    projected = dict(project_forecast(data), city_name='CITY0')
+    for name, record in (('full response', full), ('projected', projected)):
+        payload = pickle.dumps(record)
+        started = time.perf_counter()
+        for _ in range(1000):
+            pickle.loads(pickle.dumps(record))
+        elapsed = (time.perf_counter() - started) / 1000
+        print('{:<16} {:>8} bytes/city {:>8.1f} us pickle+unpickle'.format(
+            name, len(payload), elapsed * 1e6
+        ))
+
+
+def _load_projected_response() -> dict:
+    with open(RESPONSE_FILE, encoding='utf-8') as file:
+        return project_forecast(json.load(file))
+
+
+def _fill_queue(queue: Queue, count: int) -> None:
+    projected = _load_projected_response()
+    for index in range(count):
+        queue.put(dict(projected, city_name='CITY{}'.format(index)))
+    queue.put(None)
+
+
+def _time_calculation_task(task_class, count: int, **kwargs) -> tuple:
+    queue = Queue()
+    result_queue = Queue()
+    task = task_class(
+        # the whole period of examples/response.json
+        start_day='2022-05-18',
+        finish_day='2022-05-22',
+        queue=queue,
+        result_queue=result_queue,
+        bad_conditions=load_condition_registry().bad_conditions,
+        **kwargs
+    )
+    started = time.perf_counter()
+    task.start()
+    _fill_queue(queue, count)
+    results = result_queue.get()
+    task.join()
+    return len(results), time.perf_counter() - started
+
+
+def bench_calc(count: int, workers: list, engine: str) -> None:
+    calculated, elapsed = _time_calculation_task(DataCalculationTask, count, engine=engine)
+    print('{:<24} {:>6} cities {:>8.2f} s {:>10.1f} cities/s'.format(
+        'single process', calculated, elapsed, calculated / elapsed
+    ))
+    for workers_count in workers:
+        calculated, elapsed = _time_calculation_task(
+            DataCalculationPool, count, workers_count=workers_count, engine=engine
+        )
+        print('{:<24} {:>6} cities {:>8.2f} s {:>10.1f} cities/s'.format(
+            'pool of {}'.format(workers_count), calculated, elapsed, calculated / elapsed
+        ))
+
+
+def bench_engines(count: int) -> None:
+    from scoring import ColumnarCalculator
+
+    projected = _load_projected_response()
+    cities_data = [
+        dict(projected, city_name='CITY{}'.format(index)) for index in range(count)
+    ]
+    bad_conditions = load_condition_registry().bad_conditions
+    task = DataCalculationTask('2022-05-18', '2022-05-22', Queue(), Queue(), bad_conditions)
+    calculator = ColumnarCalculator('2022-05-18', '2022-05-22', bad_conditions)
+    for name, calculate in (
+            ('python', lambda: [task._calculate_city_data(city_data) for city_data in cities_data]),
+            ('numpy', lambda: calculator.calculate(cities_data)),
+    ):
+        started = time.perf_counter()
+        calculate()
+        elapsed = time.perf_counter() - started
+        print('{:<24} {:>6} cities {:>8.2f} s {:>10.1f} cities/s'.format(
+            name, count, elapsed, count / elapsed
+        ))
+
+
+def _filter_dates_with_strptime(data: dict, start_day, finish_day) -> dict:
+    """Day window filter of DataCalculationTask before the date index."""
+    return {
+        datetime.strptime(day['date'], '%Y-%m-%d').date().strftime('%d-%m'): day
+        for day in data['forecasts']
+        if start_day <= datetime.strptime(day['date'], '%Y-%m-%d').date() <= finish_day
+    }
+
+
+def bench_dates(repeat: int = 10000) -> None:
+    data = _load_projected_response()
+    task = DataCalculationTask('2022-05-19', '2022-05-21', Queue(), Queue(), ())
+    for name, filter_dates in (
+            ('strptime', lambda: _filter_dates_with_strptime(
+                data, task._start_day, task._finish_day
+            )),
+            ('date index + bisect', lambda: {
+                task._get_formatted_date(day): day for day in task._get_days_period(data)
+            }),
+    ):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            filter_dates()
+        elapsed = (time.perf_counter() - started) / repeat
+        print('{:<24} {:>8.2f} us/city'.format(name, elapsed * 1e6))
+
+
+def _measure_fetch_memory(cities: dict[str, str], stream: bool, report: Queue) -> None:
+    api = YandexWeatherAPI(cities=cities, stream=stream)
+    tracemalloc.start()
+    peaks = []
+    for city in list(cities)[:20]:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        api.get_forecasting(city)
+        peaks.append(tracemalloc.get_traced_memory()[1] - before)
+    tracemalloc.stop()
+    # the pool of DataFetchingTask keeps five responses in flight
+    with ThreadPoolExecutor(max_workers=5) as pool:
+        list(pool.map(api.get_forecasting, cities))
+    report.put((max(peaks), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+
+
+def bench_memory(count: int) -> None:
+    with run_stub_server() as server:
+        cities = make_cities(server.base_url, count)
+        for name, stream in (('read + json.loads', False), ('stream parser', True)):
+            report = Queue()
+            process = Process(target=_measure_fetch_memory, args=(cities, stream, report))
+            process.start()
+            peak, max_rss = report.get()
+            process.join()
+            print('{:<24} {:>8.1f} KiB peak per city {:>8} KiB max RSS'.format(
+                name, peak / 1024, max_rss
+            ))
+
+
+class _MeasuredFetchingTask(DataFetchingTask):
+    """Fetching process reporting its max RSS."""
+
+    def __init__(self, report: Queue, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._report = report
+
+    def run(self):
+        super().run()
+        self._report.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+
+class _SlowCalculationTask(DataCalculationTask):
+    """Calculation process spending delay seconds more on every city."""
+
+    def __init__(self, delay: float, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._delay = delay
+
+    def _calculate_city_data(self, data: dict):
+        time.sleep(self._delay)
+        return super()._calculate_city_data(data)
+
+
+def bench_backpressure(count: int, capacities: list, delay: float) -> None:
+    with run_stub_server() as server:
+        cities = make_cities(server.base_url, count)
+        for capacity in capacities:
+            queue = Queue(maxsize=capacity)
+            result_queue = Queue()
+            report = Queue()
+            stop_event = Event()
+            producer = _MeasuredFetchingTask(report, cities, queue, stop_event=stop_event)
+            consumer = _SlowCalculationTask(delay, '2022-05-18', '2022-05-22', queue, result_queue, ())
+            started = time.perf_counter()
+            results = run_stages(producer, consumer, queue, result_queue, stop_event)
+            print('capacity {:<6} {:>6} cities {:>8.2f} s {:>10} KiB max RSS of fetching'.format(
+                capacity or 'none', len(results), time.perf_counter() - started, report.get()
+            ))
+
+
+def bench_profiles(count: int, profiles_count: int) -> None:
+    projected = _load_projected_response()
+    cities_data = [dict(projected, city_name='CITY{}'.format(index)) for index in range(count)]
+    bad_conditions = load_condition_registry().bad_conditions
+    task = DataCalculationTask('2022-05-18', '2022-05-22', Queue(), Queue(), bad_conditions)
+    # half of profiles differ by weights only and share metrics of days
+    profiles = [
+        ScoringProfile('weights{}'.format(index), 'avg_temp + {} * cond_hours'.format(index))
+        for index in range(profiles_count // 2)
+    ] + [
+        ScoringProfile('window{}'.format(index), bottom_day_hour=index, top_day_hour=index + 12)
+        for index in range(profiles_count - profiles_count // 2)
+    ]
+    plan = ScoringPlan(profiles, bad_conditions)
+
+    def score_with_plan():
+        for city_data in cities_data:
+            days = [(task._get_formatted_date(day), day) for day in task._get_days_period(city_data)]
+            plan.calculate(city_data['city_name'], days)
+
+    for name, calculate in (
+            ('{} runs'.format(profiles_count), lambda: [
+                task._calculate_city_data(city_data) for _ in profiles for city_data in cities_data
+            ]),
+            ('plan of {} profiles'.format(profiles_count), score_with_plan),
+    ):
+        started = time.perf_counter()
+        calculate()
+        elapsed = time.perf_counter() - started
+        print('{:<24} {:>6} cities {:>8.2f} s'.format(name, count, elapsed))
+
+
+def _make_results_of_calculations(count: int) -> list:
+    city_names = list(CITIES)
+    return [
+        {
+            'city_name': city_names[index % len(city_names)],
+            'dates': {
+                '{:02}-05'.format(day): {'avg_temp': 20 + index % 7, 'cond_hours': 5}
+                for day in range(26, 30)
+            },
+            'AVG': {'avg_temp': 20.0 + index % 7, 'cond_hours': 5.0},
+            'rating': 7 - index % 7
+        }
+        for index in range(count)
+    ]
+
+
+def _run_postprocess(results_of_calculations: list, file_name: str, pipelined: bool) -> tuple:
+    lock = Lock()
+    aggregation_queue = SimpleQueue() if pipelined else None
+    aggregation = DataAggregationTask(
+        lock=lock,
+        results_of_calculations=results_of_calculations,
+        file_name=file_name,
+        aggregation_queue=aggregation_queue
+    )
+    analysis = DataAnalyzingTask(lock=lock, file_name=file_name, aggregation_queue=aggregation_queue)
+    started = time.perf_counter()
+    aggregation.start()
+    if not pipelined:
+        aggregation.join()
+    analysis.start()
+    analysis.join()
+    analysed = time.perf_counter() - started
+    aggregation.join()
+    return analysed, time.perf_counter() - started
+
+
+def bench_postprocess(count: int) -> None:
+    results_of_calculations = _make_results_of_calculations(count)
+    with tempfile.TemporaryDirectory() as directory:
+        file_name = os.path.join(directory, 'result.json')
+        for name, pipelined in (('file hand-off', False), ('pipelined threads', True)):
+            analysed, finished = _run_postprocess(results_of_calculations, file_name, pipelined)
+            print('{:<24} {:>6} cities {:>8.2f} s to best cities {:>8.2f} s to file'.format(
+                name, count, analysed, finished
+            ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    fetch_parser = subparsers.add_parser('fetch', help='DataFetchingTask vs AsyncDataFetchingTask')
+    fetch_parser.add_argument('--cities', type=int, default=1000)
+    fetch_parser.add_argument('--concurrency', type=int, default=50)
+    fetch_parser.add_argument('--latency', type=float, default=0.02, help='stub server latency, seconds')
+    fetch_parser.set_defaults(run=lambda args: bench_fetch(args.cities, args.concurrency, args.latency))
+    ipc_parser = subparsers.add_parser('ipc', help='bytes pickled per city onto the queue')
+    ipc_parser.set_defaults(run=lambda args: bench_ipc())
+    calc_parser = subparsers.add_parser('calc', help='DataCalculationTask vs DataCalculationPool')
+    calc_parser.add_argument('--cities', type=int, default=10000)
+    calc_parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    calc_parser.add_argument('--engine', choices=('python', 'numpy'), default='python')
+    calc_parser.set_defaults(run=lambda args: bench_calc(args.cities, args.workers, args.engine))
+    engines_parser = subparsers.add_parser('engines', help='python vs numpy calculation engine')
+    engines_parser.add_argument('--cities', type=int, default=10000)
+    engines_parser.set_defaults(run=lambda args: bench_engines(args.cities))
+    dates_parser = subparsers.add_parser('dates', help='day window filter per city')
+    dates_parser.set_defaults(run=lambda args: bench_dates())
+    memory_parser = subparsers.add_parser('memory', help='memory of a request with and without streaming')
+    memory_parser.add_argument('--cities', type=int, default=200)
+    memory_parser.set_defaults(run=lambda args: bench_memory(args.cities))
+    postprocess_parser = subparsers.add_parser('postprocess', help='aggregation and analysis threads')
+    postprocess_parser.add_argument('--cities', type=int, default=100000)
+    postprocess_parser.set_defaults(run=lambda args: bench_postprocess(args.cities))
+    profiles_parser = subparsers.add_parser('profiles', help='runs per scoring variant vs one scoring plan')
+    profiles_parser.add_argument('--cities', type=int, default=2000)
+    profiles_parser.add_argument('--profiles', type=int, default=8)
+    profiles_parser.set_defaults(run=lambda args: bench_profiles(args.cities, args.profiles))
+    backpressure_parser = subparsers.add_parser('backpressure', help='fetching memory with a slow calculation')
+    backpressure_parser.add_argument('--cities', type=int, default=1000)
+    backpressure_parser.add_argument('--capacity', type=int, nargs='+', default=[0, 100], help='0 for no limit')
+    backpressure_parser.add_argument('--delay', type=float, default=0.01, help='extra seconds per city')
+    backpressure_parser.set_defaults(run=lambda args: bench_backpressure(args.cities, args.capacity, args.delay))
+    args = parser.parse_args()
+    args.run(args)
@@ -0,0 +1,252 @@
+"""
+Reproducible benchmark of the stages and of forecast_weather on synthetic cities.
+
+Every city gets its own forecast from stub_server.SyntheticForecasts served by
+the local stub server. Every stage runs in a fresh process for its peak memory.
+Results are compared with the baseline file, --save replaces the baseline.
+
+Usage: python benchmark_suite.py --cities 10 1000 10000
+       python benchmark_suite.py --cities 10 1000 10000 --save
+       python benchmark_suite.py --cities 100000 --stages calculation aggregation analysis
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from multiprocessing import Process, Queue
+from threading import Lock
+
+from conditions import load_condition_registry
+from metrics import Metrics
+from stub_server import SyntheticForecasts, make_cities, run_stub_server
+from tasks import DataAggregationTask, DataAnalyzingTask, DataCalculationTask, DataFetchingTask
+from utils import project_forecast
+
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+STAGES = ('fetch', 'calculation', 'aggregation', 'analysis', 'end_to_end')
+START_DAY = '2022-05-26'
+FINISH_DAY = '2022-05-29'
+SEED = 0
+# geometric buckets from 10 us with 25 % steps, percentiles are exact within a step
+LATENCY_BUCKETS = tuple(1e-5 * 1.25 ** power for power in range(75))
+
+
+def _get_latency(metrics: Metrics, name: str) -> dict:
+    """
+    :return: percentiles of a histogram of metrics in milliseconds
+    """
+    histogram = metrics.histograms.get((name, ()))
+    if histogram is None:
+        return {}
+    return {
+        'p{}'.format(percentile): round(histogram.get_quantile(percentile / 100) * 1000, 4)
+        for percentile in (50, 95, 99)
+    }
+
+
+def _get_measurement(count: int, seconds: float, metrics: Metrics, latency_name: str = '') -> dict:
+    return {
+        'seconds': round(seconds, 4),
+        'cities_per_second': round(count / seconds, 1),
+        'latency_ms': _get_latency(metrics, latency_name),
+    }
+
+
+def _measure_fetch(base_url: str, count: int, directory: str) -> dict:
+    metrics = Metrics(Queue(), buckets=LATENCY_BUCKETS)
+    queue = Queue()
+    task = DataFetchingTask(make_cities(base_url, count), queue, metrics=metrics)
+    started = time.perf_counter()
+    task.start()
+    fetched = sum(1 for _ in iter(queue.get, None))
+    task.join()
+    seconds = time.perf_counter() - started
+    metrics.collect()
+    return _get_measurement(fetched, seconds, metrics, 'fetch_seconds')
+
+
+def _iter_projected_responses(count: int):
+    synthetic = SyntheticForecasts(START_DAY, SEED)
+    for index in range(count):
+        yield dict(project_forecast(synthetic.make_response(index)), city_name='CITY{}'.format(index))
+
+
+def _measure_calculation(base_url: str, count: int, directory: str) -> dict:
+    metrics = Metrics(Queue(), buckets=LATENCY_BUCKETS)
+    queue = Queue()
+    result_queue = Queue()
+    task = DataCalculationTask(
+        START_DAY, FINISH_DAY, queue, result_queue, load_condition_registry().bad_conditions, metrics=metrics
+    )
+    # the process is forked before the forecasts are generated, so its memory is its own
+    task.start()
+    cities_data = list(_iter_projected_responses(count))
+    started = time.perf_counter()
+    for city_data in cities_data:
+        queue.put(city_data)
+    queue.put(None)
+    results = result_queue.get()
+    task.join()
+    seconds = time.perf_counter() - started
+    metrics.collect()
+    with open(os.path.join(directory, 'results_of_calculations.json'), 'w', encoding='utf-8') as file:
+        json.dump(results, file)
+    return _get_measurement(count, seconds, metrics, 'calc_seconds')
+
+
+def _measure_aggregation(base_url: str, count: int, directory: str) -> dict:
+    with open(os.path.join(directory, 'results_of_calculations.json'), encoding='utf-8') as file:
+        results_of_calculations = json.load(file)
+    metrics = Metrics(buckets=LATENCY_BUCKETS)
+    task = DataAggregationTask(
+        Lock(), results_of_calculations, os.path.join(directory, 'result.json'), locale='en', metrics=metrics
+    )
+    started = time.perf_counter()
+    task.start()
+    task.join()
+    return _get_measurement(count, time.perf_counter() - started, metrics, 'serialize_seconds')
+
+
+def _measure_analysis(base_url: str, count: int, directory: str) -> dict:
+    metrics = Metrics(buckets=LATENCY_BUCKETS)
+    task = DataAnalyzingTask(Lock(), os.path.join(directory, 'result.json'), locale='en', metrics=metrics)
+    started = time.perf_counter()
+    task.start()
+    task.join()
+    return _get_measurement(count, time.perf_counter() - started, metrics)
+
+
+def _measure_end_to_end(base_url: str, count: int, directory: str) -> dict:
+    # forecasting configures logging on import, it is disabled by _report_measurement
+    from forecasting import forecast_weather
+    metrics_file = os.path.join(directory, 'metrics.json')
+    started = time.perf_counter()
+    forecast_weather(
+        cities=make_cities(base_url, count),
+        out_file_name=os.path.join(directory, 'forecast.json'),
+        use_cache=False,
+        use_result_store=False,
+        metrics_file=metrics_file
+    )
+    seconds = time.perf_counter() - started
+    with open(metrics_file, encoding='utf-8') as file:
+        report = json.load(file)
+    measurement = _get_measurement(count, seconds, Metrics())
+    measurement['stage_seconds'] = {
+        histogram['labels']['stage']: round(histogram['sum'], 4)
+        for histogram in report['histograms'] if histogram['name'] == 'stage_seconds'
+    }
+    return measurement
+
+
+# the measuring process holds data of these stages, only the process of the stage is measured
+PROCESS_STAGES = ('fetch', 'calculation')
+MEASUREMENTS = {
+    'fetch': _measure_fetch,
+    'calculation': _measure_calculation,
+    'aggregation': _measure_aggregation,
+    'analysis': _measure_analysis,
+    'end_to_end': _measure_end_to_end,
+}
+
+
+def _report_measurement(report: Queue, stage: str, *args) -> None:
+    # a line per city would be measured too, synthetic cities are not translated either
+    logging.disable(logging.ERROR)
+    measurement = MEASUREMENTS[stage](*args)
+    # processes of a stage are waited for, so they are children here
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    if stage not in PROCESS_STAGES:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+    measurement['peak_rss_kib'] = peak
+    report.put(measurement)
+
+
+def run_suite(counts: list, stages: tuple = STAGES, latency: float = 0.0) -> dict:
+    """
+    :param counts: numbers of cities
+    :param stages: measured stages of STAGES, aggregation requires calculation and analysis requires aggregation
+    :param latency: seconds of latency of the stub server
+    :return: results with environment and measurements of stages for every number of cities
+    """
+    runs = {}
+    with run_stub_server(latency=latency, synthetic=SyntheticForecasts(START_DAY, SEED)) as server:
+        for count in counts:
+            runs[str(count)] = {}
+            with tempfile.TemporaryDirectory() as directory:
+                for stage in stages:
+                    report = Queue()
+                    process = Process(
+                        target=_report_measurement, args=(report, stage, server.base_url, count, directory)
+                    )
+                    process.start()
+                    runs[str(count)][stage] = report.get()
+                    process.join()
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'stub_latency': latency,
+        },
+        'runs': runs,
+    }
+
+
+def compare_with_baseline(results: dict, baseline: dict, tolerance: float) -> list:
+    """
+    :param results: results of run_suite
+    :param baseline: results of an earlier run_suite
+    :param tolerance: share of slowdown or memory growth which is not a regression
+    :return: descriptions of regressions
+    """
+    regressions = []
+    for count, stages in results['runs'].items():
+        for stage, measurement in stages.items():
+            if (base := baseline['runs'].get(count, {}).get(stage)) is None:
+                continue
+            for key in ('seconds', 'peak_rss_kib'):
+                if measurement[key] > base[key] * (1 + tolerance):
+                    regressions.append('{} cities, {}: {} {} vs {} in the baseline'.format(
+                        count, stage, key, measurement[key], base[key]
+                    ))
+    return regressions
+
+
+def print_results(results: dict) -> None:
+    for count, stages in results['runs'].items():
+        for stage, measurement in stages.items():
+            latency = ' '.join('{}={}ms'.format(key, value) for key, value in measurement['latency_ms'].items())
+            print('{:>7} cities {:<12} {:>9.3f} s {:>10.1f} cities/s {:>9} KiB peak  {}'.format(
+                count, stage, measurement['seconds'], measurement['cities_per_second'],
+                measurement['peak_rss_kib'], latency
+            ))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cities', type=int, nargs='+', default=[10, 1000, 10000])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--latency', type=float, default=0.0, help='stub server latency, seconds')
+    parser.add_argument('--baseline', default=BASELINE_FILE)
+    parser.add_argument('--save', action='store_true', help='replace the baseline with the results')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='share of slowdown which is not a regression')
+    args = parser.parse_args()
+    suite_results = run_suite(args.cities, tuple(args.stages), args.latency)
+    print_results(suite_results)
+    if args.save:
+        with open(args.baseline, 'w', encoding='utf-8') as baseline_file:
+            json.dump(suite_results, baseline_file, indent=2)
+        print('Baseline is saved to {}.'.format(args.baseline))
+    elif os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as baseline_file:
+            found = compare_with_baseline(suite_results, json.load(baseline_file), args.tolerance)
+        for regression in found:
+            print('REGRESSION: {}'.format(regression))
+        sys.exit(1 if found else 0)
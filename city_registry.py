@@ -0,0 +1,238 @@
+import csv
+import json
+import os
+import zlib
+from collections.abc import Mapping
+from functools import lru_cache
+from threading import Lock
+from typing import Iterator, NamedTuple, Optional
+
+
+CITIES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples', 'cities.csv')
+FILE_FORMATS = ('csv', 'jsonl')
+SHARD_KEYS = ('name', 'region')
+# the rest of columns are localized names with locales as names of columns
+_FIELDS = ('name', 'url', 'region')
+
+
+class City(NamedTuple):
+    name: str
+    url: str
+    region: str
+    # localized names by locales
+    names: dict
+
+
+class CityRegistry(Mapping):
+    """
+    Cities of a file as a mapping of names to urls, it is accepted as cities by fetching tasks.
+
+    A CSV file has a header with columns name, url, optional region and a column of
+    localized names for every locale, like examples/cities.csv. A JSON Lines file has
+    an object with the same keys on every line. Every record is one line.
+    Nothing is read before use. Iteration and chunks read the file as a stream,
+    lookups by name read one line by its offset from the index built on first lookup,
+    so memory holds names and offsets of cities only.
+    A shard keeps cities with crc32 of the name or of the region equal to its number modulo
+    the number of shards, it is stable across processes and machines.
+    """
+
+    def __init__(
+            self,
+            file_name: str = CITIES_FILE,
+            file_format: Optional[str] = None,
+            shard: tuple = (0, 1),
+            shard_key: str = 'name'
+    ) -> None:
+        """
+        :param file_name: file of cities
+        :param file_format: one of FILE_FORMATS, by the extension of the file by default
+        :param shard: number of the shard and number of shards
+        :param shard_key: one of SHARD_KEYS, cities of a region get into one shard by region
+        """
+        if file_format is None:
+            file_format = 'csv' if file_name.endswith('.csv') else 'jsonl'
+        if file_format not in FILE_FORMATS:
+            raise ValueError('Unknown file format {!r}, expected one of {}'.format(
+                file_format, ', '.join(FILE_FORMATS)
+            ))
+        if shard_key not in SHARD_KEYS:
+            raise ValueError('Unknown shard key {!r}, expected one of {}'.format(shard_key, ', '.join(SHARD_KEYS)))
+        shard_number, shards_count = shard
+        if not 0 <= shard_number < shards_count:
+            raise ValueError('Shard {} of {} does not exist'.format(shard_number, shards_count))
+        self._file_name = file_name
+        self._file_format = file_format
+        self._shard = shard
+        self._shard_key = shard_key
+        self._columns = None
+        self._index = None
+        self._lock = Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def _iter_lines(self) -> Iterator[tuple]:
+        """
+        :return: pairs of offset and line of every record
+        """
+        with open(self._file_name, 'rb') as file:
+            offset = 0
+            if self._file_format == 'csv':
+                header = file.readline()
+                self._columns = next(csv.reader([header.decode('utf-8')]))
+                offset = len(header)
+            for line in file:
+                if line.strip():
+                    yield offset, line
+                offset += len(line)
+
+    def _parse(self, line: bytes) -> City:
+        text = line.decode('utf-8')
+        if self._file_format == 'csv':
+            record = dict(zip(self._columns, next(csv.reader([text]))))
+        else:
+            record = json.loads(text)
+        try:
+            return City(
+                record['name'],
+                record['url'],
+                record.get('region') or '',
+                {key: value for key, value in record.items() if key not in _FIELDS and value}
+            )
+        except KeyError:
+            raise ValueError('No name or url in {!r} of {}'.format(text.strip(), self._file_name))
+
+    def _in_shard(self, city: City) -> bool:
+        shard_number, shards_count = self._shard
+        if shards_count == 1:
+            return True
+        key = city.name if self._shard_key == 'name' else city.region
+        return zlib.crc32(key.encode('utf-8')) % shards_count == shard_number
+
+    def iter_cities(self) -> Iterator[City]:
+        """
+        :return: cities of the shard in order of the file
+        """
+        for _, line in self._iter_lines():
+            if self._in_shard(city := self._parse(line)):
+                yield city
+
+    def iter_chunks(self, size: int) -> Iterator[list]:
+        """
+        :param size: max number of cities in a chunk
+        :return: lists of cities of the shard in order of the file
+        """
+        chunk = []
+        for city in self.iter_cities():
+            chunk.append(city)
+            if len(chunk) == size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+    def _get_index(self) -> dict:
+        """
+        :return: dictionary with names as keys and offsets and sizes of lines as values
+        """
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    index = {}
+                    for offset, line in self._iter_lines():
+                        if self._in_shard(city := self._parse(line)):
+                            index[city.name] = (offset, len(line))
+                    self._index = index
+        return self._index
+
+    def get_city(self, name: str) -> City:
+        """
+        :raise KeyError: for cities missing from the shard
+        """
+        offset, size = self._get_index()[name]
+        with open(self._file_name, 'rb') as file:
+            file.seek(offset)
+            return self._parse(file.read(size))
+
+    def __getitem__(self, name: str) -> str:
+        return self.get_city(name).url
+
+    def __contains__(self, name) -> bool:
+        return name in self._get_index()
+
+    def __iter__(self) -> Iterator[str]:
+        return (city.name for city in self.iter_cities())
+
+    def __len__(self) -> int:
+        return len(self._get_index())
+
+    def shard(self, shard_number: int, shards_count: int, shard_key: str = 'name') -> 'CityRegistry':
+        """
+        :return: registry of a shard of all cities of the file
+        """
+        return CityRegistry(self._file_name, self._file_format, (shard_number, shards_count), shard_key)
+
+    def get_names(self, locale: str) -> Mapping:
+        """
+        :return: mapping of names to localized names, cities without a name of the locale are missing
+        """
+        return _LocalizedNames(self, locale)
+
+    def get_translations(self, locale: str, fields: dict) -> Mapping:
+        """
+        :param fields: translations of fields of results, see utils.LOCALE_FIELDS
+        :return: translations of fields and names of cities for rendering.ResultRenderer
+        """
+        return _Translations(fields, self.get_names(locale))
+
+
+class _LocalizedNames(Mapping):
+
+    def __init__(self, registry: CityRegistry, locale: str) -> None:
+        self._registry = registry
+        self._locale = locale
+
+    def __getitem__(self, name: str) -> str:
+        return self._registry.get_city(name).names[self._locale]
+
+    def __iter__(self) -> Iterator[str]:
+        return (city.name for city in self._registry.iter_cities() if self._locale in city.names)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+class _Translations(Mapping):
+    """Translations of fields, then localized names of cities, a name is read only when it is translated."""
+
+    def __init__(self, fields: dict, names: Mapping) -> None:
+        self._fields = fields
+        self._names = names
+
+    def __getitem__(self, key: str) -> str:
+        if (translation := self._fields.get(key)) is not None:
+            return translation
+        return self._names[key]
+
+    def __iter__(self) -> Iterator[str]:
+        yield from self._fields
+        yield from (name for name in self._names if name not in self._fields)
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+
+@lru_cache(maxsize=None)
+def load_city_registry(file_name: str = CITIES_FILE) -> CityRegistry:
+    """
+    :param file_name: file of cities, see CityRegistry
+    :return: shared registry of cities of the file
+    """
+    return CityRegistry(file_name)
@@ -0,0 +1,214 @@
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from typing import Iterator, Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from result_writer import DEFAULT_MODE
+
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b'WFCOLv1\0'
+# magic and length of the JSON header
+_PREFIX = struct.Struct('<8sI')
+_ALIGNMENT = 8
+# name and item format of columns, per date columns have a value for every date of every city
+DATE_COLUMNS = (('avg_temp', 'd'), ('cond_hours', 'd'))
+CITY_COLUMNS = (('AVG.avg_temp', 'd'), ('AVG.cond_hours', 'd'), ('rating', 'q'))
+
+
+class ColumnarResultWriter:
+    """
+    Writer of results of calculations into a self-describing binary file.
+
+    The file is a JSON header with city names, dates and columns followed by
+    8-byte columns in native byte order aligned to 8 bytes: a city x date matrix for
+    every metric, NaN for missing days, and a value per city for AVG and rating.
+    Values are kept in arrays until commit, the file replaces file_name atomically.
+    """
+
+    def __init__(self, file_name: str, mode: Optional[int] = None) -> None:
+        """
+        :param file_name: file name for writing data
+        :param mode: permissions of the file, see result_writer.ResultWriter
+        """
+        self._file_name = file_name
+        self._mode = DEFAULT_MODE if mode is None else mode
+        self._cities = []
+        self._dates = {}
+        self._cells = array('q')
+        self._date_values = {name: array(typecode) for name, typecode in DATE_COLUMNS}
+        self._city_values = {name: array(typecode) for name, typecode in CITY_COLUMNS}
+
+    def write(self, city_name: str, city_data: dict) -> None:
+        """
+        :param city_name: name of the city in the file
+        :param city_data: result of calculations for a city with rating
+        """
+        city_index = len(self._cities)
+        self._cities.append(city_name)
+        for date, metrics in city_data['dates'].items():
+            date_index = self._dates.setdefault(date, len(self._dates))
+            self._cells.extend((city_index, date_index))
+            for name, values in self._date_values.items():
+                values.append(metrics[name])
+        self._city_values['AVG.avg_temp'].append(city_data['AVG']['avg_temp'])
+        self._city_values['AVG.cond_hours'].append(city_data['AVG']['cond_hours'])
+        self._city_values['rating'].append(city_data['rating'])
+
+    def _iter_columns(self) -> Iterator[tuple]:
+        cities_count = len(self._cities)
+        dates_count = len(self._dates)
+        for name, typecode in DATE_COLUMNS:
+            matrix = array(typecode, [math.nan]) * (cities_count * dates_count)
+            values = self._date_values[name]
+            for cell, value in enumerate(values):
+                city_index, date_index = self._cells[2 * cell], self._cells[2 * cell + 1]
+                matrix[city_index * dates_count + date_index] = value
+            yield name, typecode, [cities_count, dates_count], matrix
+        for name, typecode in CITY_COLUMNS:
+            yield name, typecode, [cities_count], self._city_values[name]
+
+    def commit(self) -> None:
+        """Write the file and move it to file_name."""
+        columns = list(self._iter_columns())
+        header = {
+            'byteorder': sys.byteorder,
+            'cities': self._cities,
+            'dates': list(self._dates),
+            'columns': []
+        }
+        offset = 0
+        for name, typecode, shape, values in columns:
+            header['columns'].append({'name': name, 'format': typecode, 'shape': shape, 'offset': offset})
+            offset += len(values) * values.itemsize
+        encoded_header = json.dumps(header, ensure_ascii=False).encode('utf-8')
+        # columns start at an aligned offset, so they can be cast from a memory map
+        encoded_header += b' ' * (-(_PREFIX.size + len(encoded_header)) % _ALIGNMENT)
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self._file_name)), suffix='.tmp'
+        )
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                file.write(_PREFIX.pack(MAGIC, len(encoded_header)))
+                file.write(encoded_header)
+                for _, _, _, values in columns:
+                    values.tofile(file)
+            os.chmod(temp_path, self._mode)
+            os.replace(temp_path, self._file_name)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        logger.info('Written %s cities to %s.', len(self._cities), self._file_name)
+
+
+class ColumnarResult:
+    """
+    Memory-mapped reader of a file written by ColumnarResultWriter.
+
+    Only the header is parsed on open, columns are views of the mapped
+    file and are read by the OS on access.
+    """
+
+    def __init__(self, file_name: str) -> None:
+        """
+        :param file_name: file written by ColumnarResultWriter
+        """
+        with open(file_name, 'rb') as file:
+            self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, header_size = _PREFIX.unpack_from(self._mmap)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError('{} is not a columnar result file'.format(file_name))
+        header = json.loads(self._mmap[_PREFIX.size:_PREFIX.size + header_size])
+        if header['byteorder'] != sys.byteorder:
+            self._mmap.close()
+            raise ValueError('{} is written with {}-endian byte order'.format(file_name, header['byteorder']))
+        self.cities = header['cities']
+        self.dates = header['dates']
+        self._data_offset = _PREFIX.size + header_size
+        self._columns = {column['name']: column for column in header['columns']}
+
+    def __enter__(self) -> 'ColumnarResult':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._mmap.close()
+
+    @property
+    def column_names(self) -> list:
+        return list(self._columns)
+
+    def column(self, name: str) -> memoryview:
+        """
+        :param name: name of a column, see DATE_COLUMNS and CITY_COLUMNS
+        :return: flat view of the column, matrices are city-major
+        """
+        column = self._columns[name]
+        start = self._data_offset + column['offset']
+        size = math.prod(column['shape']) * 8
+        return memoryview(self._mmap)[start:start + size].cast(column['format'])
+
+    def array(self, name: str):
+        """
+        :param name: name of a column
+        :return: NumPy array without a copy, with shape (cities, dates) for per date columns
+        """
+        if np is None:
+            raise ImportError('numpy is required for array views of columns')
+        column = self._columns[name]
+        return np.frombuffer(
+            self._mmap,
+            dtype=np.dtype(column['format']),
+            count=math.prod(column['shape']),
+            offset=self._data_offset + column['offset']
+        ).reshape(column['shape'])
+
+    def get_city(self, city_index: int) -> dict:
+        """
+        :return: result of calculations of the city with english keys, missing days are skipped
+        """
+        dates_count = len(self.dates)
+        row = slice(city_index * dates_count, (city_index + 1) * dates_count)
+        metrics = {name: self.column(name)[row].tolist() for name, _ in DATE_COLUMNS}
+        dates = {}
+        for date_index, date in enumerate(self.dates):
+            if not math.isnan(metrics['avg_temp'][date_index]):
+                dates[date] = {name: values[date_index] for name, values in metrics.items()}
+        return {
+            'city_name': self.cities[city_index],
+            'dates': dates,
+            'AVG': {
+                'avg_temp': self.column('AVG.avg_temp')[city_index],
+                'cond_hours': self.column('AVG.cond_hours')[city_index]
+            },
+            'rating': self.column('rating')[city_index]
+        }
+
+
+def read_columnar_result(file_name: str, city_name_key: str, rating_key: str) -> Iterator[dict]:
+    """
+    :param file_name: file written by ColumnarResultWriter
+    :param city_name_key: key for the city name in records
+    :param rating_key: key for the rating in records
+    :return: records with city name and rating only, as required by DataAnalyzingTask
+    """
+    with ColumnarResult(file_name) as result:
+        ratings = result.column('rating').tolist()
+        for city_name, rating in zip(result.cities, ratings):
+            yield {city_name_key: city_name, rating_key: rating}
@@ -0,0 +1,86 @@
+import os
+import sys
+from functools import lru_cache
+from threading import Lock
+from typing import Iterable
+
+from utils import get_bad_conditions_from_file
+
+
+CONDITIONS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'examples', 'conditions.txt')
+
+
+class ConditionRegistry:
+    """
+    Vocabulary of weather conditions interned into small integer codes.
+
+    Conditions get codes in order of registration, conditions missing from
+    the vocabulary are registered on first use and are not bad.
+    bad_table[code] is 1 for bad conditions and bad_mask has the bit of every bad code.
+    The registry of load_condition_registry is shared by threads, new conditions
+    are registered under a lock and a code is published after its bad_table entry.
+    """
+
+    def __init__(self, conditions: Iterable[str], bad_conditions: Iterable[str]) -> None:
+        """
+        :param conditions: known conditions
+        :param bad_conditions: conditions with precipitation
+        """
+        self.bad_conditions = frozenset(bad_conditions)
+        self._lock = Lock()
+        self.codes = {}
+        self.bad_table = bytearray()
+        self.bad_mask = 0
+        for condition in conditions:
+            self.intern(condition)
+        for condition in sorted(self.bad_conditions):
+            self.intern(condition)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def intern(self, condition: str) -> int:
+        """
+        :return: code of the condition
+        """
+        if (code := self.codes.get(condition)) is not None:
+            return code
+        with self._lock:
+            if (code := self.codes.get(condition)) is None:
+                code = len(self.codes)
+                is_bad = condition in self.bad_conditions
+                self.bad_table.append(is_bad)
+                if is_bad:
+                    self.bad_mask |= 1 << code
+                self.codes[sys.intern(condition)] = code
+        return code
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def is_bad(self, condition: str) -> bool:
+        return bool(self.bad_table[self.intern(condition)])
+
+    @classmethod
+    def from_file(cls, path_to_file: str = CONDITIONS_FILE) -> 'ConditionRegistry':
+        """
+        :param path_to_file: file with a condition and its description on every line, like examples/conditions.txt
+        """
+        with open(path_to_file, encoding='utf-8') as file:
+            conditions = [line.split()[0] for line in file if ' — ' in line]
+        return cls(conditions, get_bad_conditions_from_file(path_to_file))
+
+
+@lru_cache(maxsize=None)
+def load_condition_registry(path_to_file: str = CONDITIONS_FILE) -> ConditionRegistry:
+    """
+    :param path_to_file: file with conditions, the file is read once for every path
+    :return: shared registry of conditions of the file
+    """
+    return ConditionRegistry.from_file(path_to_file)
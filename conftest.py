@@ -1,13 +1,17 @@
+import json
 from multiprocessing import Queue
 from threading import Lock
 
 import pytest
 
+from api_client import ResponseCache
+from conditions import CONDITIONS_FILE
+from stub_server import RESPONSE_FILE, make_cities, run_stub_server
 from tasks import (DataAggregationTask,
                    DataAnalyzingTask,
                    DataCalculationTask,
                    DataFetchingTask)
-from utils import CITIES, find_file, get_bad_conditions_from_file
+from utils import CITIES, get_bad_conditions_from_file, project_forecast
 
 
 @pytest.fixture
@@ -21,9 +25,47 @@ def city_for_test():
     return {'MOSCOW': CITIES['MOSCOW']}
 
 
+@pytest.fixture(scope='session')
+def response_cache():
+    return ResponseCache()
+
+
+@pytest.fixture
+def stub_server():
+    with run_stub_server() as server:
+        yield server
+
+
+@pytest.fixture
+def stub_cities(stub_server):
+    return make_cities(stub_server.base_url, 20)
+
+
+@pytest.fixture(scope='session')
+def example_forecast():
+    with open(RESPONSE_FILE, encoding='utf-8') as file:
+        return project_forecast(json.load(file))
+
+
+@pytest.fixture
+def synthetic_cities_data(example_forecast):
+    """Projected example response for 30 cities, temperatures are shifted by city index % 5."""
+    cities_data = []
+    for index in range(30):
+        forecasts = [
+            {
+                'date': day['date'],
+                'hours': [dict(hour, temp=hour['temp'] + index % 5) for hour in day['hours']]
+            }
+            for day in example_forecast['forecasts']
+        ]
+        cities_data.append({'city_name': 'CITY{}'.format(index), 'forecasts': forecasts})
+    return cities_data
+
+
 @pytest.fixture
 def bad_conditions():
-    return get_bad_conditions_from_file(find_file('conditions.txt'))
+    return get_bad_conditions_from_file(CONDITIONS_FILE)
 
 
 @pytest.fixture
@@ -49,22 +91,26 @@ def out_file_name():
 @pytest.fixture
 def data_fetching_process_for_cities(
         cities_for_test,
-        queue
+        queue,
+        response_cache
 ):
     return DataFetchingTask(
         cities=cities_for_test,
-        queue=queue
+        queue=queue,
+        cache=response_cache
     )
 
 
 @pytest.fixture
 def city_data(
         city_for_test,
-        queue
+        queue,
+        response_cache
 ):
     data_fetch_process = DataFetchingTask(
         cities=city_for_test,
-        queue=queue
+        queue=queue,
+        cache=response_cache
     )
     data_fetch_process.start()
     data_fetch_process.join()
@@ -74,11 +120,13 @@ def city_data(
 @pytest.fixture
 def queue_with_cities(
         cities_for_test,
-        queue
+        queue,
+        response_cache
 ):
     data_fetch_process = DataFetchingTask(
         cities=cities_for_test,
-        queue=queue
+        queue=queue,
+        cache=response_cache
     )
     data_fetch_process.start()
     data_fetch_process.join()
@@ -0,0 +1,449 @@
+"""
+Long-running forecasting service with warm workers and a query endpoint.
+
+One fetching and one calculation process run for the whole life of the daemon,
+so imports, the parsed conditions, connections, the response cache and the limiter
+are kept between refreshes. Every city is refreshed once per interval at its own
+moment, its new result replaces the old one in the ranking kept in memory.
+The ranking is published as pre-encoded JSON, so a query is answered without
+any encoding, by a local HTTP server on a port or on a Unix socket:
+
+    GET /ranking            all cities with ratings in rating order
+    GET /ranking?top=N      the first N cities
+    GET /cities/<name>      one city
+    GET /health             state of the daemon
+
+Usage: python daemon.py --port 8080 --interval 600
+       python daemon.py --socket /tmp/forecast.sock
+       curl --unix-socket /tmp/forecast.sock http://localhost/ranking?top=10
+"""
+import argparse
+import heapq
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Event, Queue
+from queue import Empty, Full
+from threading import Event as ThreadEvent
+from threading import Thread
+from typing import Iterable, Mapping, NamedTuple, Optional
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from api_client import ResponseCache
+from city_registry import SHARD_KEYS, CityRegistry
+from conditions import load_condition_registry
+from forecasting import FINISH_DAY, QUEUE_CAPACITY, START_DAY
+from pipeline import POLL_INTERVAL, put, stop_process
+from ranking import CityRanking
+from tasks import RefreshCalculationTask, RefreshFetchingTask
+from utils import CITIES
+
+
+logger = logging.getLogger(__name__)
+
+# seconds between refreshes of a city
+REFRESH_INTERVAL = 10 * 60
+# seconds between publications of the ranking while results arrive
+PUBLISH_INTERVAL = 1.0
+
+
+class RefreshSchedule:
+    """
+    Moments of the next refresh of every city.
+
+    All cities are due at start. Then every city is due once per interval
+    at its own phase, given by crc32 of its name, so refreshes of many cities
+    are spread over the interval instead of coming in one burst.
+    """
+
+    def __init__(self, cities: Iterable[str], interval: float, now: float) -> None:
+        """
+        :param cities: names of cities
+        :param interval: seconds between refreshes of a city
+        :param now: current moment of a monotonic clock
+        """
+        self._interval = interval
+        self._heap = [(now, city) for city in cities]
+        heapq.heapify(self._heap)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def _get_next(self, city: str, now: float) -> float:
+        phase = zlib.crc32(city.encode('utf-8')) / 2 ** 32 * self._interval
+        return now - (now - phase) % self._interval + self._interval
+
+    def pop_due(self, now: float) -> list:
+        """
+        :return: cities due by now, they are scheduled for their next refresh
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[1])
+        for city in due:
+            heapq.heappush(self._heap, (self._get_next(city, now), city))
+        return due
+
+    def get_next_due(self) -> Optional[float]:
+        return self._heap[0][0] if self._heap else None
+
+
+class RankingSnapshot(NamedTuple):
+    # encoded results with ratings in rating order
+    cities: list
+    # encoded results by names of cities
+    index: dict
+    # encoded list of all results
+    body: bytes
+    # time.time() of the publication, None before the first one
+    published: Optional[float]
+
+
+class _Workers:
+    """Fetching and calculation processes of the daemon with their queues."""
+
+    def __init__(
+            self,
+            cities: Mapping[str, str],
+            period: tuple,
+            bad_conditions: frozenset,
+            cache: Optional[ResponseCache],
+            queue_capacity: int
+    ) -> None:
+        self.city_queue = Queue()
+        self.result_queue = Queue()
+        self._queue = Queue(maxsize=queue_capacity)
+        self._stop_event = Event()
+        self._fetch_process = RefreshFetchingTask(
+            cities, self._queue, self.city_queue, cache=cache, stop_event=self._stop_event
+        )
+        self._calculation_process = RefreshCalculationTask(
+            period[0], period[1], self._queue, self.result_queue, list(bad_conditions)
+        )
+        self._fetch_process.start()
+        self._calculation_process.start()
+
+    @property
+    def failed(self) -> bool:
+        return self._fetch_process.exitcode is not None or self._calculation_process.exitcode is not None
+
+    def stop(self) -> None:
+        """Stop the processes, the results of cities in flight are put before the sentinel."""
+        if self._calculation_process.exitcode is not None:
+            self._stop_event.set()
+        self.city_queue.put(None)
+        stop_process(self._fetch_process)
+        if self._fetch_process.exitcode != 0 and self._calculation_process.is_alive():
+            # the sentinel of the failed fetching is put for it
+            try:
+                put(self._queue, None, timeout=POLL_INTERVAL)
+            except Full:
+                pass
+        stop_process(self._calculation_process)
+
+
+class ForecastDaemon:
+    """
+    Ranking of cities kept up to date by warm worker processes.
+
+    A scheduler thread sends due cities to the fetching process, a collector thread
+    puts results of the calculation process into ranking.CityRanking and publishes
+    a RankingSnapshot at most once per publish_interval. Every result is encoded
+    once on arrival, a publication only appends ratings, so readers of snapshot
+    get a consistent ranking without locks. A city is not sent again while it is
+    in flight. Failed processes are restarted, cities in flight then wait for
+    their next refresh.
+    """
+
+    def __init__(
+            self,
+            cities: Optional[Mapping[str, str]] = None,
+            start_day: str = START_DAY,
+            finish_day: str = FINISH_DAY,
+            interval: float = REFRESH_INTERVAL,
+            publish_interval: float = PUBLISH_INTERVAL,
+            use_cache: bool = True,
+            queue_capacity: int = QUEUE_CAPACITY
+    ) -> None:
+        """
+        :param cities: mapping of cities to urls like city_registry.CityRegistry, utils.CITIES by default
+        :param start_day: first day of the period in format yyyy-mm-dd
+        :param finish_day: last day of the period in format yyyy-mm-dd
+        :param interval: seconds between refreshes of a city, see RefreshSchedule
+        :param publish_interval: seconds between publications of the ranking while results arrive
+        :param use_cache: keep responses in api_client.ResponseCache, unchanged forecasts are revalidated only
+        :param queue_capacity: max number of cities between fetching and calculation, 0 for no limit
+        """
+        self._cities = CITIES if cities is None else cities
+        self._period = (start_day, finish_day)
+        self._interval = interval
+        self._publish_interval = publish_interval
+        self._cache = ResponseCache() if use_cache else None
+        self._queue_capacity = queue_capacity
+        # conditions are parsed once for all processes and their restarts
+        self._bad_conditions = load_condition_registry().bad_conditions
+        self._ranking = CityRanking()
+        self._encoded = {}
+        # moments of sending of cities without results yet
+        self._in_flight = {}
+        self._workers = None
+        self._scheduler = Thread(target=self._schedule, name='refresh-scheduler', daemon=True)
+        self._collector = Thread(target=self._collect, name='result-collector', daemon=True)
+        self._scheduling_stopped = ThreadEvent()
+        self._collecting_stopped = ThreadEvent()
+        self.snapshot = RankingSnapshot([], {}, b'[]', None)
+        self.refreshes = 0
+        self.updates = 0
+        self.restarts = 0
+
+    def __enter__(self) -> 'ForecastDaemon':
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _start_workers(self) -> None:
+        self._workers = _Workers(
+            self._cities, self._period, self._bad_conditions, self._cache, self._queue_capacity
+        )
+
+    def start(self) -> None:
+        logger.info('Start forecast daemon.')
+        self._start_workers()
+        self._scheduler.start()
+        self._collector.start()
+
+    def stop(self) -> None:
+        """Stop scheduling, then the processes, results of cities in flight are collected."""
+        self._scheduling_stopped.set()
+        self._scheduler.join()
+        self._workers.stop()
+        self._collecting_stopped.set()
+        self._collector.join()
+        logger.info('Forecast daemon is stopped.')
+
+    def _restart_workers(self) -> None:
+        logger.error('Worker processes of the daemon failed, they are restarted.')
+        self._workers.stop()
+        self._in_flight.clear()
+        self._start_workers()
+        self.restarts += 1
+
+    def _schedule(self) -> None:
+        schedule = RefreshSchedule(self._cities, self._interval, time.monotonic())
+        logger.info('%s cities are refreshed every %s seconds.', len(schedule), self._interval)
+        while not self._scheduling_stopped.is_set():
+            if self._workers.failed:
+                self._restart_workers()
+            now = time.monotonic()
+            for city in schedule.pop_due(now):
+                # a city waiting behind a backlog is not queued twice, a lost one is sent again after interval
+                if (sent := self._in_flight.get(city)) is not None and now - sent < self._interval:
+                    continue
+                self._in_flight[city] = now
+                self._workers.city_queue.put(city)
+                self.refreshes += 1
+            wait = schedule.get_next_due() - time.monotonic() if len(schedule) else POLL_INTERVAL
+            self._scheduling_stopped.wait(min(max(wait, 0), POLL_INTERVAL))
+
+    def _update(self, city_data: dict) -> None:
+        self._in_flight.pop(city_data['city_name'], None)
+        self._ranking.add(city_data)
+        result = {key: value for key, value in city_data.items() if key != 'total_score'}
+        # the closing brace is replaced with the rating by _publish
+        self._encoded[city_data['city_name']] = json.dumps(
+            result, ensure_ascii=False, separators=(',', ':')
+        ).encode('utf-8')[:-1]
+        self.updates += 1
+
+    def _publish(self) -> None:
+        cities = []
+        index = {}
+        for rating, city_data in self._ranking.iter_rated():
+            encoded = b'%s,"rating":%d}' % (self._encoded[city_data['city_name']], rating)
+            cities.append(encoded)
+            index[city_data['city_name']] = encoded
+        self.snapshot = RankingSnapshot(cities, index, b'[' + b','.join(cities) + b']', time.time())
+
+    def _collect(self) -> None:
+        published = 0.0
+        changed = False
+        while not self._collecting_stopped.is_set():
+            try:
+                city_data = self._workers.result_queue.get(timeout=POLL_INTERVAL)
+            except Empty:
+                city_data = None
+            if city_data is not None:
+                self._update(city_data)
+                changed = True
+            if changed and time.monotonic() - published >= self._publish_interval:
+                self._publish()
+                published = time.monotonic()
+                changed = False
+        if changed:
+            self._publish()
+
+    def get_status(self) -> dict:
+        published = self.snapshot.published
+        return {
+            'cities': len(self._encoded),
+            'ranked': len(self.snapshot.cities),
+            'published_seconds_ago': None if published is None else round(time.time() - published, 3),
+            'refreshes': self.refreshes,
+            'updates': self.updates,
+            'restarts': self.restarts,
+        }
+
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Handler answering queries with bodies of the current snapshot of the daemon."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def setup(self):
+        # headers and body are written separately, Nagle would delay every keep-alive response
+        self.disable_nagle_algorithm = self.server.address_family != socket.AF_UNIX
+        super().setup()
+
+    def _send(self, status: int, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: int, message: str) -> None:
+        self._send(status, json.dumps({'error': message}).encode('utf-8'))
+
+    def _answer_ranking(self, snapshot: RankingSnapshot, query: str) -> None:
+        top = parse_qs(query).get('top')
+        if top is None:
+            self._send(200, snapshot.body)
+            return
+        try:
+            count = int(top[0])
+        except ValueError:
+            self._send_error(400, 'top is not a number')
+            return
+        self._send(200, b'[' + b','.join(snapshot.cities[:max(count, 0)]) + b']')
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        snapshot = self.server.forecast_daemon.snapshot
+        if url.path == '/health':
+            self._send(200, json.dumps(self.server.forecast_daemon.get_status()).encode('utf-8'))
+        elif url.path != '/ranking' and not url.path.startswith('/cities/'):
+            self._send_error(404, 'unknown path')
+        elif snapshot.published is None:
+            self._send_error(503, 'no ranking yet')
+        elif url.path == '/ranking':
+            self._answer_ranking(snapshot, url.query)
+        elif (body := snapshot.index.get(unquote(url.path[len('/cities/'):]))) is not None:
+            self._send(200, body)
+        else:
+            self._send_error(404, 'unknown city')
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class QueryServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: tuple, forecast_daemon: ForecastDaemon) -> None:
+        """
+        :param address: (host, port) to listen on, port 0 for a free one
+        :param forecast_daemon: daemon with the ranking
+        """
+        super().__init__(address, QueryHandler)
+        self.forecast_daemon = forecast_daemon
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+
+class UnixQueryServer(QueryServer):
+    """Query server on a Unix socket, a socket file left by a killed daemon is replaced."""
+
+    address_family = socket.AF_UNIX
+
+    def __init__(self, path: str, forecast_daemon: ForecastDaemon) -> None:
+        """
+        :param path: file name of the socket
+        :param forecast_daemon: daemon with the ranking
+        """
+        super().__init__(path, forecast_daemon)
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        # HTTPServer.server_bind resolves a host name, a socket has none
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # handlers expect an address of a host and a port
+        return request, ('localhost', 0)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+
+
+def make_query_server(
+        forecast_daemon: ForecastDaemon,
+        host: str = '127.0.0.1',
+        port: int = 8080,
+        socket_path: Optional[str] = None
+) -> QueryServer:
+    """
+    :param socket_path: file name of a Unix socket, host and port are not used then
+    """
+    if socket_path is not None:
+        return UnixQueryServer(socket_path, forecast_daemon)
+    return QueryServer((host, port), forecast_daemon)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rating of cities for a vacation as a service')
+    parser.add_argument('--cities-file', help='CSV or JSON Lines file of cities, see city_registry.CityRegistry')
+    parser.add_argument('--shard', type=int, nargs=2, metavar=('NUMBER', 'COUNT'), default=(0, 1))
+    parser.add_argument('--shard-key', choices=SHARD_KEYS, default='name')
+    parser.add_argument('--start-day', default=START_DAY)
+    parser.add_argument('--finish-day', default=FINISH_DAY)
+    parser.add_argument('--interval', type=float, default=REFRESH_INTERVAL, help='seconds between refreshes of a city')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--socket', help='serve on this Unix socket instead of a port')
+    parser.add_argument('--no-cache', action='store_true', help='do not keep responses on disk')
+    args = parser.parse_args()
+    registry = CityRegistry(args.cities_file) if args.cities_file else CITIES
+    if args.shard[1] > 1:
+        registry = registry.shard(*args.shard, args.shard_key)
+    forecast_daemon = ForecastDaemon(
+        registry, args.start_day, args.finish_day, args.interval, use_cache=not args.no_cache
+    )
+    query_server = make_query_server(forecast_daemon, args.host, args.port, args.socket)
+    # SIGTERM of a service manager stops the daemon like Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    forecast_daemon.start()
+    logger.info('Serving queries on %s.', args.socket or query_server.base_url)
+    try:
+        query_server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        query_server.server_close()
+        forecast_daemon.stop()
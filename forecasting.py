@@ -1,12 +1,25 @@
+import argparse
 import logging
-from multiprocessing import Queue
+import os
+from multiprocessing import Event, Queue
+from queue import SimpleQueue
 from threading import Lock
+from typing import Iterable, Mapping, Optional, Union
 
+from api_client import ResponseCache
+from city_registry import SHARD_KEYS, CityRegistry
+from conditions import load_condition_registry
+from metrics import Metrics
+from pipeline import StageFailed, run_stages
+from profiles import ScoringPlan, get_weekends, make_window_profiles
+from result_store import CityResultStore
+from shared_result import SharedResults
 from tasks import (DataAggregationTask,
                    DataAnalyzingTask,
+                   DataCalculationPool,
                    DataCalculationTask,
                    DataFetchingTask)
-from utils import CITIES, find_file, get_bad_conditions_from_file
+from utils import CITIES, PROJECTED_HOUR_FIELDS
 
 
 logging.basicConfig(
@@ -19,55 +32,237 @@ logging.basicConfig(
 
 logger = logging.getLogger(__name__)
 
-BAD_CONDITIONS = get_bad_conditions_from_file(find_file('conditions.txt'))
+BAD_CONDITIONS = load_condition_registry().bad_conditions
+# cities fetched ahead of calculation, fetching waits while the queue is full
+QUEUE_CAPACITY = 100
+START_DAY = '2022-05-26'
+FINISH_DAY = '2022-05-29'
 
 
-def forecast_weather():
+def _calculate(
+        cities: Mapping[str, str],
+        period: tuple,
+        profiles: Optional[list],
+        cache: Optional[ResponseCache],
+        result_store: Optional[CityResultStore],
+        shared_results: Optional[SharedResults],
+        queue_capacity: int,
+        workers: int,
+        metrics: Metrics
+) -> Optional[Union[list, dict, SharedResults]]:
     """
-    Анализ погодных условий по городам
+    :param period: first and last days
+    :param workers: number of calculation processes, tasks.DataCalculationPool runs more than one
+    :return: results of calculations, a dictionary with results of every profile
+        or shared_results with received results, None if the processes failed
     """
-
-    queue = Queue()
+    queue = Queue(maxsize=queue_capacity)
     result_queue = Queue()
-    data_fetch_process = DataFetchingTask(cities=CITIES, queue=queue)
-    data_calculation_process = DataCalculationTask(
-        start_day='2022-05-26',
-        finish_day='2022-05-29',
+    stop_event = Event()
+    data_fetch_process = DataFetchingTask(
+        cities=cities,
         queue=queue,
-        result_queue=result_queue,
-        bad_conditions=BAD_CONDITIONS
+        cache=cache,
+        hour_fields=ScoringPlan(profiles).hour_fields if profiles else PROJECTED_HOUR_FIELDS,
+        stop_event=stop_event,
+        metrics=metrics
     )
+    if workers > 1:
+        data_calculation_process = DataCalculationPool(
+            start_day=period[0],
+            finish_day=period[1],
+            queue=queue,
+            result_queue=result_queue,
+            bad_conditions=BAD_CONDITIONS,
+            workers_count=workers,
+            profiles=profiles,
+            metrics=metrics
+        )
+    else:
+        data_calculation_process = DataCalculationTask(
+            start_day=period[0],
+            finish_day=period[1],
+            queue=queue,
+            result_queue=result_queue,
+            bad_conditions=BAD_CONDITIONS,
+            profiles=profiles,
+            result_store=result_store,
+            shared_results=shared_results,
+            metrics=metrics
+        )
     try:
-        data_fetch_process.start()
-        data_calculation_process.start()
-        data_fetch_process.join()
-        data_calculation_process.join()
+        # messages of progress are read while the process runs, it can not exit with them unread
+        results = run_stages(
+            data_fetch_process, data_calculation_process, queue, result_queue, stop_event,
+            receive=shared_results.collect if shared_results is not None else None
+        )
+        return results if shared_results is None else shared_results
+    except StageFailed:
+        logger.error('Data calculation process exited with code %s.', data_calculation_process.exitcode)
     except Exception:
         logger.exception('forecast_weather func - Processes start')
+    finally:
+        metrics.collect()
+    return None
 
-    results_of_calculations = result_queue.get()
-    if not results_of_calculations:
-        logger.info('No data for the given time interval.')
-    else:
-        lock = Lock()
-        out_file_name = 'result.json'
 
-        data_aggregation_thread = DataAggregationTask(
-            lock=lock,
-            file_name=out_file_name,
-            results_of_calculations=results_of_calculations
-        )
-        data_analyzing_thread = DataAnalyzingTask(
-            lock=lock,
-            file_name=out_file_name
-        )
+def _postprocess(
+        results_of_calculations: list,
+        out_file_name: str,
+        city_registry: Optional[CityRegistry],
+        file_mode: Optional[int],
+        metrics: Metrics
+) -> None:
+    lock = Lock()
+    aggregation_queue = SimpleQueue()
+
+    data_aggregation_thread = DataAggregationTask(
+        lock=lock,
+        file_name=out_file_name,
+        results_of_calculations=results_of_calculations,
+        aggregation_queue=aggregation_queue,
+        city_registry=city_registry,
+        file_mode=file_mode,
+        metrics=metrics
+    )
+    data_analyzing_thread = DataAnalyzingTask(
+        lock=lock,
+        file_name=out_file_name,
+        aggregation_queue=aggregation_queue,
+        metrics=metrics
+    )
+    started = []
+    try:
+        for thread in (data_aggregation_thread, data_analyzing_thread):
+            thread.start()
+            started.append(thread)
+    except Exception:
+        logger.exception('forecast_weather func - Running threads')
+    # every started thread is joined, a failed analysis does not leave the commit of the file unawaited
+    failed = len(started) < 2
+    for thread in started:
         try:
-            data_aggregation_thread.start()
-            data_analyzing_thread.start()
-        except Exception:
-            logger.exception('forecast_weather func - Running threads with lock')
+            thread.join()
+        except Exception as error:
+            logger.error('%s failed: %r.', type(thread).__name__, error)
+            failed = True
+    if not failed:
         logger.info('Success!')
 
 
+def _get_profile_file_name(out_file_name: str, name: str) -> str:
+    root, extension = os.path.splitext(out_file_name)
+    return '{}.{}{}'.format(root, name, extension)
+
+
+def forecast_weather(
+        cities: Optional[Mapping[str, str]] = None,
+        out_file_name: str = 'result.json',
+        start_day: str = START_DAY,
+        finish_day: str = FINISH_DAY,
+        profiles: Optional[list] = None,
+        use_cache: bool = True,
+        use_result_store: bool = True,
+        use_shared_memory: bool = False,
+        file_mode: Optional[int] = None,
+        queue_capacity: int = QUEUE_CAPACITY,
+        workers: int = 1,
+        metrics_file: Optional[str] = None,
+        metrics_format: str = 'json',
+        profile_stages: Iterable[str] = (),
+        trace_memory_stages: Iterable[str] = ()
+):
+    """
+    Анализ погодных условий по городам
+
+    :param cities: mapping of cities to urls like city_registry.CityRegistry, utils.CITIES by default
+    :param out_file_name: file name for results
+    :param start_day: first day of the period in format yyyy-mm-dd
+    :param finish_day: last day of the period in format yyyy-mm-dd
+    :param profiles: scoring profiles, like ones of profiles.make_window_profiles for many date and hour windows,
+        a ranking of every profile is written to out_file_name with the name of the profile before the extension
+    :param use_cache: keep responses in api_client.ResponseCache
+    :param use_result_store: keep results of cities in result_store.CityResultStore,
+        only cities with changed forecasts are calculated then
+    :param use_shared_memory: get results through shared_result.SharedResults instead of a pickled list,
+        without profiles only, /dev/shm has to hold about 100 bytes per city
+    :param file_mode: permissions of files of results, like files made by open by default,
+        see result_writer.ResultWriter
+    :param queue_capacity: max number of cities between fetching and calculation, 0 for no limit
+    :param workers: number of calculation processes, more than one runs tasks.DataCalculationPool,
+        the result store is not used then
+    :param metrics_file: file name for the report of measurements of stages, not written by default
+    :param metrics_format: format of the report, see metrics.REPORT_FORMATS
+    :param profile_stages: stages run under cProfile: fetch, calculation, aggregation, analysis
+    :param trace_memory_stages: stages run under tracemalloc
+    """
+    if workers > 1 and use_shared_memory:
+        raise ValueError('Shared memory is supported by one calculation process only')
+    metrics = Metrics(Queue(), profile_stages, trace_memory_stages)
+    cache = ResponseCache() if use_cache else None
+    # workers of the pool would save the same store
+    result_store = CityResultStore() if use_result_store and workers == 1 else None
+    shared_results = SharedResults() if use_shared_memory else None
+    results_of_calculations = _calculate(
+        CITIES if cities is None else cities, (start_day, finish_day), profiles,
+        cache, result_store, shared_results, queue_capacity, workers, metrics
+    )
+    city_registry = cities if isinstance(cities, CityRegistry) else None
+    try:
+        _write_results(results_of_calculations, out_file_name, profiles, city_registry, file_mode, metrics)
+    finally:
+        if shared_results is not None:
+            shared_results.close()
+    logger.info('Measurements: %s.', metrics.get_summary())
+    if metrics_file is not None:
+        metrics.write_report(metrics_file, metrics_format)
+
+
+def _write_results(
+        results_of_calculations: Optional[Union[list, dict, SharedResults]],
+        out_file_name: str,
+        profiles: Optional[list],
+        city_registry: Optional[CityRegistry],
+        file_mode: Optional[int],
+        metrics: Metrics
+) -> None:
+    if profiles and results_of_calculations:
+        # one pass of fetching and calculation ranks cities for every profile
+        for name, results in results_of_calculations.items():
+            if results:
+                _postprocess(
+                    results, _get_profile_file_name(out_file_name, name), city_registry, file_mode, metrics
+                )
+            else:
+                logger.info('No data for the given time interval of %s.', name)
+    elif results_of_calculations:
+        _postprocess(results_of_calculations, out_file_name, city_registry, file_mode, metrics)
+    elif results_of_calculations is not None:
+        logger.info('No data for the given time interval.')
+
+
 if __name__ == "__main__":
-    forecast_weather()
+    parser = argparse.ArgumentParser(description='Rating of cities for a vacation')
+    parser.add_argument('--cities-file', help='CSV or JSON Lines file of cities, see city_registry.CityRegistry')
+    parser.add_argument(
+        '--shard', type=int, nargs=2, metavar=('NUMBER', 'COUNT'), default=(0, 1),
+        help='forecast only a shard of cities, like one of several machines'
+    )
+    parser.add_argument('--shard-key', choices=SHARD_KEYS, default='name')
+    parser.add_argument('--out', default='result.json')
+    parser.add_argument('--start-day', default=START_DAY)
+    parser.add_argument('--finish-day', default=FINISH_DAY)
+    parser.add_argument(
+        '--weekends', type=int, default=0,
+        help='rank cities for every one of this number of weekends from the start day in one run'
+    )
+    parser.add_argument(
+        '--workers', type=int, default=1,
+        help='number of calculation processes, results of cities are not stored between runs with several'
+    )
+    args = parser.parse_args()
+    registry = CityRegistry(args.cities_file) if args.cities_file else CITIES
+    if args.shard[1] > 1:
+        registry = registry.shard(*args.shard, args.shard_key)
+    weekend_profiles = make_window_profiles(get_weekends(args.start_day, args.weekends)) if args.weekends else None
+    forecast_weather(registry, args.out, args.start_day, args.finish_day, weekend_profiles, workers=args.workers)
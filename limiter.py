@@ -0,0 +1,160 @@
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from threading import Condition
+from typing import AsyncIterator, Iterator, Optional
+
+from resilience import is_retryable
+
+
+class AIMDController:
+    """
+    Limit of requests in flight adjusted like a TCP congestion window.
+
+    Every response within latency_tolerance times the recent minimum latency
+    adds 1 / limit to the limit, so the limit grows by one per limit responses.
+    A slower response multiplies the limit by latency_backoff, a timeout,
+    a network error or an overloaded host multiplies it by error_backoff.
+    Requests sent before the last decrease do not decrease the limit again,
+    so a burst of failures halves it once. The limit stays between min_limit and max_limit.
+    """
+
+    def __init__(
+            self,
+            initial_limit: int = 5,
+            min_limit: int = 1,
+            max_limit: int = 50,
+            latency_tolerance: float = 2.0,
+            latency_backoff: float = 0.9,
+            error_backoff: float = 0.5,
+            window: int = 100
+    ) -> None:
+        """
+        :param initial_limit: limit before the first response
+        :param min_limit: floor of the limit
+        :param max_limit: ceiling of the limit
+        :param latency_tolerance: ratio to the minimal latency treated as a queue on the host
+        :param latency_backoff: factor of the limit after a slow response
+        :param error_backoff: factor of the limit after a failed response
+        :param window: number of recent latencies for the minimal latency
+        """
+        if not 1 <= min_limit <= initial_limit <= max_limit:
+            raise ValueError('Limits must be 1 <= min_limit <= initial_limit <= max_limit')
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self._limit = float(initial_limit)
+        self._latency_tolerance = latency_tolerance
+        self._latency_backoff = latency_backoff
+        self._error_backoff = error_backoff
+        self._latencies = deque(maxlen=window)
+        self._decreased_at = 0.0
+        self.in_flight = 0
+        self.queue_depth = 0
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    def _decrease(self, started: float, backoff: float) -> None:
+        if started < self._decreased_at:
+            return
+        self._limit = max(self.min_limit, self._limit * backoff)
+        self._decreased_at = time.monotonic()
+
+    def _on_done(self, started: float, error: Optional[BaseException]) -> None:
+        self.in_flight -= 1
+        if error is not None:
+            if is_retryable(error):
+                self._decrease(started, self._error_backoff)
+            return
+        latency = time.monotonic() - started
+        self._latencies.append(latency)
+        if latency > min(self._latencies) * self._latency_tolerance:
+            self._decrease(started, self._latency_backoff)
+        else:
+            self._limit = min(self.max_limit, self._limit + 1 / self._limit)
+
+    def stats(self) -> dict:
+        """
+        :return: current limit, requests in flight and requests waiting for the limit
+        """
+        return {'limit': self.limit, 'in_flight': self.in_flight, 'queue_depth': self.queue_depth}
+
+
+class AdaptiveLimiter(AIMDController):
+    """
+    AIMD limit of requests for threads, see AIMDController.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._condition = Condition()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_condition']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._condition = Condition()
+
+    @contextmanager
+    def request(self) -> Iterator[None]:
+        """Wait for the limit, the outcome of the block adjusts the limit."""
+        with self._condition:
+            self.queue_depth += 1
+            self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.queue_depth -= 1
+            self.in_flight += 1
+        started = time.monotonic()
+        error = None
+        try:
+            yield
+        except BaseException as request_error:
+            error = request_error
+            raise
+        finally:
+            with self._condition:
+                self._on_done(started, error)
+                self._condition.notify_all()
+
+
+class AsyncAdaptiveLimiter(AIMDController):
+    """
+    AIMD limit of requests for coroutines of one event loop, see AIMDController.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._condition = None
+
+    def _get_condition(self) -> asyncio.Condition:
+        # created lazily so that the condition is bound to the running loop
+        if self._condition is None:
+            self._condition = asyncio.Condition()
+        return self._condition
+
+    @asynccontextmanager
+    async def request(self) -> AsyncIterator[None]:
+        """Wait for the limit, the outcome of the block adjusts the limit."""
+        condition = self._get_condition()
+        async with condition:
+            self.queue_depth += 1
+            try:
+                await condition.wait_for(lambda: self.in_flight < self.limit)
+            finally:
+                self.queue_depth -= 1
+            self.in_flight += 1
+        started = time.monotonic()
+        error = None
+        try:
+            yield
+        except BaseException as request_error:
+            error = request_error
+            raise
+        finally:
+            self._on_done(started, error)
+            async with condition:
+                condition.notify_all()
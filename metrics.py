@@ -0,0 +1,364 @@
+import cProfile
+import io
+import json
+import logging
+import os
+import pstats
+import time
+import tracemalloc
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from queue import Empty
+from threading import Lock
+from typing import Iterable, Iterator, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# upper bounds of buckets in seconds, from half a millisecond to ten seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+REPORT_FORMATS = ('json', 'prometheus')
+PROMETHEUS_PREFIX = 'weather_'
+PROFILE_LINES = 25
+
+
+class Histogram:
+    """
+    Distribution of observed values in buckets with inclusive upper bounds, like a Prometheus histogram.
+    """
+
+    def __init__(self, buckets: Iterable[float] = DEFAULT_BUCKETS) -> None:
+        """
+        :param buckets: sorted upper bounds of buckets, values over the last one get into +Inf bucket
+        """
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other: 'Histogram') -> None:
+        if other.buckets != self.buckets:
+            raise ValueError('Histograms with different buckets can not be merged')
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.count += other.count
+        self.sum += other.sum
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def get_quantile(self, quantile: float) -> Optional[float]:
+        """
+        :param quantile: quantile from 0 to 1
+        :return: upper bound of the bucket with the quantile, the max value for +Inf bucket, None without values
+        """
+        if not self.count:
+            return None
+        rank = quantile * self.count
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            if total >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.get_quantile(0.5),
+            'p95': self.get_quantile(0.95),
+            'p99': self.get_quantile(0.99),
+            'buckets': dict(zip(map(str, self.buckets + ('+Inf',)), self.counts)),
+        }
+
+
+class _Timer:
+    """Context manager of Metrics.timer, a class is several times cheaper than contextmanager per city."""
+
+    __slots__ = ('_histogram', '_lock', '_started')
+
+    def __init__(self, histogram: Histogram, lock: Lock) -> None:
+        self._histogram = histogram
+        self._lock = lock
+
+    def __enter__(self) -> None:
+        self._started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        elapsed = time.perf_counter() - self._started
+        with self._lock:
+            self._histogram.observe(elapsed)
+
+
+_NULL_TIMER = nullcontext()
+
+
+def _format_labels(labels: tuple, extra: tuple = ()) -> str:
+    pairs = labels + extra
+    if not pairs:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, value) for key, value in pairs) + '}'
+
+
+class Metrics:
+    """
+    Timers, histograms and gauges of pipeline stages with optional profiling.
+
+    Measurements are keyed by a name and labels. Disabled metrics are no-ops
+    costing a method call, tasks use them by default. A stage run in a child process
+    starts with no measurements, the ones of the parent are copied with the
+    process, and puts its measurements into the queue at the end, see stage.
+    The parent merges them by collect.
+    """
+
+    def __init__(
+            self,
+            queue=None,
+            profile_stages: Iterable[str] = (),
+            trace_memory_stages: Iterable[str] = (),
+            buckets: Iterable[float] = DEFAULT_BUCKETS,
+            enabled: bool = True
+    ) -> None:
+        """
+        :param queue: multiprocessing queue for measurements of child processes, they are lost without it
+        :param profile_stages: stages run under cProfile, only the thread running the stage is profiled
+        :param trace_memory_stages: stages run under tracemalloc, stages running at once share the tracing
+        :param buckets: upper bounds of buckets of histograms in seconds
+        :param enabled: False for metrics measuring nothing
+        """
+        self.enabled = enabled
+        self._queue = queue
+        self._pid = os.getpid()
+        self.profile_stages = frozenset(profile_stages)
+        self.trace_memory_stages = frozenset(trace_memory_stages)
+        self._buckets = tuple(buckets)
+        self.histograms = {}
+        self.gauges = {}
+        self.profiles = {}
+        self._lock = Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    def _get_histogram(self, name: str, labels: dict) -> Histogram:
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+        if (histogram := self.histograms.get(key)) is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(key, Histogram(self._buckets))
+        return histogram
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        if not self.enabled:
+            return
+        histogram = self._get_histogram(name, labels)
+        with self._lock:
+            histogram.observe(value)
+
+    def timer(self, name: str, **labels):
+        """
+        :return: context manager observing seconds spent in the block, failed blocks included
+        """
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self._get_histogram(name, labels), self._lock)
+
+    def gauge(self, name: str, value: float, **labels) -> None:
+        """Set the current value, the max value is kept too."""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            gauge = self.gauges.setdefault(key, {'value': value, 'max': value})
+            gauge['value'] = value
+            gauge['max'] = max(gauge['max'], value)
+
+    def gauge_queue_depth(self, name: str, queue) -> None:
+        """Set the gauge to the size of the queue, skipped where qsize is not implemented like on macOS."""
+        if not self.enabled:
+            return
+        try:
+            self.gauge(name, queue.qsize())
+        except NotImplementedError:
+            pass
+
+    def _clear(self) -> None:
+        with self._lock:
+            self.histograms = {}
+            self.gauges = {}
+            self.profiles = {}
+
+    def _get_stage_profile(self, profiler: Optional[cProfile.Profile], tracing: bool) -> dict:
+        profile = {}
+        if profiler is not None:
+            stream = io.StringIO()
+            pstats.Stats(profiler, stream=stream).sort_stats('cumulative').print_stats(PROFILE_LINES)
+            profile['cprofile'] = stream.getvalue()
+        if tracing:
+            profile['tracemalloc_peak'] = tracemalloc.get_traced_memory()[1]
+            statistics = tracemalloc.take_snapshot().statistics('lineno')[:PROFILE_LINES]
+            profile['tracemalloc_top'] = [str(statistic) for statistic in statistics]
+            tracemalloc.stop()
+        return profile
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Time the block as stage_seconds of the stage and profile it if it is requested for the stage.
+        """
+        in_child = os.getpid() != self._pid
+        if in_child:
+            self._clear()
+        profiler = None
+        if name in self.profile_stages:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        tracing = name in self.trace_memory_stages and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        try:
+            with self.timer('stage_seconds', stage=name):
+                yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            if profiler is not None or tracing:
+                self.profiles[name] = self._get_stage_profile(profiler, tracing)
+            if in_child:
+                self.send()
+
+    def send(self) -> None:
+        """Put measurements into the queue for the parent process."""
+        if self._queue is not None:
+            with self._lock:
+                self._queue.put((self.histograms, self.gauges, self.profiles))
+
+    def merge(self, histograms: dict, gauges: dict, profiles: dict) -> None:
+        with self._lock:
+            for key, histogram in histograms.items():
+                if key in self.histograms:
+                    self.histograms[key].merge(histogram)
+                else:
+                    self.histograms[key] = histogram
+            for key, gauge in gauges.items():
+                if key in self.gauges:
+                    self.gauges[key] = {'value': gauge['value'], 'max': max(self.gauges[key]['max'], gauge['max'])}
+                else:
+                    self.gauges[key] = gauge
+            self.profiles.update(profiles)
+
+    def collect(self, timeout: float = 0.1) -> int:
+        """
+        Merge measurements sent by child processes, call it after they exited.
+
+        :param timeout: seconds to wait for the next measurements
+        :return: number of merged measurements
+        """
+        count = 0
+        if self._queue is None:
+            return count
+        while True:
+            try:
+                self.merge(*self._queue.get(timeout=timeout))
+            except Empty:
+                return count
+            count += 1
+
+    def to_dict(self) -> dict:
+        """
+        :return: JSON report with histograms, gauges and profiles of stages
+        """
+        with self._lock:
+            return {
+                'histograms': [
+                    {'name': name, 'labels': dict(labels), **histogram.to_dict()}
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                ],
+                'gauges': [
+                    {'name': name, 'labels': dict(labels), **gauge}
+                    for (name, labels), gauge in sorted(self.gauges.items())
+                ],
+                'profiles': dict(self.profiles),
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        :return: measurements in Prometheus text format, cProfile statistics are not included
+        """
+        lines = []
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+            gauges = sorted(self.gauges.items())
+            profiles = sorted(self.profiles.items())
+        typed = set()
+        for (name, labels), histogram in histograms:
+            name = PROMETHEUS_PREFIX + name
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} histogram'.format(name))
+            total = 0
+            for bound, count in zip(histogram.buckets + ('+Inf',), histogram.counts):
+                total += count
+                lines.append('{}_bucket{} {}'.format(name, _format_labels(labels, (('le', bound),)), total))
+            lines.append('{}_sum{} {}'.format(name, _format_labels(labels), histogram.sum))
+            lines.append('{}_count{} {}'.format(name, _format_labels(labels), histogram.count))
+        for (name, labels), gauge in gauges:
+            for suffix in ('', '_max'):
+                gauge_name = PROMETHEUS_PREFIX + name + suffix
+                if gauge_name not in typed:
+                    typed.add(gauge_name)
+                    lines.append('# TYPE {} gauge'.format(gauge_name))
+                lines.append('{}{} {}'.format(gauge_name, _format_labels(labels), gauge[suffix[1:] or 'value']))
+        peaks = [(stage, profile['tracemalloc_peak']) for stage, profile in profiles if 'tracemalloc_peak' in profile]
+        if peaks:
+            lines.append('# TYPE {}stage_memory_peak_bytes gauge'.format(PROMETHEUS_PREFIX))
+            for stage, peak in peaks:
+                lines.append('{}stage_memory_peak_bytes{} {}'.format(
+                    PROMETHEUS_PREFIX, _format_labels((('stage', stage),)), peak
+                ))
+        return '\n'.join(lines) + '\n'
+
+    def write_report(self, file_name: str, report_format: str = 'json') -> None:
+        """
+        :param file_name: file name for the report
+        :param report_format: one of REPORT_FORMATS
+        """
+        if report_format not in REPORT_FORMATS:
+            raise ValueError('Unknown report format {}'.format(report_format))
+        with open(file_name, 'w', encoding='utf-8') as file:
+            if report_format == 'json':
+                json.dump(self.to_dict(), file, indent=2)
+            else:
+                file.write(self.to_prometheus())
+
+    def get_summary(self) -> str:
+        """
+        :return: one line with count, p50 and p95 of every histogram for the log
+        """
+        with self._lock:
+            histograms = sorted(self.histograms.items())
+        return '; '.join(
+            '{}{} n={} p50={:.4f}s p95={:.4f}s'.format(
+                name, _format_labels(labels), histogram.count,
+                histogram.get_quantile(0.5), histogram.get_quantile(0.95)
+            )
+            for (name, labels), histogram in histograms
+        )
@@ -0,0 +1,167 @@
+import logging
+import time
+from multiprocessing import Process
+from queue import Empty, Full
+from threading import Event, Thread
+from typing import Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+POLL_INTERVAL = 0.5
+
+
+class StageStopped(Exception):
+    """The next stage is gone, the data has no consumer."""
+
+
+class StageFailed(Exception):
+    """The previous stage is gone without its data."""
+
+
+def put(queue, item, stop_event=None, timeout: Optional[float] = None) -> None:
+    """
+    Put into a bounded queue, waiting while it is full.
+
+    :param queue: queue of the next stage
+    :param item: data for the next stage
+    :param stop_event: event set when the next stage is gone, StageStopped is raised then
+    :param timeout: seconds to wait for a free place, queue.Full is raised then, no limit by default
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        if stop_event is not None and stop_event.is_set():
+            raise StageStopped('Consumer of the queue is stopped')
+        wait = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, deadline - time.monotonic())
+        try:
+            queue.put(item, timeout=max(wait, 0))
+            return
+        except Full:
+            if deadline is not None and time.monotonic() >= deadline:
+                raise
+
+
+def get(queue, is_alive: Optional[Callable[[], bool]] = None, timeout: Optional[float] = None):
+    """
+    Get from a queue, waiting while it is empty.
+
+    :param queue: queue of the previous stage
+    :param is_alive: check of the previous stage, StageFailed is raised when it is gone with the queue empty
+    :param timeout: seconds to wait for data, queue.Empty is raised then, no limit by default
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    while True:
+        # the producer is checked before the last get, the data put before its exit is not lost
+        alive = is_alive is None or is_alive()
+        wait = POLL_INTERVAL if deadline is None else min(POLL_INTERVAL, deadline - time.monotonic())
+        try:
+            return queue.get(timeout=max(wait, 0))
+        except Empty:
+            if not alive:
+                raise StageFailed('Producer of the queue is gone')
+            if deadline is not None and time.monotonic() >= deadline:
+                raise
+
+
+class StageMonitor(Thread):
+    """
+    Watcher of a producer and a consumer process connected by a queue.
+
+    A producer failed before its sentinel gets the sentinel None put for it,
+    so the consumer finishes with the data it has. A failed consumer sets
+    stop_event, so the producer stops waiting for free places in the queue.
+    """
+
+    def __init__(self, producer: Process, consumer: Process, queue, stop_event) -> None:
+        """
+        :param producer: process putting data and None after the last item into the queue
+        :param consumer: process reading the queue
+        :param queue: queue between the processes
+        :param stop_event: multiprocessing event checked by the producer, see put
+        """
+        super().__init__(daemon=True)
+        self._producer = producer
+        self._consumer = consumer
+        self._queue = queue
+        self._stop_event = stop_event
+        self._stopped = Event()
+        self.failures = []
+
+    def stop(self) -> None:
+        self._stopped.set()
+        self.join()
+
+    def _finish_for_producer(self) -> None:
+        logger.error('Producer exited with code %s, the consumer gets the sentinel.', self._producer.exitcode)
+        self.failures.append(self._producer.name)
+        while self._consumer.exitcode is None and not self._stopped.is_set():
+            try:
+                put(self._queue, None, timeout=POLL_INTERVAL)
+                return
+            except Full:
+                pass
+
+    def run(self):
+        producer_checked = False
+        while not self._stopped.wait(POLL_INTERVAL):
+            if not producer_checked and self._producer.exitcode is not None:
+                producer_checked = True
+                if self._producer.exitcode != 0:
+                    self._finish_for_producer()
+            if self._consumer.exitcode is not None:
+                if self._consumer.exitcode != 0:
+                    logger.error('Consumer exited with code %s, the producer is stopped.', self._consumer.exitcode)
+                    self.failures.append(self._consumer.name)
+                # a consumer finished by timeout does not read the rest either
+                self._stop_event.set()
+                return
+
+
+def stop_process(process: Process, timeout: float = 5.0) -> None:
+    """Join the process, terminate it if it does not exit in timeout seconds."""
+    process.join(timeout)
+    if process.is_alive():
+        logger.error('%s does not exit, it is terminated.', process.name)
+        process.terminate()
+        process.join()
+
+
+def run_stages(
+        producer: Process,
+        consumer: Process,
+        queue,
+        result_queue,
+        stop_event,
+        timeout: Optional[float] = None,
+        receive: Optional[Callable[[Callable[[], bool]], None]] = None
+):
+    """
+    Run a producer and a consumer process under StageMonitor and get the result of the consumer.
+
+    The result is read before the processes are joined, a process does not exit
+    until its queued data is read. Processes are stopped on any outcome.
+
+    :param producer: process putting data into the queue
+    :param consumer: process reading the queue and putting one result into result_queue
+    :param queue: queue between the processes
+    :param result_queue: queue of the result
+    :param stop_event: multiprocessing event checked by the producer, see put
+    :param timeout: seconds to wait for the result, queue.Empty is raised then, no limit by default
+    :param receive: reader of other queues of the consumer called with consumer.is_alive before the result
+        is read, like shared_result.SharedResults.collect, the consumer does not exit until they are read either
+    :raise StageFailed: the consumer is gone without the result
+    """
+    producer.start()
+    consumer.start()
+    monitor = StageMonitor(producer, consumer, queue, stop_event)
+    monitor.start()
+    try:
+        if receive is not None:
+            receive(consumer.is_alive)
+        return get(result_queue, consumer.is_alive, timeout)
+    finally:
+        # nothing reads the queue after the result or a failure
+        stop_event.set()
+        monitor.stop()
+        stop_process(consumer)
+        stop_process(producer)
@@ -0,0 +1,319 @@
+import ast
+import json
+import logging
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import Iterable, Optional
+
+from utils import PROJECTED_HOUR_FIELDS, round_mean
+
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCORE = 'avg_temp + cond_hours'
+_FUNCTIONS = {'abs': abs, 'min': min, 'max': max}
+_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.USub, ast.UAdd)
+
+
+def _get_metric_field(name: str) -> Optional[str]:
+    """
+    :param name: metric of a score expression, cond_hours or avg_<hour field>
+    :return: hour field averaged by the metric, None for cond_hours
+    """
+    if name == 'cond_hours':
+        return None
+    if name.startswith('avg_') and len(name) > 4:
+        return name[4:]
+    raise ValueError('Unknown metric {!r}, expected cond_hours or avg_<hour field>'.format(name))
+
+
+def compile_score(expression: str):
+    """
+    Check an arithmetic expression over city metrics and compile it into a function.
+
+    :param expression: expression like 'avg_temp + 0.5 * cond_hours - avg_wind_speed',
+        names are metrics, abs, min and max are available
+    :return: function of metrics as keyword arguments and names of the metrics
+    """
+    tree = ast.parse(expression, mode='eval')
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Name):
+            if node.id not in _FUNCTIONS:
+                _get_metric_field(node.id)
+                names.add(node.id)
+        elif isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in _FUNCTIONS or node.keywords:
+                raise ValueError('Only {} can be called in {!r}'.format(', '.join(_FUNCTIONS), expression))
+        elif isinstance(node, ast.Constant):
+            if not isinstance(node.value, (int, float)) or isinstance(node.value, bool):
+                raise ValueError('Only numbers are allowed in {!r}'.format(expression))
+        elif not isinstance(node, (ast.Expression, ast.BinOp, ast.UnaryOp, ast.Load) + _OPERATORS):
+            raise ValueError('{} is not allowed in {!r}'.format(type(node).__name__, expression))
+    names = tuple(sorted(names))
+    code = compile('lambda {}: {}'.format(', '.join(names), expression), '<score>', 'eval')
+    return eval(code, {'__builtins__': {}, **_FUNCTIONS}), names
+
+
+class ScoringProfile:
+    """
+    Variant of scoring of cities.
+
+    Days are limited to hours from bottom_day_hour to top_day_hour. Every day gets
+    cond_hours, the number of hours without bad conditions, and avg_<field>, the
+    rounded mean of the hour field, for every field in the score. A city gets
+    means of the days rounded to one digit and the score of these means.
+    Days of a city are limited to the date window of the profile if it has one.
+    """
+
+    def __init__(
+            self,
+            name: str,
+            score: str = DEFAULT_SCORE,
+            bottom_day_hour: int = 9,
+            top_day_hour: int = 19,
+            bad_conditions: Optional[Iterable[str]] = None,
+            start_day: Optional[str] = None,
+            finish_day: Optional[str] = None
+    ) -> None:
+        """
+        :param name: name of the profile in results
+        :param score: expression of total_score, see compile_score
+        :param bottom_day_hour: first hour of day period
+        :param top_day_hour: last hour of day period
+        :param bad_conditions: conditions with precipitation, conditions of the plan by default
+        :param start_day: first day of the date window in format yyyy-mm-dd, the first day of the plan by default
+        :param finish_day: last day of the date window in format yyyy-mm-dd, the last day of the plan by default
+        """
+        if start_day and finish_day and date.fromisoformat(start_day) > date.fromisoformat(finish_day):
+            raise ValueError('Date window {} - {} of profile {} is empty'.format(start_day, finish_day, name))
+        self.name = name
+        self.score = score
+        self.bottom_day_hour = bottom_day_hour
+        self.top_day_hour = top_day_hour
+        self.bad_conditions = None if bad_conditions is None else frozenset(bad_conditions)
+        self.start_day = start_day
+        self.finish_day = finish_day
+        self.get_score, self.metrics = compile_score(score)
+
+    def __getstate__(self) -> dict:
+        # the compiled function can not be pickled for processes, it is compiled again
+        state = self.__dict__.copy()
+        del state['get_score']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self.get_score, _ = compile_score(self.score)
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> 'ScoringProfile':
+        """
+        :param spec: dictionary with arguments of the constructor
+        """
+        return cls(**spec)
+
+
+def load_profiles(file_name: str) -> list:
+    """
+    :param file_name: JSON file with a list of profile specs, see ScoringProfile.from_dict
+    :return: profiles
+    """
+    with open(file_name, encoding='utf-8') as file:
+        return [ScoringProfile.from_dict(spec) for spec in json.load(file)]
+
+
+def get_weekends(first_day: str, count: int) -> list:
+    """
+    :param first_day: day in format yyyy-mm-dd
+    :param count: number of weekends
+    :return: pairs of saturday and sunday of weekends from the first day, a started weekend included
+    """
+    day = date.fromisoformat(first_day)
+    saturday = day + timedelta(days=(5 - day.weekday()) % 7 - (7 if day.weekday() == 6 else 0))
+    return [
+        ((saturday + timedelta(weeks=week)).isoformat(), (saturday + timedelta(weeks=week, days=1)).isoformat())
+        for week in range(count)
+    ]
+
+
+def make_window_profiles(
+        date_windows: Iterable[tuple],
+        hour_windows: Iterable[tuple] = ((9, 19),),
+        score: str = DEFAULT_SCORE,
+        bad_conditions: Optional[Iterable[str]] = None
+) -> list:
+    """
+    Profiles of every pair of a date window and an hour window, a ScoringPlan of them
+    ranks cities for every window in one pass over forecasts.
+
+    :param date_windows: pairs of first and last days in format yyyy-mm-dd
+    :param hour_windows: pairs of first and last hours of day period
+    :param score: expression of total_score of all profiles
+    :param bad_conditions: conditions with precipitation, see ScoringProfile
+    :return: profiles named like 2022-05-28_2022-05-29_9-19
+    """
+    hour_windows = list(hour_windows)
+    return [
+        ScoringProfile(
+            '{}_{}_{}-{}'.format(start_day, finish_day, bottom_day_hour, top_day_hour),
+            score, bottom_day_hour, top_day_hour, bad_conditions, start_day, finish_day
+        )
+        for start_day, finish_day in date_windows
+        for bottom_day_hour, top_day_hour in hour_windows
+    ]
+
+
+class _DayAggregation:
+    """Metrics of days shared by profiles with the same hours and conditions."""
+
+    def __init__(self, bottom_day_hour: int, top_day_hour: int, bad_conditions: frozenset) -> None:
+        self.bottom_day_hour = bottom_day_hour
+        self.top_day_hour = top_day_hour
+        self.bad_conditions = bad_conditions
+        # avg_temp and cond_hours are kept for results like the default scoring
+        self.fields = ['temp']
+        self.profiles = []
+
+    def add(self, profile: ScoringProfile) -> None:
+        self.profiles.append(profile)
+        for metric in profile.metrics:
+            if (field := _get_metric_field(metric)) and field not in self.fields:
+                self.fields.append(field)
+
+
+class ScoringPlan:
+    """
+    Scoring of cities by many profiles in a single pass over hours.
+
+    Profiles with the same hours and bad conditions share metrics of days,
+    so every hour is read once per distinct day period. Means of date windows
+    are differences of prefix sums of metrics over days, so a window costs
+    a binary search and a copy of its days whatever the number of windows.
+    """
+
+    def __init__(
+            self,
+            profiles: list,
+            bad_conditions: Iterable[str] = (),
+            start_day: Optional[str] = None,
+            finish_day: Optional[str] = None
+    ) -> None:
+        """
+        :param profiles: profiles with unique names
+        :param bad_conditions: conditions with precipitation for profiles without their own
+        :param start_day: first day of profiles without their own date window, all days by default
+        :param finish_day: last day of profiles without their own date window, all days by default
+        """
+        names = [profile.name for profile in profiles]
+        if len(set(names)) != len(names):
+            raise ValueError('Names of profiles are not unique: {}'.format(', '.join(names)))
+        self.profiles = profiles
+        self._windows = {
+            profile.name: (profile.start_day or start_day, profile.finish_day or finish_day)
+            for profile in profiles
+        }
+        default_bad_conditions = frozenset(bad_conditions)
+        aggregations = {}
+        for profile in profiles:
+            key = (
+                profile.bottom_day_hour,
+                profile.top_day_hour,
+                default_bad_conditions if profile.bad_conditions is None else profile.bad_conditions
+            )
+            if key not in aggregations:
+                aggregations[key] = _DayAggregation(*key)
+            aggregations[key].add(profile)
+        self._aggregations = list(aggregations.values())
+
+    @property
+    def period(self) -> tuple:
+        """First and last days of all date windows, None for windows without the bound."""
+        starts = [start_day for start_day, _ in self._windows.values()]
+        finishes = [finish_day for _, finish_day in self._windows.values()]
+        return (
+            None if None in starts else min(starts),
+            None if None in finishes else max(finishes)
+        )
+
+    @property
+    def hour_fields(self) -> tuple:
+        """Fields of hours which have to be kept by fetching."""
+        fields = list(PROJECTED_HOUR_FIELDS)
+        for aggregation in self._aggregations:
+            fields.extend(field for field in aggregation.fields if field not in fields)
+        return tuple(fields)
+
+    @staticmethod
+    def _calculate_day(aggregation: _DayAggregation, hours: list) -> Optional[dict]:
+        sums = [0] * len(aggregation.fields)
+        count = 0
+        dry_hours = 0
+        for hour in hours:
+            if not aggregation.bottom_day_hour <= int(hour['hour']) <= aggregation.top_day_hour:
+                continue
+            count += 1
+            if hour['condition'] not in aggregation.bad_conditions:
+                dry_hours += 1
+            for index, field in enumerate(aggregation.fields):
+                sums[index] += hour[field]
+        if not count:
+            return None
+        # sum / count is correctly rounded as statistics.mean
+        day = {'avg_' + field: round(total / count) for field, total in zip(aggregation.fields, sums)}
+        day['cond_hours'] = dry_hours
+        return day
+
+    @staticmethod
+    def _get_prefix_sums(metrics_of_days: list, metrics: tuple) -> list:
+        """
+        :return: sums of metrics over days before every day and over all days
+        """
+        sums = [[0] * len(metrics)]
+        for day in metrics_of_days:
+            sums.append([total + day[metric] for total, metric in zip(sums[-1], metrics)])
+        return sums
+
+    def calculate(self, city_name: str, days: list) -> dict:
+        """
+        :param city_name: name of the city
+        :param days: pairs of formatted date and day of projected forecasts in date order
+        :return: dictionary with names of profiles as keys and results of calculations
+            like DataCalculationTask._calculate_city_data, profiles without days are skipped
+        """
+        results = {}
+        for aggregation in self._aggregations:
+            iso_dates = []
+            dated_metrics = []
+            for date_name, day in days:
+                if (metrics := self._calculate_day(aggregation, day['hours'])) is not None:
+                    iso_dates.append(day['date'])
+                    dated_metrics.append((date_name, metrics))
+            if not dated_metrics:
+                logger.error('Not found days in the given interval for %s.', city_name)
+                continue
+            metric_names = tuple(dated_metrics[0][1])
+            prefix_sums = self._get_prefix_sums([metrics for _, metrics in dated_metrics], metric_names)
+            # profiles with the same date window share dates and means
+            windows = {}
+            for profile in aggregation.profiles:
+                start_day, finish_day = self._windows[profile.name]
+                low = 0 if start_day is None else bisect_left(iso_dates, start_day)
+                high = len(iso_dates) if finish_day is None else bisect_right(iso_dates, finish_day)
+                if low >= high:
+                    logger.error('Not found days in the window of %s for %s.', profile.name, city_name)
+                    continue
+                if (window := windows.get((low, high))) is None:
+                    means = {
+                        metric: round_mean(total - prefix_total, high - low)
+                        for metric, total, prefix_total in zip(metric_names, prefix_sums[high], prefix_sums[low])
+                    }
+                    window = windows[low, high] = (dict(dated_metrics[low:high]), means)
+                dates, means = window
+                results[profile.name] = {
+                    'city_name': city_name,
+                    'dates': dates,
+                    'AVG': means,
+                    'total_score': profile.get_score(**{metric: means[metric] for metric in profile.metrics})
+                }
+        return results
@@ -0,0 +1,106 @@
+from bisect import bisect_left, insort
+from typing import Iterator, Optional
+
+
+class CityRanking:
+    """
+    Dense ranking of cities updated as results of calculations arrive.
+
+    Cities are kept in buckets by total_score with the sorted list of
+    distinct scores, so the rating of a city is a binary search over
+    scores and top cities are read from the first buckets.
+    A new result of a known city replaces the old one.
+    """
+
+    def __init__(self, top_ratings: Optional[int] = None) -> None:
+        """
+        :param top_ratings: keep cities with rating up to this value only, all cities by default
+        """
+        self._top_ratings = top_ratings
+        # negative scores keep the list ascending while the best score goes first
+        self._scores = []
+        self._buckets = {}
+        self._city_scores = {}
+
+    def __len__(self) -> int:
+        return len(self._city_scores)
+
+    def add(self, city_data: dict) -> None:
+        """
+        :param city_data: result of calculations for a city with total_score
+        """
+        self.discard(city_data['city_name'])
+        score = city_data['total_score']
+        if score not in self._buckets:
+            if self._top_ratings and len(self._scores) >= self._top_ratings:
+                if -score > self._scores[-1]:
+                    return
+                self._drop_worst_bucket()
+            insort(self._scores, -score)
+            self._buckets[score] = []
+        self._buckets[score].append(city_data)
+        self._city_scores[city_data['city_name']] = score
+
+    def discard(self, city_name: str) -> None:
+        """Remove the result of the city, unknown cities are ignored."""
+        if (score := self._city_scores.pop(city_name, None)) is None:
+            return
+        bucket = self._buckets[score]
+        for index, city_data in enumerate(bucket):
+            if city_data['city_name'] == city_name:
+                del bucket[index]
+                break
+        if not bucket:
+            del self._buckets[score]
+            del self._scores[bisect_left(self._scores, -score)]
+
+    def _drop_worst_bucket(self) -> None:
+        score = -self._scores.pop()
+        for city_data in self._buckets.pop(score):
+            del self._city_scores[city_data['city_name']]
+
+    def get_rating(self, city_name: str) -> Optional[int]:
+        """
+        :return: current rating of the city, None for unknown or dropped cities
+        """
+        if (score := self._city_scores.get(city_name)) is None:
+            return None
+        return bisect_left(self._scores, -score) + 1
+
+    def iter_rated(self) -> Iterator[tuple]:
+        """
+        :return: pairs of rating and result of calculations in rating order
+        """
+        for index, negative_score in enumerate(self._scores):
+            for city_data in self._buckets[-negative_score]:
+                yield index + 1, city_data
+
+    def get_top(self, count: int) -> list:
+        """
+        :param count: number of cities
+        :return: names of the best cities, cities with the same score go in order of arrival
+        """
+        top = []
+        for _, city_data in self.iter_rated():
+            if len(top) == count:
+                break
+            top.append(city_data['city_name'])
+        return top
+
+    def get_cities(self) -> list:
+        """
+        :return: kept results of calculations sorted by total_score
+        """
+        return [city_data for _, city_data in self.iter_rated()]
+
+    def get_results(self) -> list:
+        """
+        :return: results of calculations sorted by rating, total_score replaced with rating
+        """
+        return [
+            dict(
+                {key: value for key, value in city_data.items() if key != 'total_score'},
+                rating=rating
+            )
+            for rating, city_data in self.iter_rated()
+        ]
@@ -0,0 +1,104 @@
+import heapq
+import logging
+from typing import Optional
+
+
+logger = logging.getLogger(__name__)
+
+# unknown keys named in the summary, the rest are only counted
+UNKNOWN_KEYS_SAMPLE = 5
+
+
+class ResultRenderer:
+    """
+    Renderer of results of calculations with localized keys and city names.
+
+    Keys of the fixed result layout are translated once, then every city
+    is rendered in one pass. Keys and city names missing from translations
+    are kept as is and collected in unknown_keys, they are reported once
+    by get_unknown_summary instead of a message per city.
+    """
+
+    LAYOUT = ('city_name', 'dates', 'AVG', 'rating')
+    METRICS = ('avg_temp', 'cond_hours')
+
+    def __init__(self, translations: dict) -> None:
+        """
+        :param translations: dictionary with english keys and city names as keys, see utils.LOCALES
+        """
+        self._translations = translations
+        self._city_name_key = translations['city_name']
+        self._dates_key = translations['dates']
+        self._avg_key = translations['AVG']
+        self._rating_key = translations['rating']
+        self._temp_key, self._cond_key = (translations[metric] for metric in self.METRICS)
+        self._metric_keys = {}
+        self.unknown_keys = set()
+
+    def translate(self, key: str) -> str:
+        if (translation := self._translations.get(key)) is not None:
+            return translation
+        self.unknown_keys.add(key)
+        return key
+
+    def get_unknown_summary(self) -> str:
+        """
+        :return: number of unknown keys and the first of them in sorted order, for one line of a log
+        """
+        sample = heapq.nsmallest(UNKNOWN_KEYS_SAMPLE, self.unknown_keys)
+        summary = '{} keys: {}'.format(len(self.unknown_keys), ', '.join(sample))
+        if len(self.unknown_keys) > len(sample):
+            summary += ', ...'
+        return summary
+
+    def _get_metric_keys(self, metrics: dict) -> tuple:
+        # dates of all cities have the same metrics, so their translation is computed once
+        keys = tuple(metrics)
+        if (translated_keys := self._metric_keys.get(keys)) is None:
+            translated_keys = self._metric_keys[keys] = tuple(map(self.translate, keys))
+        return translated_keys
+
+    def _render_metrics(self, metrics: dict) -> dict:
+        return dict(zip(self._get_metric_keys(metrics), metrics.values()))
+
+    def _render_layout(self, city_data: dict) -> Optional[dict]:
+        """Render a result of the fixed layout, None for any other one."""
+        if tuple(city_data) != self.LAYOUT or len(city_data['AVG']) != len(self.METRICS):
+            return None
+        temp_key, cond_key = self._temp_key, self._cond_key
+        dates = {}
+        for date, metrics in city_data['dates'].items():
+            if len(metrics) != len(self.METRICS):
+                return None
+            dates[date] = {temp_key: metrics['avg_temp'], cond_key: metrics['cond_hours']}
+        avg = city_data['AVG']
+        return {
+            self._city_name_key: self.translate(city_data['city_name']),
+            self._dates_key: dates,
+            self._avg_key: {temp_key: avg['avg_temp'], cond_key: avg['cond_hours']},
+            self._rating_key: city_data['rating']
+        }
+
+    def render(self, city_data: dict) -> dict:
+        """
+        :param city_data: result of calculations for a city with rating
+        :return: localized result
+        """
+        try:
+            if (result := self._render_layout(city_data)) is not None:
+                return result
+        except KeyError:
+            pass
+        result = {}
+        for key, value in city_data.items():
+            if key == 'city_name':
+                result[self._city_name_key] = self.translate(value)
+            elif key == 'dates':
+                result[self._dates_key] = {
+                    date: self._render_metrics(metrics) for date, metrics in value.items()
+                }
+            elif key == 'AVG':
+                result[self._avg_key] = self._render_metrics(value)
+            else:
+                result[self.translate(key)] = value
+        return result
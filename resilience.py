@@ -0,0 +1,185 @@
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from threading import Lock
+from typing import Optional
+from urllib.error import HTTPError
+
+
+logger = logging.getLogger(__name__)
+
+# statuses worth another attempt, the host is overloaded or restarting
+RETRY_STATUSES = frozenset((429, 500, 502, 503, 504))
+
+
+class ResponseStatusError(Exception):
+    """Response with a status other than 200."""
+
+    def __init__(self, status: int, reason: str) -> None:
+        super().__init__('Error during execute request. {}: {}'.format(status, reason))
+        self.status = status
+
+
+class CircuitOpenError(Exception):
+    """Request is rejected without going to the host."""
+
+
+def is_throttled(error: BaseException) -> bool:
+    """
+    :return: True for 429, the host is alive and asks to slow down
+    """
+    return getattr(error, 'status', getattr(error, 'code', None)) == 429
+
+
+def is_retryable(error: BaseException) -> bool:
+    """
+    :return: True for timeouts, network errors and statuses of RETRY_STATUSES
+    """
+    if isinstance(error, HTTPError):
+        return error.code in RETRY_STATUSES
+    if isinstance(error, ResponseStatusError):
+        return error.status in RETRY_STATUSES
+    # URLError, ConnectionError and socket timeouts are OSError
+    return isinstance(error, (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError))
+
+
+class RetryPolicy:
+    """
+    Exponential backoff with full jitter.
+
+    The delay before attempt n is uniform between 0 and
+    min(max_delay, base_delay * 2 ** (n - 1)), so clients failed together
+    do not come back together.
+    """
+
+    def __init__(self, attempts: int = 3, base_delay: float = 0.1, max_delay: float = 2.0) -> None:
+        """
+        :param attempts: max number of attempts of a request, 1 for no retries
+        :param base_delay: upper bound of the first delay in seconds
+        :param max_delay: upper bound of every delay in seconds
+        """
+        if attempts < 1:
+            raise ValueError('At least one attempt is required')
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def get_delay(self, attempt: int) -> float:
+        """
+        :param attempt: number of the next attempt, from 1 for the first retry
+        """
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+
+class CircuitBreaker:
+    """
+    Breaker of requests to one host.
+
+    Opens after failure_threshold consecutive failures and rejects requests
+    for reset_timeout seconds, then lets one trial request through:
+    its success closes the breaker, its failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        """
+        :param failure_threshold: consecutive failures opening the breaker
+        :param reset_timeout: seconds before a trial request
+        """
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial = False
+        self._lock = Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = Lock()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+    def allow(self) -> bool:
+        """
+        :return: True if a request can go to the host
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._trial or time.monotonic() - self._opened_at < self._reset_timeout:
+                return False
+            self._trial = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            if self._trial or self._failures >= self._failure_threshold:
+                if self._opened_at is None or self._trial:
+                    logger.warning('Circuit is opened after %s failures.', self._failures)
+                self._opened_at = time.monotonic()
+                self._trial = False
+
+
+class CircuitBreakers:
+    """Circuit breakers created on demand for every host."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0) -> None:
+        """
+        :param failure_threshold: consecutive failures opening a breaker, see CircuitBreaker
+        :param reset_timeout: seconds before a trial request, see CircuitBreaker
+        """
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._breakers = {}
+
+    def get(self, host: str) -> CircuitBreaker:
+        # setdefault keeps the first breaker if threads create them at once
+        if (breaker := self._breakers.get(host)) is None:
+            breaker = self._breakers.setdefault(
+                host, CircuitBreaker(self._failure_threshold, self._reset_timeout)
+            )
+        return breaker
+
+
+class LatencyTracker:
+    """
+    Recent latencies of successful requests for the hedging delay.
+    """
+
+    def __init__(self, percentile: float = 95, window: int = 200, min_samples: int = 20) -> None:
+        """
+        :param percentile: percentile of latencies after which a request is hedged
+        :param window: number of recent latencies kept
+        :param min_samples: latencies required before hedging starts
+        """
+        self._percentile = percentile
+        self._min_samples = min_samples
+        self._latencies = deque(maxlen=window)
+
+    def add(self, latency: float) -> None:
+        self._latencies.append(latency)
+
+    def get_hedge_delay(self) -> Optional[float]:
+        """
+        :return: seconds to wait for a request before sending a duplicate, None until enough samples
+        """
+        latencies = sorted(self._latencies)
+        if len(latencies) < self._min_samples:
+            return None
+        index = min(len(latencies) - 1, int(len(latencies) * self._percentile / 100))
+        return latencies[index]
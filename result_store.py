@@ -0,0 +1,115 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+from typing import Any, Optional
+
+
+logger = logging.getLogger(__name__)
+
+# a new version of the format or of calculations makes stored results misses
+STORE_VERSION = 1
+
+
+def get_context(*parameters) -> bytes:
+    """
+    :param parameters: JSON parameters of calculations, like the date window and bad conditions
+    :return: digest which is a part of every key of results calculated with the parameters
+    """
+    encoded = json.dumps([STORE_VERSION, *parameters], sort_keys=True, separators=(',', ':'))
+    return hashlib.blake2b(encoded.encode('utf-8'), digest_size=32).digest()
+
+
+def make_key(context: bytes, data: Any) -> str:
+    """
+    Hash of data of a city calculated with parameters of the context.
+
+    Pickle is several times cheaper than JSON and than the calculation itself.
+    Equal data parsed by different parsers may get different keys, it costs
+    a recalculation only.
+
+    :param context: digest of get_context
+    :param data: forecasts used by the calculation
+    :return: hex digest
+    """
+    return hashlib.blake2b(pickle.dumps(data, protocol=5), key=context, digest_size=16).hexdigest()
+
+
+class CityResultStore:
+    """
+    Persistent results of calculations of cities keyed by hashes of their data.
+
+    The file is JSON Lines with a city, its key and its result per line.
+    It is read by load and replaced atomically by save with the results of
+    the cities got or put since load, so cities gone from the list are dropped.
+    The file is not rewritten when no result has changed.
+    """
+
+    def __init__(self, file_name: str = '.forecast_results.jsonl') -> None:
+        """
+        :param file_name: file name of the store
+        """
+        self._file_name = file_name
+        self._entries = {}
+        self._current = {}
+        self.hits = 0
+        self.misses = 0
+
+    def load(self) -> None:
+        """Read the file, a missing or damaged file is an empty store."""
+        self._entries = {}
+        self._current = {}
+        self.hits = 0
+        self.misses = 0
+        try:
+            with open(self._file_name, encoding='utf-8') as file:
+                for line in file:
+                    city, key, result = json.loads(line)
+                    self._entries[city] = (key, result)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError):
+            logger.warning('Result store %s is damaged, all cities are calculated.', self._file_name)
+            self._entries = {}
+        logger.info('Loaded results of %s cities from %s.', len(self._entries), self._file_name)
+
+    def get(self, city: str, key: str) -> Optional[Any]:
+        """
+        :return: stored result of the city for the key, None if there is no one
+        """
+        entry = self._entries.get(city)
+        if entry is None or entry[0] != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._current[city] = entry
+        return entry[1]
+
+    def put(self, city: str, key: str, result: Any) -> None:
+        """
+        :param result: JSON result of calculations of the city
+        """
+        self._current[city] = (key, result)
+
+    @property
+    def changed(self) -> bool:
+        return self.misses > 0 or len(self._current) != len(self._entries)
+
+    def save(self) -> None:
+        """Replace the file with the results of the current run."""
+        if not self.changed:
+            return
+        descriptor, temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(self._file_name)), suffix='.tmp'
+        )
+        try:
+            with os.fdopen(descriptor, 'w', encoding='utf-8') as file:
+                for city, (key, result) in self._current.items():
+                    file.write(json.dumps([city, key, result], ensure_ascii=False) + '\n')
+            os.replace(temp_path, self._file_name)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+        logger.info('Saved results of %s cities to %s.', len(self._current), self._file_name)
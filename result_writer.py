@@ -0,0 +1,122 @@
+import json
+import logging
+import os
+import tempfile
+from typing import Iterator, Optional
+
+
+logger = logging.getLogger(__name__)
+
+FILE_FORMATS = ('pretty', 'compact', 'jsonl')
+
+
+def _read_umask() -> int:
+    """
+    :return: umask of the process, read from /proc without changing it where it is available
+    """
+    try:
+        with open('/proc/self/status', encoding='ascii') as file:
+            for line in file:
+                if line.startswith('Umask:'):
+                    return int(line.split()[1], 8)
+    except OSError:
+        pass
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# permissions of files made by open, mkstemp makes private ones
+DEFAULT_MODE = 0o666 & ~_read_umask()
+
+
+class ResultWriter:
+    """
+    Streaming writer of localized results into a temporary file.
+
+    Every record is encoded and appended to the buffered file as soon as
+    it is written, so memory does not grow with the number of cities.
+    The file replaces file_name atomically on commit, readers never see
+    a partially written file.
+    Formats: pretty - JSON array like json.dump with indent=2, compact - JSON array
+    without whitespace, jsonl - JSON Lines with a record per line.
+    """
+
+    def __init__(
+            self,
+            file_name: str,
+            file_format: str = 'pretty',
+            buffer_size: int = 64 * 1024,
+            mode: Optional[int] = None
+    ) -> None:
+        """
+        :param file_name: file name for writing data
+        :param file_format: one of FILE_FORMATS
+        :param buffer_size: size of the file buffer in bytes
+        :param mode: permissions of the file, DEFAULT_MODE like a file made by open by default,
+            0o600 keeps the file private
+        """
+        if file_format not in FILE_FORMATS:
+            raise ValueError('Unknown file format {!r}, expected one of {}'.format(
+                file_format, ', '.join(FILE_FORMATS)
+            ))
+        self._file_name = file_name
+        self._file_format = file_format
+        self._mode = DEFAULT_MODE if mode is None else mode
+        descriptor, self._temp_path = tempfile.mkstemp(
+            dir=os.path.dirname(os.path.abspath(file_name)), suffix='.tmp'
+        )
+        self._file = os.fdopen(descriptor, 'w', encoding='utf-8', buffering=buffer_size)
+        self.count = 0
+
+    def write(self, record: dict) -> None:
+        if self._file_format == 'jsonl':
+            self._file.write(json.dumps(record, ensure_ascii=False) + '\n')
+        elif self._file_format == 'compact':
+            self._file.write(',' if self.count else '[')
+            self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        else:
+            # strings are encoded with escaped newlines, so every new line is a nested level
+            encoded = json.dumps(record, ensure_ascii=False, indent=2).replace('\n', '\n  ')
+            self._file.write((',\n  ' if self.count else '[\n  ') + encoded)
+        self.count += 1
+
+    def _close_array(self) -> None:
+        if self._file_format == 'jsonl':
+            return
+        if not self.count:
+            self._file.write('[]')
+        elif self._file_format == 'compact':
+            self._file.write(']')
+        else:
+            self._file.write('\n]')
+
+    def commit(self) -> None:
+        """Finish the file and move it to file_name."""
+        try:
+            self._close_array()
+            self._file.close()
+            os.chmod(self._temp_path, self._mode)
+            os.replace(self._temp_path, self._file_name)
+        except OSError:
+            self.abort()
+            raise
+        logger.info('Written %s records to %s.', self.count, self._file_name)
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self._temp_path):
+            os.unlink(self._temp_path)
+
+
+def read_results(file_name: str, file_format: str = 'pretty') -> Iterator[dict]:
+    """
+    :param file_name: file written by ResultWriter
+    :param file_format: format of the file, see FILE_FORMATS
+    :return: records of the file
+    """
+    with open(file_name, encoding='utf-8') as file:
+        if file_format == 'jsonl':
+            yield from (json.loads(line) for line in file if line.strip())
+        else:
+            yield from json.load(file)
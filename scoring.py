@@ -0,0 +1,149 @@
+import logging
+from datetime import datetime
+from operator import itemgetter
+from typing import Optional
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from conditions import ConditionRegistry
+from utils import round_mean
+
+
+logger = logging.getLogger(__name__)
+
+
+class ColumnarCalculator:
+    """
+    Vectorized replacement of DataCalculationTask._calculate_city_data for many cities.
+
+    Hours of all cities are loaded into flat NumPy arrays and aggregated
+    with bincount over (city, day) groups. Output matches the python engine,
+    rounding included.
+    """
+
+    def __init__(
+            self,
+            start_day: str,
+            finish_day: str,
+            bad_conditions: tuple,
+            bottom_day_hour: int = 9,
+            top_day_hour: int = 19,
+            conditions: Optional[ConditionRegistry] = None
+    ) -> None:
+        """
+        :param start_day: bottom day of period in format yyyy-mm-dd
+        :param finish_day: top day of period in format yyyy-mm-dd
+        :param bad_conditions: conditions with precipitation
+        :param bottom_day_hour: first hour of day period
+        :param top_day_hour: last hour of day period
+        :param conditions: registry of condition codes, a registry of bad_conditions by default
+        """
+        if np is None:
+            raise ImportError('numpy is required for the columnar calculation engine')
+        # ISO dates are compared as strings
+        self._start_day = start_day
+        self._finish_day = finish_day
+        self._bottom_day_hour = bottom_day_hour
+        self._top_day_hour = top_day_hour
+        if conditions is None or conditions.bad_conditions != frozenset(bad_conditions):
+            conditions = ConditionRegistry((), bad_conditions)
+        self._conditions = conditions
+
+    def _load(self, cities_data: list) -> tuple:
+        """
+        :param cities_data: projected API responses with city_name
+        :return: day labels per group, city index per group and hourly columns
+        """
+        day_labels = []
+        day_cities = []
+        day_sizes = []
+        rows = []
+        labels = {}
+        get_row = itemgetter('hour', 'temp', 'condition')
+        for city_index, city_data in enumerate(cities_data):
+            for day in city_data['forecasts']:
+                if not self._start_day <= day['date'] <= self._finish_day:
+                    continue
+                rows.extend(map(get_row, day['hours']))
+                day_sizes.append(len(day['hours']))
+                if (label := labels.get(day['date'])) is None:
+                    label = datetime.strptime(day['date'], '%Y-%m-%d').strftime('%d-%m')
+                    labels[day['date']] = label
+                day_labels.append(label)
+                day_cities.append(city_index)
+        hours, temps, conditions = zip(*rows) if rows else ((), (), ())
+        groups = np.repeat(np.arange(len(day_sizes)), day_sizes)
+        return (
+            day_labels,
+            np.array(day_cities, dtype=np.int64),
+            groups,
+            # hours are strings in not projected responses
+            np.array(hours).astype(np.int64),
+            np.array(temps, dtype=np.float64),
+            np.fromiter(map(self._conditions.intern, conditions), dtype=np.int64, count=len(conditions))
+        )
+
+    def _get_bad_table(self):
+        # a copy, the shared bytearray can not grow while numpy holds its buffer
+        return np.frombuffer(bytes(self._conditions.bad_table), dtype=np.uint8).astype(bool)
+
+    def calculate(self, cities_data: list) -> list:
+        """
+        :param cities_data: projected API responses with city_name
+        :return: results of calculations like DataCalculationTask._calculate_city_data
+        """
+        day_labels, day_cities, groups, hours, temps, conditions = self._load(cities_data)
+        days_count = len(day_labels)
+        mask = (hours >= self._bottom_day_hour) & (hours <= self._top_day_hour)
+        groups = groups[mask]
+        hours_count = np.bincount(groups, minlength=days_count)
+        temp_sums = np.bincount(groups, weights=temps[mask], minlength=days_count)
+        dry_hours = np.bincount(
+            groups, weights=~self._get_bad_table()[conditions[mask]], minlength=days_count
+        ).astype(np.int64)
+        valid = hours_count > 0
+        # int sum / count is correctly rounded as statistics.mean, rint rounds half to even as round
+        avg_temps = np.zeros(days_count, dtype=np.int64)
+        avg_temps[valid] = np.rint(temp_sums[valid] / hours_count[valid])
+
+        cities_count = len(cities_data)
+        valid_cities = day_cities[valid]
+        city_days = np.maximum(np.bincount(valid_cities, minlength=cities_count), 1)
+        city_temps = np.bincount(valid_cities, weights=avg_temps[valid], minlength=cities_count)
+        city_conds = np.bincount(valid_cities, weights=dry_hours[valid], minlength=cities_count)
+        # sums of whole numbers are exact, means are made from them like statistics.mean
+        city_temps = city_temps.astype(np.int64).tolist()
+        city_conds = city_conds.astype(np.int64).tolist()
+        city_days = city_days.tolist()
+
+        results = [None] * cities_count
+        day_cities = day_cities.tolist()
+        avg_temps = avg_temps.tolist()
+        dry_hours = dry_hours.tolist()
+        for day_index in np.flatnonzero(valid).tolist():
+            city_index = day_cities[day_index]
+            if results[city_index] is None:
+                results[city_index] = {
+                    'city_name': cities_data[city_index]['city_name'],
+                    'dates': {}
+                }
+            results[city_index]['dates'][day_labels[day_index]] = {
+                'avg_temp': avg_temps[day_index],
+                'cond_hours': dry_hours[day_index]
+            }
+        for city_index, result in enumerate(results):
+            if result is None:
+                logger.error(
+                    'Not found days in the given interval for %s.',
+                    cities_data[city_index]['city_name']
+                )
+                continue
+            # round with ndigits is done by python, numpy rounds some halves differently
+            mean_temp = round_mean(city_temps[city_index], city_days[city_index])
+            mean_cond = round_mean(city_conds[city_index], city_days[city_index])
+            result['AVG'] = {'avg_temp': mean_temp, 'cond_hours': mean_cond}
+            result['total_score'] = mean_temp + mean_cond
+        return [result for result in results if result is not None]
@@ -0,0 +1,264 @@
+import logging
+import math
+from array import array
+from multiprocessing import Queue, resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+from typing import Callable, Iterator, Optional
+
+from pipeline import get
+
+
+logger = logging.getLogger(__name__)
+
+# records of the first block, every next block is twice as large, so a run keeps a few descriptors
+BLOCK_RECORDS = 4096
+# records announced to the parent by one message of progress
+BATCH_RECORDS = 256
+# fields of a record after avg_temp and cond_hours of every date
+CITY_FIELDS = ('AVG.avg_temp', 'AVG.cond_hours', 'total_score', 'rating')
+_ITEM_SIZE = array('d').itemsize
+_INDEX_SIZE = array('q').itemsize
+
+
+def _decode_mean(value: float, day_values: list):
+    """
+    :param value: decoded mean of the days
+    :param day_values: values of the days
+    :return: int for a whole mean of the days, the value otherwise
+    """
+    return int(value) if day_values and sum(day_values) % len(day_values) == 0 else value
+
+
+class SharedResults:
+    """
+    Transport of results of calculations through shared memory.
+
+    The calculation process writes a fixed-width record of float64 values per city:
+    avg_temp and cond_hours of every date of the period, NaN for missing days,
+    then CITY_FIELDS, into blocks of shared memory. Blocks and names of cities
+    are announced by messages of the progress queue, so the parent reads results
+    of calculated cities before the ranking, see iter_partial. At the end the
+    ratings are written into records and the order of records by rating is put
+    into one more block. The parent maps the blocks without copies and unlinks them
+    by close, results are decoded city by city by iteration.
+    Like metrics.Metrics the object is made in the parent and passed to the process.
+    """
+
+    def __init__(
+            self,
+            progress_queue: Optional[Queue] = None,
+            block_records: int = BLOCK_RECORDS,
+            batch_records: int = BATCH_RECORDS
+    ) -> None:
+        """
+        :param progress_queue: multiprocessing queue of messages of progress, a new queue by default
+        :param block_records: records of the first block
+        :param batch_records: records announced by one message
+        """
+        self._queue = progress_queue if progress_queue is not None else Queue()
+        self._block_records = block_records
+        self._batch_records = batch_records
+        # blocks made by the process are registered in the tracker of the parent and unlinked by it
+        resource_tracker.ensure_running()
+        self.dates = []
+        self.cities = []
+        self._width = 0
+        self._date_positions = {}
+        self._blocks = []
+        self._views = []
+        self._order = None
+        self._order_block = None
+        # state of the writing process
+        self._count = 0
+        self._batch = []
+        self._indexes = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_blocks'] = []
+        state['_views'] = []
+        state['_order_block'] = None
+        state['_order'] = None
+        return state
+
+    def _locate(self, index: int) -> tuple:
+        """
+        :return: number of the block and offset of the record in the view of the block
+        """
+        block = (index // self._block_records + 1).bit_length() - 1
+        start = self._block_records * ((1 << block) - 1)
+        return block, (index - start) * self._width
+
+    def _add_block(self, name: Optional[str] = None) -> None:
+        if name is None:
+            size = (self._block_records << len(self._blocks)) * self._width * _ITEM_SIZE
+            block = SharedMemory(create=True, size=size)
+            self._queue.put(('block', block.name))
+        else:
+            block = SharedMemory(name)
+        self._blocks.append(block)
+        self._views.append(block.buf.cast('d'))
+
+    def open(self, dates: list) -> None:
+        """
+        Start writing in the calculation process.
+
+        :param dates: formatted dates of the period
+        """
+        self.dates = list(dates)
+        self._width = 2 * len(self.dates) + len(CITY_FIELDS)
+        self._date_positions = {date: position for position, date in enumerate(self.dates)}
+        self._queue.put(('dates', self.dates))
+
+    def write(self, city_data: dict) -> None:
+        """
+        :param city_data: result of calculations for a city with total_score
+        """
+        block, offset = self._locate(self._count)
+        if block == len(self._blocks):
+            self._add_block()
+        dates_count = len(self.dates)
+        record = array('d', [math.nan]) * self._width
+        for date, metrics in city_data['dates'].items():
+            position = self._date_positions[date]
+            record[position] = metrics['avg_temp']
+            record[dates_count + position] = metrics['cond_hours']
+        record[-4] = city_data['AVG']['avg_temp']
+        record[-3] = city_data['AVG']['cond_hours']
+        record[-2] = city_data['total_score']
+        self._views[block][offset:offset + self._width] = record
+        self._indexes[city_data['city_name']] = self._count
+        self._batch.append(city_data['city_name'])
+        self._count += 1
+        if len(self._batch) >= self._batch_records:
+            self._flush()
+
+    def _flush(self) -> None:
+        if self._batch:
+            self._queue.put(('records', self._batch))
+            self._batch = []
+
+    def finish(self, rated: Iterator[tuple]) -> int:
+        """
+        Write ratings and the order of records and release the blocks in the calculation process.
+
+        :param rated: pairs of rating and result of calculations in rating order, see ranking.CityRanking
+        :return: number of rated cities
+        """
+        self._flush()
+        order = array('q')
+        for rating, city_data in rated:
+            index = self._indexes[city_data['city_name']]
+            block, offset = self._locate(index)
+            self._views[block][offset + self._width - 1] = float(rating)
+            order.append(index)
+        order_block = SharedMemory(create=True, size=max(len(order) * order.itemsize, 1))
+        order_block.buf[:len(order) * order.itemsize] = order.tobytes()
+        self._queue.put(('ranked', order_block.name, len(order)))
+        for view in self._views:
+            view.release()
+        for block in self._blocks + [order_block]:
+            block.close()
+        self._views = []
+        self._blocks = []
+        return len(order)
+
+    @property
+    def is_ranked(self) -> bool:
+        return self._order is not None
+
+    def _receive(self, is_alive: Optional[Callable[[], bool]], timeout: Optional[float]) -> None:
+        message = get(self._queue, is_alive, timeout)
+        kind = message[0]
+        if kind == 'dates':
+            self.dates = message[1]
+            self._width = 2 * len(self.dates) + len(CITY_FIELDS)
+        elif kind == 'block':
+            self._add_block(message[1])
+        elif kind == 'records':
+            self.cities.extend(message[1])
+        else:
+            _, name, count = message
+            self._order_block = SharedMemory(name)
+            self._order = self._order_block.buf[:count * _INDEX_SIZE].cast('q')
+
+    def iter_partial(
+            self,
+            is_alive: Optional[Callable[[], bool]] = None,
+            timeout: Optional[float] = None
+    ) -> Iterator[dict]:
+        """
+        Results of cities as they are calculated, before the ranking.
+
+        :param is_alive: liveness of the calculation process, see pipeline.get
+        :param timeout: seconds to wait for a message, see pipeline.get
+        :return: results of calculations with total_score in order of calculation, until the ranking
+        """
+        read = len(self.cities)
+        while not self.is_ranked:
+            self._receive(is_alive, timeout)
+            for index in range(read, len(self.cities)):
+                yield self.get_record(index)
+            read = len(self.cities)
+
+    def collect(self, is_alive: Optional[Callable[[], bool]] = None, timeout: Optional[float] = None) -> None:
+        """
+        Receive messages until the ranking.
+
+        :raise pipeline.StageFailed: if the process is gone before the ranking
+        """
+        while not self.is_ranked:
+            self._receive(is_alive, timeout)
+
+    def get_record(self, index: int, with_rating: bool = False) -> dict:
+        """
+        :param index: number of the record in order of calculation
+        :param with_rating: rating instead of total_score, after the ranking
+        :return: result of calculations of the city
+        """
+        block, offset = self._locate(index)
+        values = self._views[block][offset:offset + self._width].tolist()
+        dates_count = len(self.dates)
+        dates = {
+            date: {'avg_temp': int(values[position]), 'cond_hours': int(values[dates_count + position])}
+            for position, date in enumerate(self.dates) if not math.isnan(values[position])
+        }
+        # means are ints when they are whole means of the days, like statistics.mean
+        mean_temp = _decode_mean(values[-4], [metrics['avg_temp'] for metrics in dates.values()])
+        mean_cond = _decode_mean(values[-3], [metrics['cond_hours'] for metrics in dates.values()])
+        result = {
+            'city_name': self.cities[index],
+            'dates': dates,
+            'AVG': {'avg_temp': mean_temp, 'cond_hours': mean_cond},
+        }
+        if with_rating:
+            result['rating'] = int(values[-1])
+        elif isinstance(mean_temp, int) and isinstance(mean_cond, int):
+            result['total_score'] = int(values[-2])
+        else:
+            result['total_score'] = values[-2]
+        return result
+
+    def __len__(self) -> int:
+        return len(self._order) if self.is_ranked else 0
+
+    def __iter__(self) -> Iterator[dict]:
+        """
+        :return: results of calculations with rating in rating order, like ranking.CityRanking.get_results
+        """
+        for index in self._order:
+            yield self.get_record(index, with_rating=True)
+
+    def close(self) -> None:
+        """Unmap and unlink the blocks in the parent."""
+        if self._order is not None:
+            self._order.release()
+            self._order = None
+        for view in self._views:
+            view.release()
+        for block in self._blocks + ([self._order_block] if self._order_block else []):
+            block.close()
+            block.unlink()
+        self._views = []
+        self._blocks = []
+        self._order_block = None
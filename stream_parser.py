@@ -0,0 +1,172 @@
+import codecs
+import json
+import re
+
+from utils import PROJECTED_HOUR_FIELDS, project_hour
+
+
+class ForecastStreamParser:
+    """
+    Incremental parser of an API response fed by chunks of bytes.
+
+    Keeps only forecasts[].date and the projected forecasts[].hours[],
+    every other value is skipped by scanning without building objects.
+    Parsing is a generator which is resumed on every feed and waits
+    while the buffer ends in the middle of a value.
+    """
+
+    _WHITESPACE = re.compile(r'[ \t\n\r]*')
+    _STRUCTURE = re.compile(r'["{}\[\]]')
+    _STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+
+    def __init__(self, hour_fields: tuple = PROJECTED_HOUR_FIELDS) -> None:
+        """
+        :param hour_fields: fields kept for every hour
+        """
+        self._hour_fields = hour_fields
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._json_decoder = json.JSONDecoder()
+        self._buffer = ''
+        self._pos = 0
+        self._final = False
+        self._forecasts = []
+        self._done = False
+        self._parser = self._parse()
+
+    def feed(self, chunk: bytes) -> None:
+        # the consumed part of the buffer is dropped on every feed
+        self._buffer = self._buffer[self._pos:] + self._decoder.decode(chunk)
+        self._pos = 0
+        self._resume()
+
+    def close(self) -> dict:
+        """
+        :return: dictionary with forecasts-key like utils.project_forecast
+        """
+        self._final = True
+        self.feed(b'')
+        if not self._done:
+            raise ValueError('Unexpected end of JSON')
+        return {'forecasts': self._forecasts}
+
+    def _resume(self) -> None:
+        if self._done:
+            return
+        try:
+            next(self._parser)
+        except StopIteration:
+            self._done = True
+
+    def _wait(self):
+        if self._final:
+            raise ValueError('Unexpected end of JSON')
+        yield
+
+    def _peek(self):
+        """Skip whitespace and return the next char."""
+        while True:
+            self._pos = self._WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            yield from self._wait()
+
+    def _expect(self, chars: str):
+        char = yield from self._peek()
+        if char not in chars:
+            raise ValueError('Expected {!r} at {}, got {!r}'.format(chars, self._pos, char))
+        self._pos += 1
+        return char
+
+    def _decode(self):
+        """Build the next value."""
+        while True:
+            yield from self._peek()
+            try:
+                value, end = self._json_decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._final:
+                    raise
+                yield
+                continue
+            # a number at the end of the buffer could continue in the next chunk
+            if end < len(self._buffer) or self._final:
+                self._pos = end
+                return value
+            yield
+
+    def _skip(self):
+        """Move over the next value without building it."""
+        char = yield from self._peek()
+        if char not in '{[':
+            yield from self._decode()
+            return
+        depth = 0
+        while True:
+            match = self._STRUCTURE.search(self._buffer, self._pos)
+            if match is None:
+                self._pos = len(self._buffer)
+                yield from self._wait()
+                continue
+            if match.group() == '"':
+                string_match = self._STRING.match(self._buffer, match.start())
+                if string_match is None:
+                    self._pos = match.start()
+                    yield from self._wait()
+                    continue
+                self._pos = string_match.end()
+                continue
+            self._pos = match.end()
+            depth += 1 if match.group() in '{[' else -1
+            if depth == 0:
+                return
+
+    def _parse_object(self, parse_value):
+        """:param parse_value: generator function consuming the value of the key"""
+        yield from self._expect('{')
+        if (yield from self._peek()) == '}':
+            self._pos += 1
+            return
+        while True:
+            key = yield from self._decode()
+            yield from self._expect(':')
+            yield from parse_value(key)
+            if (yield from self._expect(',}')) == '}':
+                return
+
+    def _parse_array(self, parse_item):
+        """:param parse_item: generator function consuming an item"""
+        yield from self._expect('[')
+        if (yield from self._peek()) == ']':
+            self._pos += 1
+            return
+        while True:
+            yield from parse_item()
+            if (yield from self._expect(',]')) == ']':
+                return
+
+    def _parse_day(self):
+        day = {'date': None, 'hours': []}
+
+        def parse_hour():
+            hour = yield from self._decode()
+            day['hours'].append(project_hour(hour, self._hour_fields))
+
+        def parse_value(key):
+            if key == 'date':
+                day['date'] = yield from self._decode()
+            elif key == 'hours':
+                yield from self._parse_array(parse_hour)
+            else:
+                yield from self._skip()
+
+        yield from self._parse_object(parse_value)
+        self._forecasts.append(day)
+
+    def _parse(self):
+        def parse_value(key):
+            if key == 'forecasts':
+                yield from self._parse_array(self._parse_day)
+            else:
+                yield from self._skip()
+
+        yield from self._parse_object(parse_value)
@@ -0,0 +1,309 @@
+"""
+Local HTTP stand-in for the Yandex Weather API.
+
+Serves examples/response.json for every path over keep-alive HTTP/1.1,
+so fetching can be tested and benchmarked offline. Faults injects errors,
+dropped connections and slow responses for tests of retries and hedging.
+SyntheticForecasts serves a different forecast for every city instead.
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+
+from conditions import load_condition_registry
+
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_FILE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'examples', 'response.json'
+)
+CITY_PATH = re.compile(r'city(\d+)-')
+
+
+class Faults:
+    """
+    Faults injected into a share of responses of the stub server.
+
+    Every request gets at most one fault: the connection is dropped without
+    a response, 503 is answered or the response is delayed by slow_latency.
+    """
+
+    def __init__(
+            self,
+            error_rate: float = 0.0,
+            drop_rate: float = 0.0,
+            slow_rate: float = 0.0,
+            slow_latency: float = 1.0,
+            seed: Optional[int] = None
+    ) -> None:
+        """
+        :param error_rate: share of requests answered with 503
+        :param drop_rate: share of requests with the connection closed before the response
+        :param slow_rate: share of requests answered after slow_latency
+        :param slow_latency: seconds of delay of slow responses
+        :param seed: seed of the random choice of faults for reproducible runs
+        """
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.slow_rate = slow_rate
+        self.slow_latency = slow_latency
+        self.counts = Counter()
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def choose(self) -> Optional[str]:
+        """
+        :return: 'error', 'drop', 'slow' or None for a normal response
+        """
+        with self._lock:
+            value = self._random.random()
+            for fault, rate in (('error', self.error_rate), ('drop', self.drop_rate), ('slow', self.slow_rate)):
+                if value < rate:
+                    self.counts[fault] += 1
+                    return fault
+                value -= rate
+        return None
+
+
+class SyntheticForecasts:
+    """
+    Forecasts shaped like examples/response.json, different for every city and reproducible.
+
+    The generator of a city is seeded by the seed and the index of the city. A city gets
+    a temperature offset and a share of hours with bad conditions, every hour gets
+    a noise of temperature and a bad condition with the share of the city.
+    """
+
+    def __init__(self, start_date: Optional[str] = None, seed: int = 0, template_file: str = RESPONSE_FILE) -> None:
+        """
+        :param start_date: date of the first day in format yyyy-mm-dd, the date of the template by default
+        :param seed: seed of all cities, other seeds give other forecasts
+        :param template_file: response with days and hours repeated for every city
+        """
+        with open(template_file, encoding='utf-8') as file:
+            self._template = json.load(file)
+        first_date = datetime.strptime(self._template['forecasts'][0]['date'], '%Y-%m-%d').date()
+        self._shift = (datetime.strptime(start_date, '%Y-%m-%d').date() - first_date) if start_date else timedelta()
+        self._bad_conditions = sorted(load_condition_registry().bad_conditions)
+        self._seed = seed
+        self.etag_prefix = '{}-{}'.format(seed, start_date or first_date)
+
+    def _make_day(self, day: dict, generator: random.Random, offset: int, bad_share: float) -> dict:
+        seconds = int(self._shift.total_seconds())
+        hours = [
+            dict(
+                hour,
+                hour_ts=hour['hour_ts'] + seconds,
+                temp=hour['temp'] + offset + generator.randint(-2, 2),
+                condition=(
+                    generator.choice(self._bad_conditions) if generator.random() < bad_share else hour['condition']
+                )
+            )
+            for hour in day['hours']
+        ]
+        day_date = date.fromisoformat(day['date']) + self._shift
+        return dict(day, date=day_date.isoformat(), date_ts=day['date_ts'] + seconds, hours=hours)
+
+    def make_response(self, index: int) -> dict:
+        """
+        :param index: index of the city like in make_cities
+        """
+        generator = random.Random('{}-{}'.format(self._seed, index))
+        offset = generator.randint(-15, 15)
+        bad_share = generator.random() / 2
+        return dict(
+            self._template,
+            forecasts=[self._make_day(day, generator, offset, bad_share) for day in self._template['forecasts']]
+        )
+
+    def get_body(self, index: int) -> bytes:
+        return json.dumps(self.make_response(index)).encode('utf-8')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Handler answering every GET with the example forecast."""
+
+    protocol_version = 'HTTP/1.1'
+    # headers and body are written separately, Nagle would delay every keep-alive response
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.request_count += 1
+            self.server.in_flight += 1
+        try:
+            self._answer()
+        finally:
+            with self.server.lock:
+                self.server.in_flight -= 1
+
+    def _answer(self):
+        if self.server.max_in_flight and self.server.in_flight > self.server.max_in_flight:
+            self.send_response(429)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        fault = self.server.faults.choose() if self.server.faults else None
+        if fault == 'drop':
+            self.close_connection = True
+            return
+        if fault == 'error':
+            self.send_response(503)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        if fault == 'slow':
+            time.sleep(self.server.faults.slow_latency)
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        index = self.server.get_city_index(self.path)
+        etag = self.server.get_etag(index)
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.end_headers()
+            return
+        body = self.server.get_body(index)
+        self.send_response(200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # fetching opens up to 50 connections at once, the default backlog of 5 delays them by SYN retries
+    request_queue_size = 128
+
+    def __init__(
+            self,
+            address: tuple,
+            body: bytes,
+            latency: float = 0.0,
+            faults: Optional[Faults] = None,
+            max_in_flight: Optional[int] = None,
+            synthetic: Optional[SyntheticForecasts] = None
+    ) -> None:
+        """
+        :param address: (host, port) to listen on, port 0 for a free one
+        :param body: response body for every request without synthetic
+        :param latency: seconds to wait before every response, emulates a remote host
+        :param faults: faults injected into responses, none by default
+        :param max_in_flight: requests over this number are answered with 429, no limit by default
+        :param synthetic: forecasts for paths of make_cities replacing body
+        """
+        super().__init__(address, StubHandler)
+        self.synthetic = synthetic
+        self.body = body
+        self.faults = faults
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+        self.latency = latency
+        self.request_count = 0
+
+    def get_city_index(self, path: str) -> Optional[int]:
+        """
+        :return: index of the city of a path of make_cities, None for the body without synthetic
+        """
+        if self.synthetic is None or (match := CITY_PATH.search(path)) is None:
+            return None
+        return int(match.group(1))
+
+    def get_etag(self, index: Optional[int]) -> str:
+        if index is None:
+            return self.etag
+        return '"{}-{}"'.format(self.synthetic.etag_prefix, index)
+
+    def get_body(self, index: Optional[int]) -> bytes:
+        if index is None:
+            return self.body
+        return self.synthetic.get_body(index)
+
+    def handle_error(self, request, client_address):
+        # clients drop connections of hedged and timed out requests
+        logger.debug('Request from %s is not answered.', client_address, exc_info=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return 'http://{}:{}'.format(host, port)
+
+
+def make_cities(base_url: str, count: int) -> dict[str, str]:
+    """
+    :param base_url: url of the stub server
+    :param count: number of cities
+    :return: dictionary with synthetic cities-keys and urls-values
+    """
+    return {
+        'CITY{}'.format(index): '{}/city{}-response.json'.format(base_url, index)
+        for index in range(count)
+    }
+
+
+@contextmanager
+def run_stub_server(
+        host: str = '127.0.0.1',
+        port: int = 0,
+        body: bytes = None,
+        latency: float = 0.0,
+        faults: Optional[Faults] = None,
+        max_in_flight: Optional[int] = None,
+        synthetic: Optional[SyntheticForecasts] = None
+):
+    """Run the stub server in a background thread for the duration of the block."""
+    if body is None:
+        with open(RESPONSE_FILE, 'rb') as file:
+            body = file.read()
+    server = StubServer((host, port), body, latency, faults, max_in_flight, synthetic)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of 503 responses')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='share of dropped connections')
+    parser.add_argument('--slow-rate', type=float, default=0.0, help='share of slow responses')
+    parser.add_argument('--slow-latency', type=float, default=1.0, help='delay of slow responses, seconds')
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--max-in-flight', type=int, help='answer 429 to requests over this number')
+    parser.add_argument('--synthetic', action='store_true', help='serve a different forecast for every city')
+    parser.add_argument('--start-date', help='first day of synthetic forecasts, yyyy-mm-dd')
+    args = parser.parse_args()
+    stub_faults = Faults(args.error_rate, args.drop_rate, args.slow_rate, args.slow_latency, args.seed)
+    stub_synthetic = SyntheticForecasts(args.start_date, args.seed or 0) if args.synthetic else None
+    with open(RESPONSE_FILE, 'rb') as file:
+        stub_server = StubServer(
+            (args.host, args.port), file.read(), args.latency, stub_faults, args.max_in_flight, stub_synthetic
+        )
+    print('Serving {} on {}'.format(RESPONSE_FILE, stub_server.base_url))
+    stub_server.serve_forever()
@@ -1,15 +1,31 @@
+import asyncio
 import concurrent
-import json
 import logging
+import os
+from abc import ABC, abstractmethod
 from concurrent.futures import ThreadPoolExecutor
-from datetime import datetime
+from datetime import date, datetime, timedelta
 from multiprocessing import Process, Queue
+from queue import Empty, Full, SimpleQueue
 from statistics import mean
 from threading import Lock, Thread
-from typing import Optional
+from typing import Iterator, Mapping, Optional
 
-from api_client import YandexWeatherAPI
-from utils import FIELDS_EN_TO_RUS
+from api_client import AsyncYandexWeatherAPI, ResponseCache, YandexWeatherAPI
+from city_registry import CityRegistry
+from columnar_result import ColumnarResultWriter, read_columnar_result
+from limiter import AdaptiveLimiter, AsyncAdaptiveLimiter
+from metrics import Metrics
+from pipeline import StageFailed, StageStopped, get, put
+from profiles import ScoringPlan
+from ranking import CityRanking
+from rendering import ResultRenderer
+from resilience import RetryPolicy
+from result_store import CityResultStore, get_context, make_key
+from result_writer import ResultWriter, read_results
+from scoring import ColumnarCalculator
+from shared_result import SharedResults
+from utils import LOCALE_FIELDS, LOCALES, PROJECTED_HOUR_FIELDS, project_forecast
 
 
 logger = logging.getLogger(__name__)
@@ -18,47 +34,268 @@ logger = logging.getLogger(__name__)
 class DataFetchingTask(Process):
     """Data fetching process."""
 
-    def __init__(self, cities: dict[str, str], queue: Queue) -> None:
+    def __init__(
+            self,
+            cities: Mapping[str, str],
+            queue: Queue,
+            cache: Optional[ResponseCache] = None,
+            stream: bool = False,
+            hour_fields: tuple = PROJECTED_HOUR_FIELDS,
+            timeout: float = 10.0,
+            retry: Optional[RetryPolicy] = None,
+            hedge: bool = False,
+            limiter: Optional[AdaptiveLimiter] = None,
+            stop_event=None,
+            put_timeout: Optional[float] = None,
+            metrics: Optional[Metrics] = None
+    ) -> None:
         """
-        :param cities: dictionary with cities-keys and urls-values
-        :param queue: queue for sending results of fetching to data calculation process
+        :param cities: mapping of cities to urls, a dictionary or city_registry.CityRegistry
+        :param queue: queue for sending results of fetching to data calculation process,
+            threads wait for free places of a bounded queue before next requests
+        :param cache: on-disk cache of responses
+        :param stream: parse responses while reading, see YandexWeatherAPI
+        :param hour_fields: fields of hours sent to data calculation process,
+            see profiles.ScoringPlan.hour_fields
+        :param timeout: timeout of requests, see YandexWeatherAPI
+        :param retry: retries of failed requests, see YandexWeatherAPI
+        :param hedge: send a duplicate of slow requests, see YandexWeatherAPI
+        :param limiter: adaptive limit of requests in flight, AdaptiveLimiter() by default
+        :param stop_event: multiprocessing event set when data calculation is gone, fetching is cancelled then
+        :param put_timeout: seconds to wait for a free place in the queue before fetching is cancelled,
+            no limit by default
+        :param metrics: measurements of fetch_seconds per city, queue_put_wait_seconds and queue_depth
+            of stage fetch, see metrics.Metrics
         """
         super().__init__()
-        self._api = YandexWeatherAPI()
+        self._limiter = limiter or AdaptiveLimiter()
+        self._api = YandexWeatherAPI(
+            cities, cache, stream, hour_fields, timeout=timeout, retry=retry, hedge=hedge, limiter=self._limiter
+        )
         self._cities = cities
         self._queue = queue
+        self._cache = cache
+        self._stop_event = stop_event
+        self._put_timeout = put_timeout
+        self._metrics = metrics or Metrics(enabled=False)
 
     def _get_data_by_city(self, city: str) -> dict:
         try:
-            data = self._api.get_forecasting(city)
+            with self._metrics.timer('fetch_seconds'):
+                data = self._api.get_forecasting(city)
             if data:
+                if not self._api.stream:
+                    data = project_forecast(data, self._api.hour_fields)
                 data['city_name'] = city
                 return data
         except Exception:
             logger.exception('Something goes wrong in _get_data_by_city method')
 
-    def run(self):
-        logger.info('Run process of data fetching.')
-        with ThreadPoolExecutor(max_workers=5) as pool:
-            futures = [pool.submit(self._get_data_by_city, city) for city in self._cities]
+    def _put(self, item: Optional[dict]) -> None:
+        with self._metrics.timer('queue_put_wait_seconds'):
+            put(self._queue, item, self._stop_event, self._put_timeout)
+        self._metrics.gauge_queue_depth('queue_depth', self._queue)
+
+    def _fetch_cities(self, cities: Iterator[str], lock: Lock) -> None:
+        # every thread puts its data itself, so a full queue holds off its next request
+        while self._stop_event is None or not self._stop_event.is_set():
+            with lock:
+                city = next(cities, None)
+            if city is None:
+                return
+            if result := self._get_data_by_city(city):
+                self._put(result)
+                logger.info('Got data for %s.', city)
+
+    def _iter_cities(self) -> Iterator[str]:
+        return iter(self._cities)
+
+    def _fetch(self) -> None:
+        cities = self._iter_cities()
+        lock = Lock()
+        # threads over the current limit wait in the limiter
+        with ThreadPoolExecutor(max_workers=self._limiter.max_limit) as pool:
+            futures = [pool.submit(self._fetch_cities, cities, lock) for _ in range(self._limiter.max_limit)]
             for future in concurrent.futures.as_completed(futures):
                 try:
-                    result = future.result()
-                    if result:
-                        self._queue.put(result)
-                        logger.info(
-                            'Got data for %s.', result['city_name']
-                        )
+                    future.result()
+                except (StageStopped, Full):
+                    raise
                 except Exception:
                     logger.exception('Something goes wrong in DataFetchingTask')
-            self._queue.put(None)
-            logger.info('Data fetching complete.')
+        self._put(None)
+
+    def run(self):
+        with self._metrics.stage('fetch'):
+            self._run()
+
+    def _run(self) -> None:
+        logger.info('Run process of data fetching.')
+        try:
+            self._fetch()
+        except (StageStopped, Full):
+            logger.error('Data calculation does not read the queue, fetching is cancelled.')
+            # the data left in the queue is not waited for on exit
+            self._queue.cancel_join_thread()
+            return
+        if self._cache:
+            logger.info('Response cache: %s.', self._cache.stats())
+        logger.info('Requests: %s.', self._api.stats())
+        logger.info('Data fetching complete.')
+
+
+class RefreshFetchingTask(DataFetchingTask):
+    """
+    Data fetching process of daemon.ForecastDaemon.
+
+    Fetches cities sent to city_queue until None, the client with its connections,
+    cache and limiter is kept between refreshes of cities.
+    """
+
+    def __init__(self, cities: Mapping[str, str], queue: Queue, city_queue: Queue, **kwargs) -> None:
+        """
+        :param cities: mapping of cities to urls, see DataFetchingTask
+        :param queue: queue for sending results of fetching to data calculation process
+        :param city_queue: names of cities to fetch, None stops the process
+        :param kwargs: parameters of DataFetchingTask
+        """
+        super().__init__(cities, queue, **kwargs)
+        self._city_queue = city_queue
+
+    def _iter_cities(self) -> Iterator[str]:
+        return iter(self._city_queue.get, None)
+
+
+class AsyncDataFetchingTask(Process):
+    """Data fetching process driving AsyncYandexWeatherAPI from an event loop."""
+
+    def __init__(
+            self,
+            cities: Mapping[str, str],
+            queue: Queue,
+            concurrency: int = 50,
+            connections_per_host: int = 10,
+            cache: Optional[ResponseCache] = None,
+            stream: bool = False,
+            hour_fields: tuple = PROJECTED_HOUR_FIELDS,
+            timeout: float = 10.0,
+            retry: Optional[RetryPolicy] = None,
+            hedge: bool = False,
+            limiter: Optional[AsyncAdaptiveLimiter] = None,
+            stop_event=None,
+            put_timeout: Optional[float] = None,
+            metrics: Optional[Metrics] = None
+    ) -> None:
+        """
+        :param cities: mapping of cities to urls, a dictionary or city_registry.CityRegistry
+        :param queue: queue for sending results of fetching to data calculation process,
+            requests wait for free places of a bounded queue, see DataFetchingTask
+        :param concurrency: max number of requests in flight without limiter
+        :param connections_per_host: max number of keep-alive connections kept for one host
+        :param cache: on-disk cache of responses
+        :param stream: parse responses while reading, see YandexWeatherAPI
+        :param hour_fields: fields of hours sent to data calculation process,
+            see profiles.ScoringPlan.hour_fields
+        :param timeout: timeout of requests, see AsyncYandexWeatherAPI
+        :param retry: retries of failed requests, see YandexWeatherAPI
+        :param hedge: send a duplicate of slow requests, see YandexWeatherAPI
+        :param limiter: adaptive limit of requests in flight replacing concurrency
+        :param stop_event: multiprocessing event set when data calculation is gone, see DataFetchingTask
+        :param put_timeout: seconds to wait for a free place in the queue, see DataFetchingTask
+        :param metrics: measurements of stage fetch, see DataFetchingTask
+        """
+        super().__init__()
+        self._cities = cities
+        self._queue = queue
+        self._concurrency = concurrency
+        self._connections_per_host = connections_per_host
+        self._cache = cache
+        self._stream = stream
+        self._hour_fields = hour_fields
+        self._timeout = timeout
+        self._retry = retry
+        self._hedge = hedge
+        self._limiter = limiter
+        self._stop_event = stop_event
+        self._put_timeout = put_timeout
+        self._metrics = metrics or Metrics(enabled=False)
+
+    async def _get_data_by_city(self, api: AsyncYandexWeatherAPI, city: str) -> Optional[dict]:
+        try:
+            with self._metrics.timer('fetch_seconds'):
+                data = await api.get_forecasting(city)
+            if data:
+                if not api.stream:
+                    data = project_forecast(data, api.hour_fields)
+                data['city_name'] = city
+                return data
+        except Exception:
+            logger.exception('Something goes wrong in _get_data_by_city method')
+
+    async def _fetch(self) -> None:
+        async with AsyncYandexWeatherAPI(
+                cities=self._cities,
+                concurrency=self._concurrency,
+                connections_per_host=self._connections_per_host,
+                cache=self._cache,
+                stream=self._stream,
+                hour_fields=self._hour_fields,
+                timeout=self._timeout,
+                retry=self._retry,
+                hedge=self._hedge,
+                limiter=self._limiter
+        ) as api:
+            # a fixed number of coroutines go through the cities, see DataFetchingTask
+            cities = iter(self._cities)
+            workers_count = self._limiter.max_limit if self._limiter else self._concurrency
+            await asyncio.gather(*(self._fetch_cities(api, cities) for _ in range(workers_count)))
+            logger.info('Requests: %s.', api.stats())
+
+    def _put(self, item: Optional[dict]) -> None:
+        with self._metrics.timer('queue_put_wait_seconds'):
+            put(self._queue, item, self._stop_event, self._put_timeout)
+        self._metrics.gauge_queue_depth('queue_depth', self._queue)
+
+    async def _fetch_cities(self, api: AsyncYandexWeatherAPI, cities: Iterator[str]) -> None:
+        while self._stop_event is None or not self._stop_event.is_set():
+            if (city := next(cities, None)) is None:
+                return
+            if result := await self._get_data_by_city(api, city):
+                # waiting for a free place does not block the event loop
+                await asyncio.to_thread(self._put, result)
+                logger.info('Got data for %s.', city)
+
+    def _run_fetch(self) -> None:
+        try:
+            asyncio.run(self._fetch())
+        except (StageStopped, Full):
+            raise
+        except Exception:
+            logger.exception('Something goes wrong in AsyncDataFetchingTask')
+        self._put(None)
+
+    def run(self):
+        with self._metrics.stage('fetch'):
+            self._run()
+
+    def _run(self) -> None:
+        logger.info('Run process of async data fetching.')
+        try:
+            self._run_fetch()
+        except (StageStopped, Full):
+            logger.error('Data calculation does not read the queue, fetching is cancelled.')
+            self._queue.cancel_join_thread()
+            return
+        if self._cache:
+            logger.info('Response cache: %s.', self._cache.stats())
+        logger.info('Data fetching complete.')
 
 
 class DataCalculationTask(Process):
     """
     Data calculation process.
     """
+    STAGE = 'calculation'
 
     def __init__(
             self,
@@ -66,7 +303,14 @@ class DataCalculationTask(Process):
             finish_day: str,
             queue: Queue,
             result_queue: Queue,
-            bad_conditions: list
+            bad_conditions: list,
+            engine: str = 'python',
+            top_ratings: Optional[int] = None,
+            profiles: Optional[list] = None,
+            get_timeout: Optional[float] = None,
+            result_store: Optional[CityResultStore] = None,
+            shared_results: Optional[SharedResults] = None,
+            metrics: Optional[Metrics] = None
     ) -> None:
         """
         :param start_day: bottom day of period in format yyyy-mm-dd
@@ -74,25 +318,108 @@ class DataCalculationTask(Process):
         :param queue: tasks
         :param result_queue: queue for result of calculations
         :param bad_conditions: list of best conditions
+        :param engine: 'python' to calculate city by city, 'numpy' to calculate all cities with arrays
+        :param top_ratings: put cities with rating up to this value only, all cities by default
+        :param profiles: scoring profiles evaluated in one pass, see profiles.ScoringProfile,
+            a dictionary with names of profiles as keys and results as values is put then,
+            the period is extended to date windows of profiles
+        :param get_timeout: seconds to wait for data of a city, cities got by then are calculated,
+            no limit by default
+        :param result_store: results of earlier runs, cities with unchanged forecasts of the period are
+            not calculated again, python engine only, the store is loaded and saved by the process
+        :param shared_results: transport of results through shared memory, the number of rated cities
+            is put into result_queue then, without profiles only
+        :param metrics: measurements of queue_get_wait_seconds and calc_seconds per city, calc_batch_seconds
+            of numpy engine, of stage calculation, see metrics.Metrics
         :return: None
         """
         super().__init__()
         self._queue = queue
+        self._get_timeout = get_timeout
+        self._metrics = metrics or Metrics(enabled=False)
+        self._top_ratings = top_ratings
+        self._scoring_plan = ScoringPlan(profiles, bad_conditions, start_day, finish_day) if profiles else None
+        if self._scoring_plan:
+            # days of all date windows of profiles are calculated once
+            start_day, finish_day = self._scoring_plan.period
         self._start_day = datetime.strptime(start_day, '%Y-%m-%d').date()
         self._finish_day = datetime.strptime(finish_day, '%Y-%m-%d').date()
-        self._bad_conditions = bad_conditions
+        self._date_index = self._get_date_index(self._start_day, self._finish_day)
+        # conditions are checked for every hour, a set makes it one hash lookup
+        self._bad_conditions = frozenset(bad_conditions)
         self.result_queue = result_queue
+        if engine not in ('python', 'numpy'):
+            raise ValueError('Unknown calculation engine {}'.format(engine))
+        # parameters are checked before the engine is made, it requires numpy
+        if engine == 'numpy' and profiles:
+            raise ValueError('Scoring profiles are calculated by python engine only')
+        if result_store is not None and engine == 'numpy':
+            raise ValueError('Results are stored by python engine only')
+        if shared_results is not None and profiles:
+            raise ValueError('Results of profiles are not written into shared memory')
+        self._columnar_calculator = None
+        if engine == 'numpy':
+            self._columnar_calculator = ColumnarCalculator(start_day, finish_day, bad_conditions)
+        self._shared_results = shared_results
+        self._result_store = result_store
+        if result_store is not None:
+            self._result_context = get_context(
+                start_day, finish_day, sorted(self._bad_conditions), self._get_profiles_spec(profiles or [])
+            )
+
+    @staticmethod
+    def _get_profiles_spec(profiles: list) -> list:
+        return [
+            [
+                profile.name, profile.score, profile.bottom_day_hour, profile.top_day_hour,
+                None if profile.bad_conditions is None else sorted(profile.bad_conditions),
+                profile.start_day, profile.finish_day
+            ]
+            for profile in profiles
+        ]
+
+    @staticmethod
+    def _get_date_index(start_day: date, finish_day: date) -> dict:
+        """
+        :return: dictionary with dates of period in format yyyy-mm-dd as keys and dd-mm as values
+        """
+        return {
+            day.isoformat(): day.strftime('%d-%m')
+            for day in (
+                start_day + timedelta(days=offset)
+                for offset in range((finish_day - start_day).days + 1)
+            )
+        }
+
+    def _get_formatted_date(self, day: dict) -> str:
+        if (formatted_date := self._date_index.get(day['date'])) is None:
+            formatted_date = datetime.strptime(day['date'], '%Y-%m-%d').strftime('%d-%m')
+        return formatted_date
 
     @staticmethod
-    def _get_formatted_date(day: dict) -> str:
-        date = datetime.strptime(day['date'], '%Y-%m-%d').date()
-        return date.strftime('%d-%m')
+    def _bisect_days(days: list, date: str, right: bool = False) -> int:
+        """
+        :param days: forecasts sorted by date
+        :param date: date in format yyyy-mm-dd
+        :param right: return position after days with the same date
+        :return: position of date in days
+        """
+        low, high = 0, len(days)
+        while low < high:
+            middle = (low + high) // 2
+            middle_date = days[middle]['date']
+            if middle_date < date or (right and middle_date == date):
+                low = middle + 1
+            else:
+                high = middle
+        return low
 
     def _get_days_period(self, data: dict) -> list:
-        return [
-            day
-            for day in data['forecasts']
-            if self._start_day <= datetime.strptime(day['date'], '%Y-%m-%d').date() <= self._finish_day
+        # forecasts of API go in date order and ISO dates are compared as strings
+        days = data['forecasts']
+        return days[
+            self._bisect_days(days, self._start_day.isoformat()):
+            self._bisect_days(days, self._finish_day.isoformat(), right=True)
         ]
 
     @staticmethod
@@ -194,108 +521,429 @@ class DataCalculationTask(Process):
         result_of_calculations.update(avg_data_for_city)
         return result_of_calculations
 
-    def run(self):
-        logger.info('Run process of data calculation.')
-        results = []
-        while (data_from_api := self._queue.get()) is not None:
-            if city_data := self._calculate_city_data(data_from_api):
-                results.append(city_data)
+    def _score_city_data(self, data: dict) -> dict:
+        days = [(self._get_formatted_date(day), day) for day in self._get_days_period(data)]
+        try:
+            return self._scoring_plan.calculate(data['city_name'], days)
+        except Exception:
+            logger.exception('Something goes wrong in _score_city_data method')
+            return {}
+
+    def _calculate_stored(self, data: dict, calculate) -> Optional[dict]:
+        """
+        :param calculate: calculation of data of a city
+        :return: stored result if forecasts of the period are unchanged, calculate(data) otherwise
+        """
+        if self._result_store is None:
+            return calculate(data)
+        key = make_key(self._result_context, self._get_days_period(data))
+        if (result := self._result_store.get(data['city_name'], key)) is None:
+            result = calculate(data)
+            if result:
+                self._result_store.put(data['city_name'], key, result)
+        return result
+
+    def _get_data_from_api(self) -> Optional[dict]:
+        """
+        :return: data of the next city, None after the last one or after get_timeout
+        """
+        try:
+            with self._metrics.timer('queue_get_wait_seconds'):
+                return get(self._queue, timeout=self._get_timeout)
+        except Empty:
+            logger.error('No data of cities for %s seconds, the rest of cities is skipped.', self._get_timeout)
+            return None
+
+    def _iter_scored_cities_data(self) -> Iterator[tuple]:
+        """
+        :return: pairs of name of profile, None without profiles, and result of calculations for a city
+        """
+        if not self._scoring_plan:
+            yield from ((None, city_data) for city_data in self._iter_cities_data())
+            return
+        while (data_from_api := self._get_data_from_api()) is not None:
+            with self._metrics.timer('calc_seconds'):
+                results = self._calculate_stored(data_from_api, self._score_city_data)
+            yield from results.items()
+            logger.info('Results is calculated for %s.', data_from_api['city_name'])
+
+    def _rank(self) -> dict:
+        """
+        :return: dictionary with names of profiles, None without profiles, as keys and rankings
+        """
+        names = [profile.name for profile in self._scoring_plan.profiles] if self._scoring_plan else [None]
+        rankings = {name: CityRanking(self._top_ratings) for name in names}
+        for name, city_data in self._iter_scored_cities_data():
+            rankings[name].add(city_data)
+            if self._shared_results is not None:
+                self._shared_results.write(city_data)
+        return rankings
+
+    def _iter_cities_data(self) -> Iterator[dict]:
+        if self._columnar_calculator:
+            cities_data = list(iter(self._get_data_from_api, None))
+            with self._metrics.timer('calc_batch_seconds'):
+                results = list(self._columnar_calculator.calculate(cities_data))
+            yield from results
+            logger.info('Results is calculated for %s cities.', len(cities_data))
+            return
+        while (data_from_api := self._get_data_from_api()) is not None:
+            with self._metrics.timer('calc_seconds'):
+                city_data = self._calculate_stored(data_from_api, self._calculate_city_data)
+            if city_data:
+                yield city_data
             logger.info(
                 'Results is calculated for  %s.', data_from_api['city_name']
             )
+
+    def run(self):
+        with self._metrics.stage(self.STAGE):
+            self._run()
+
+    def _save_results(self) -> None:
+        store = self._result_store
+        logger.info('Stored results are used for %s cities, %s cities are calculated.', store.hits, store.misses)
+        self._metrics.gauge('result_store_hits', store.hits)
+        self._metrics.gauge('result_store_misses', store.misses)
+        try:
+            store.save()
+        except OSError:
+            logger.exception('Results of calculations are not stored')
+
+    def _run(self) -> None:
+        logger.info('Run process of data calculation.')
+        if self._result_store is not None:
+            self._result_store.load()
+        if self._shared_results is not None:
+            self._shared_results.open(list(self._date_index.values()))
+        rankings = self._rank()
+        if self._shared_results is not None:
+            results = self._shared_results.finish(rankings[None].iter_rated())
+        elif self._scoring_plan:
+            results = {name: ranking.get_results() for name, ranking in rankings.items()}
+        else:
+            results = rankings[None].get_results()
         if results:
-            results.sort(
-                key=lambda ind: ind['total_score'],
-                reverse=True
+            logger.info('Rating calculated for cities.')
+        # the parent stops the process soon after the results, the store is saved before them
+        if self._result_store is not None:
+            self._save_results()
+        self.result_queue.put(results)
+        logger.info('Data calculations is finished.')
+
+
+class DataCalculationWorker(DataCalculationTask):
+    """
+    Data calculation process of DataCalculationPool.
+
+    Puts its part of cities with total_score, without ratings, for every profile.
+    """
+    STAGE = 'calculation_worker'
+
+    def _run(self) -> None:
+        logger.info('Run worker of data calculation.')
+        # cities out of local top ratings can not get into the global ones
+        results = {name: ranking.get_cities() for name, ranking in self._rank().items()}
+        # the only sentinel of the producer is returned for the rest of workers
+        self._queue.put(None)
+        self.result_queue.put(results)
+        logger.info('Worker of data calculations is finished.')
+
+
+class RefreshCalculationTask(DataCalculationTask):
+    """
+    Data calculation process of daemon.ForecastDaemon.
+
+    Puts the result of every city with total_score as soon as it is calculated,
+    without ranking, and None after the sentinel of fetching.
+    """
+    STAGE = 'refresh_calculation'
+
+    def _run(self) -> None:
+        logger.info('Run process of refresh calculation.')
+        for city_data in self._iter_cities_data():
+            self.result_queue.put(city_data)
+        self.result_queue.put(None)
+        logger.info('Refresh calculations is finished.')
+
+
+class DataCalculationPool(Process):
+    """
+    Data calculation process with several consumers of the queue.
+    """
+
+    def __init__(
+            self,
+            start_day: str,
+            finish_day: str,
+            queue: Queue,
+            result_queue: Queue,
+            bad_conditions: list,
+            workers_count: Optional[int] = None,
+            engine: str = 'python',
+            top_ratings: Optional[int] = None,
+            profiles: Optional[list] = None,
+            get_timeout: Optional[float] = None,
+            metrics: Optional[Metrics] = None
+    ) -> None:
+        """
+        :param start_day: bottom day of period in format yyyy-mm-dd
+        :param finish_day: top day of period in format yyyy-mm-dd
+        :param queue: tasks
+        :param result_queue: queue for result of calculations
+        :param bad_conditions: list of best conditions
+        :param workers_count: number of calculation processes, os.cpu_count() by default
+        :param engine: calculation engine of workers, see DataCalculationTask
+        :param top_ratings: put cities with rating up to this value only, all cities by default
+        :param profiles: scoring profiles of workers, see DataCalculationTask
+        :param get_timeout: seconds to wait for data of a city, see DataCalculationTask
+        :param metrics: measurements of stage calculation and of workers, see DataCalculationTask
+        :return: None
+        """
+        super().__init__()
+        self._profiles = profiles
+        self._engine = engine
+        self._top_ratings = top_ratings
+        self._start_day = start_day
+        self._finish_day = finish_day
+        self._queue = queue
+        self._bad_conditions = bad_conditions
+        self._workers_count = workers_count or os.cpu_count() or 1
+        self._get_timeout = get_timeout
+        self._metrics = metrics or Metrics(enabled=False)
+        self.result_queue = result_queue
+
+    def _get_partial_results(self, workers: list, partial_queue: Queue) -> list:
+        partial_results = []
+        while len(partial_results) < len(workers):
+            try:
+                partial_results.append(get(partial_queue, lambda: any(worker.is_alive() for worker in workers)))
+            except StageFailed:
+                logger.error(
+                    'Only %s of %s calculation workers put results.',
+                    len(partial_results), len(workers)
+                )
+                break
+        return partial_results
+
+    def run(self):
+        with self._metrics.stage('calculation'):
+            self._run()
+
+    def _run(self) -> None:
+        logger.info('Run %s processes of data calculation.', self._workers_count)
+        partial_queue = Queue()
+        workers = [
+            DataCalculationWorker(
+                start_day=self._start_day,
+                finish_day=self._finish_day,
+                queue=self._queue,
+                result_queue=partial_queue,
+                bad_conditions=self._bad_conditions,
+                engine=self._engine,
+                top_ratings=self._top_ratings,
+                profiles=self._profiles,
+                get_timeout=self._get_timeout,
+                metrics=self._metrics
             )
-            current_score = results[0]['total_score']
-            rating = 1
-            for index in range(len(results)):
-                total_score = results[index].pop('total_score')
-                if total_score == current_score:
-                    results[index]['rating'] = rating
-                else:
-                    rating += 1
-                    results[index]['rating'] = rating
-                    current_score = total_score
+            for _ in range(self._workers_count)
+        ]
+        for worker in workers:
+            worker.start()
+        partial_results = self._get_partial_results(workers, partial_queue)
+        for worker in workers:
+            worker.join()
+        names = [profile.name for profile in self._profiles] if self._profiles else [None]
+        rankings = {name: CityRanking(self._top_ratings) for name in names}
+        for partial_result in partial_results:
+            for name, cities_data in partial_result.items():
+                for city_data in cities_data:
+                    rankings[name].add(city_data)
+        if self._profiles:
+            results = {name: ranking.get_results() for name, ranking in rankings.items()}
+        else:
+            results = rankings[None].get_results()
+        if results:
             logger.info('Rating calculated for cities.')
         self.result_queue.put(results)
         logger.info('Data calculations is finished.')
 
 
-class DataAggregationTask(Thread):
+class TaskThread(Thread, ABC):
+    """
+    Thread running _run of subclasses as stage STAGE, an exception of _run is raised again by join.
+    """
+    STAGE = 'task'
+
+    def __init__(self, metrics: Optional[Metrics] = None) -> None:
+        """
+        :param metrics: measurements of the stage, see metrics.Metrics
+        """
+        super().__init__()
+        self.exception = None
+        self._metrics = metrics or Metrics(enabled=False)
+
+    @abstractmethod
+    def _run(self) -> None:
+        """Work of the stage."""
+
+    def _finish(self) -> None:
+        """Called after _run even if it failed."""
+
+    def run(self):
+        try:
+            with self._metrics.stage(self.STAGE):
+                self._run()
+        except Exception as error:
+            logger.exception('Something goes wrong in %s', type(self).__name__)
+            self.exception = error
+        finally:
+            self._finish()
+
+    def join(self, timeout: Optional[float] = None) -> None:
+        super().join(timeout)
+        if self.exception is not None:
+            raise self.exception
+
+
+class DataAggregationTask(TaskThread):
     """
     Data aggregation thread.
     """
+    STAGE = 'aggregation'
+
     def __init__(
             self,
             lock: Lock,
             results_of_calculations: list,
-            file_name: str = 'result.json'
+            file_name: str = 'result.json',
+            aggregation_queue: Optional[SimpleQueue] = None,
+            locale: str = 'ru',
+            file_format: str = 'pretty',
+            columnar_file_name: Optional[str] = None,
+            city_registry: Optional[CityRegistry] = None,
+            file_mode: Optional[int] = None,
+            metrics: Optional[Metrics] = None
     ) -> None:
         """
         :param lock: lock for synchronization of threads
         :param results_of_calculations: results of data calculations process
         :param file_name: file name for writing data
+        :param aggregation_queue: queue for sending renamed data of every city
+            to data analyzing thread, None is put after the last city
+        :param locale: key of utils.LOCALES for names in the file
+        :param file_format: format of the file, see result_writer.FILE_FORMATS
+        :param columnar_file_name: file name for writing data in addition in binary columnar format,
+            see columnar_result.ColumnarResultWriter
+        :param city_registry: registry with localized names of cities, names of utils.CITIES by default
+        :param file_mode: permissions of the files, see result_writer.ResultWriter
+        :param metrics: measurements of serialize_seconds per city, rendering included, and commit_seconds
+            of stage aggregation, see metrics.Metrics
         """
-        super().__init__()
+        super().__init__(metrics)
         self._file_name = file_name
+        self._file_format = file_format
+        self._columnar_file_name = columnar_file_name
+        self._file_mode = file_mode
         self._lock = lock
         self._results_of_calculations = results_of_calculations
+        self._aggregation_queue = aggregation_queue
+        if city_registry is None:
+            self._renderer = ResultRenderer(LOCALES[locale])
+        else:
+            self._renderer = ResultRenderer(city_registry.get_translations(locale, LOCALE_FIELDS[locale]))
 
     def _get_renamed_dict(self, data: dict) -> dict:
+        return self._renderer.render(data)
+
+    def _run(self) -> None:
+        logger.info('Write data in file.')
+        # the file is written aside and replaces the old one under the lock
+        writer = ResultWriter(self._file_name, self._file_format, mode=self._file_mode)
+        columnar_writer = None
+        if self._columnar_file_name is not None:
+            columnar_writer = ColumnarResultWriter(self._columnar_file_name, self._file_mode)
         try:
-            result = {}
-            for key, value in data.items():
-                if isinstance(value, dict):
-                    if key not in FIELDS_EN_TO_RUS:
-                        result[key] = self._get_renamed_dict(data[key])
-                    else:
-                        result[FIELDS_EN_TO_RUS[key]] = self._get_renamed_dict(data[key])
-                elif isinstance(value, str):
-                    result[FIELDS_EN_TO_RUS[key]] = FIELDS_EN_TO_RUS[value]
-                else:
-                    result[FIELDS_EN_TO_RUS[key]] = value
-            return result
-        except KeyError:
-            logger.exception('Key error in _get_renamed_dict method')
-
-    def start(self):
+            for result in self._results_of_calculations:
+                with self._metrics.timer('serialize_seconds'):
+                    renamed_dict = self._get_renamed_dict(result)
+                    writer.write(renamed_dict)
+                    if columnar_writer is not None:
+                        columnar_writer.write(self._renderer.translate(result['city_name']), result)
+                if self._aggregation_queue is not None:
+                    self._aggregation_queue.put(renamed_dict)
+        except BaseException:
+            writer.abort()
+            raise
+        if self._renderer.unknown_keys:
+            logger.error('Not translated keys in results: %s.', self._renderer.get_unknown_summary())
         with self._lock:
             logger.info('Lock acquire by aggregation task.')
-            with ThreadPoolExecutor(max_workers=5) as pool:
-                renamed_data = list(pool.map(self._get_renamed_dict, self._results_of_calculations))
-            with open(self._file_name, 'w', encoding='utf-8') as file:
-                logger.info('Write date in file.')
-                json.dump(renamed_data, file, ensure_ascii=False, indent=2)
-                logger.info('Lock release by aggregation task.')
+            with self._metrics.timer('commit_seconds'):
+                writer.commit()
+                if columnar_writer is not None:
+                    columnar_writer.commit()
+            logger.info('Lock release by aggregation task.')
+
+    def _finish(self) -> None:
+        if self._aggregation_queue is not None:
+            self._aggregation_queue.put(None)
 
 
-class DataAnalyzingTask(Thread):
+class DataAnalyzingTask(TaskThread):
     """
     Data analyzing thread.
     """
-    def __init__(self, lock: Lock, file_name: str = 'result.json') -> None:
+    STAGE = 'analysis'
+
+    def __init__(
+            self,
+            lock: Lock,
+            file_name: str = 'result.json',
+            aggregation_queue: Optional[SimpleQueue] = None,
+            locale: str = 'ru',
+            file_format: str = 'pretty',
+            metrics: Optional[Metrics] = None
+    ) -> None:
         """
         :param lock: lock for synchronization of threads
-        :param file_name: file name for reading data
+        :param file_name: file name for reading data, read after data aggregation thread is joined
+        :param aggregation_queue: queue with renamed data of cities from data aggregation thread,
+            the file is not read then
+        :param locale: key of utils.LOCALES used by data aggregation thread
+        :param file_format: format of the file used by data aggregation thread
+            or 'columnar' for the file written by columnar_result.ColumnarResultWriter
+        :param metrics: measurements of stage analysis, see metrics.Metrics
         """
-        super().__init__()
+        super().__init__(metrics)
+        self._file_format = file_format
+        self._city_name_key = LOCALES[locale]['city_name']
+        self._rating_key = LOCALES[locale]['rating']
         self._file_name = file_name
         self._lock = lock
+        self._aggregation_queue = aggregation_queue
+        self.best_cities = []
 
-    def start(self):
+    def _iter_aggregation_result(self) -> Iterator[dict]:
+        if self._aggregation_queue is not None:
+            yield from iter(self._aggregation_queue.get, None)
+            return
         with self._lock:
-            logger.info('Start analysing')
-            with open(self._file_name) as file:
-                aggregation_result = json.load(file)
-            result = [
-                data['Город']
-                for data in aggregation_result
-                if data['Рейтинг'] == 1
-            ]
-            sentence_start = 'The best city' if len(result) == 1 else 'The best cities'
-            result_for_print = ', '.join(result)
-            logger.info(
-                '%s for a vacation is - %s.', sentence_start, result_for_print
-            )
+            if self._file_format == 'columnar':
+                yield from read_columnar_result(self._file_name, self._city_name_key, self._rating_key)
+            else:
+                yield from read_results(self._file_name, self._file_format)
+
+    def _run(self) -> None:
+        logger.info('Start analysing')
+        result = [
+            data[self._city_name_key]
+            for data in self._iter_aggregation_result()
+            if data[self._rating_key] == 1
+        ]
+        self.best_cities = result
+        sentence_start = 'The best city' if len(result) == 1 else 'The best cities'
+        result_for_print = ', '.join(result)
+        logger.info(
+            '%s for a vacation is - %s.', sentence_start, result_for_print
+        )
@@ -0,0 +1,152 @@
+import asyncio
+import json
+
+import pytest
+
+from api_client import AsyncYandexWeatherAPI, ResponseCache, YandexWeatherAPI
+from stream_parser import ForecastStreamParser
+from stub_server import RESPONSE_FILE, SyntheticForecasts, make_cities, run_stub_server
+from utils import project_forecast
+
+
+def test_get_forecasting_from_given_cities(stub_cities):
+    api = YandexWeatherAPI(cities=stub_cities)
+    assert 'forecasts' in api.get_forecasting('CITY0')
+
+
+def test_get_forecasting_unknown_city(stub_cities):
+    api = YandexWeatherAPI(cities=stub_cities)
+    with pytest.raises(Exception, match='UNKNOWN'):
+        api.get_forecasting('UNKNOWN')
+
+
+def test_async_get_forecasting(stub_cities):
+    async def fetch_all():
+        async with AsyncYandexWeatherAPI(cities=stub_cities, concurrency=4) as api:
+            return await asyncio.gather(*(api.get_forecasting(city) for city in stub_cities))
+
+    responses = asyncio.run(fetch_all())
+    assert len(responses) == len(stub_cities)
+    assert all('forecasts' in response for response in responses)
+
+
+def test_async_api_reuses_connections(stub_cities):
+    async def fetch_sequentially(api):
+        for city in stub_cities:
+            await api.get_forecasting(city)
+        return sum(len(connections) for connections in api._idle.values())
+
+    api = AsyncYandexWeatherAPI(cities=stub_cities)
+    assert asyncio.run(fetch_sequentially(api)) == 1
+
+
+def test_async_api_error(stub_server):
+    async def fetch():
+        async with AsyncYandexWeatherAPI(cities={'BROKEN': 'http://127.0.0.1:1/'}) as api:
+            await api.get_forecasting('BROKEN')
+
+    with pytest.raises(Exception):
+        asyncio.run(fetch())
+
+
+def test_response_cache_hit_and_revalidation(stub_server, stub_cities, tmp_path):
+    cache = ResponseCache(directory=str(tmp_path))
+    api = YandexWeatherAPI(cities=stub_cities, cache=cache)
+    first = api.get_forecasting('CITY0')
+    assert api.get_forecasting('CITY0') == first
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['hits'] == 1
+    assert stub_server.request_count == 1
+    cache._ttl = 0
+    assert api.get_forecasting('CITY0') == first
+    assert cache.stats()['revalidations'] == 1
+    assert stub_server.request_count == 2
+
+
+def test_synthetic_forecasts(tmp_path):
+    with run_stub_server(synthetic=SyntheticForecasts('2022-05-26', seed=1)) as server:
+        cities = make_cities(server.base_url, 3)
+        cache = ResponseCache(directory=str(tmp_path), ttl=0)
+        api = YandexWeatherAPI(cities=cities, cache=cache)
+        responses = [api.get_forecasting(city) for city in cities]
+        assert api.get_forecasting('CITY1') == responses[1]
+        assert cache.stats()['revalidations'] == 1
+    assert responses[0]['forecasts'] != responses[1]['forecasts']
+    assert responses[1] == SyntheticForecasts('2022-05-26', seed=1).make_response(1)
+    assert [day['date'] for day in responses[0]['forecasts']][:4] == [
+        '2022-05-26', '2022-05-27', '2022-05-28', '2022-05-29'
+    ]
+    with open(RESPONSE_FILE, encoding='utf-8') as file:
+        template = json.load(file)
+    assert responses[0].keys() == template.keys()
+    assert responses[0]['forecasts'][0]['hours'][0].keys() == template['forecasts'][0]['hours'][0].keys()
+
+
+def test_async_response_cache(stub_server, stub_cities, tmp_path):
+    cache = ResponseCache(directory=str(tmp_path), ttl=0)
+
+    async def fetch_twice():
+        async with AsyncYandexWeatherAPI(cities=stub_cities, cache=cache) as api:
+            await api.get_forecasting('CITY0')
+            return await api.get_forecasting('CITY0')
+
+    assert 'forecasts' in asyncio.run(fetch_twice())
+    assert cache.stats()['misses'] == 1
+    assert cache.stats()['revalidations'] == 1
+
+
+def test_response_cache_eviction(tmp_path):
+    cache = ResponseCache(directory=str(tmp_path), max_size=2500)
+    for index in range(5):
+        cache.put('http://host/{}'.format(index), b'x' * 1000, {})
+    assert cache.stats()['evictions'] == 3
+    assert cache.get('http://host/0') is None
+    assert cache.get('http://host/4').body == b'x' * 1000
+
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 1024, 10 ** 6])
+def test_forecast_stream_parser(chunk_size):
+    with open(RESPONSE_FILE, 'rb') as file:
+        body = file.read()
+    parser = ForecastStreamParser()
+    for start in range(0, len(body), chunk_size):
+        parser.feed(body[start:start + chunk_size])
+    assert parser.close() == project_forecast(json.loads(body))
+
+
+def test_forecast_stream_parser_skips_nested_values():
+    data = {
+        'info': {'name': 'Санкт-Петербург', 'note': 'quote \" and brackets }]'},
+        'forecasts': [{
+            'biomet': [[1, {'x': '{['}]],
+            'date': '2022-05-26',
+            'hours': [{'hour': '9', 'temp': -1, 'condition': 'snow', 'wind_speed': 1.5e1}]
+        }],
+        'now': 1652833102
+    }
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    parser = ForecastStreamParser()
+    for start in range(0, len(body), 3):
+        parser.feed(body[start:start + 3])
+    assert parser.close() == project_forecast(data)
+
+
+def test_forecast_stream_parser_incomplete_body():
+    parser = ForecastStreamParser()
+    parser.feed(b'{"forecasts": [{"date": "2022-05-26", "hours": [')
+    with pytest.raises(ValueError):
+        parser.close()
+
+
+def test_stream_mode(stub_cities, example_forecast, tmp_path):
+    cache = ResponseCache(directory=str(tmp_path))
+    api = YandexWeatherAPI(cities=stub_cities, cache=cache, stream=True)
+    assert api.get_forecasting('CITY0') == example_forecast
+    assert api.get_forecasting('CITY0') == example_forecast
+    assert cache.stats()['hits'] == 1
+
+    async def fetch():
+        async with AsyncYandexWeatherAPI(cities=stub_cities, stream=True) as api:
+            return await api.get_forecasting('CITY1')
+
+    assert asyncio.run(fetch()) == example_forecast
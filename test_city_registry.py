@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from city_registry import City, CityRegistry, load_city_registry
+from rendering import ResultRenderer
+from utils import CITIES, LOCALE_FIELDS
+
+
+@pytest.fixture
+def cities_file(tmp_path):
+    file_name = tmp_path / 'cities.jsonl'
+    with open(file_name, 'w', encoding='utf-8') as file:
+        for index in range(100):
+            city = {
+                'name': 'CITY{}'.format(index),
+                'url': 'http://localhost/city{}-response.json'.format(index),
+                'region': 'region{}'.format(index % 7),
+                'en': 'City {}'.format(index),
+            }
+            file.write(json.dumps(city) + '\n')
+    return str(file_name)
+
+
+def test_registry_of_cities_file():
+    registry = load_city_registry()
+    assert load_city_registry() is registry
+    assert len(registry) == 15
+    assert list(registry)[:2] == ['MOSCOW', 'PARIS']
+    assert registry['CAIRO'] == 'https://code.s3.yandex.net/async-module/cairo-response.json'
+    assert registry.get_city('ABUDHABI') == City(
+        'ABUDHABI', 'https://code.s3.yandex.net/async-module/abudhabi-response.json', 'asia',
+        {'ru': 'Абу Даби', 'en': 'Abu Dhabi'}
+    )
+    assert 'GOTHAM' not in registry
+    with pytest.raises(KeyError):
+        registry['GOTHAM']
+
+
+def test_chunks_and_shards(cities_file):
+    registry = CityRegistry(cities_file)
+    chunks = list(registry.iter_chunks(30))
+    assert [len(chunk) for chunk in chunks] == [30, 30, 30, 10]
+    assert [city.name for chunk in chunks for city in chunk] == list(registry)
+    shards = [registry.shard(number, 3) for number in range(3)]
+    assert sorted(name for shard in shards for name in shard) == sorted(registry)
+    assert all(len(shard) for shard in shards)
+    name = next(iter(shards[1]))
+    assert shards[1][name] == registry[name]
+    assert name not in shards[0]
+    regions = [{registry.get_city(name).region for name in registry.shard(number, 3, 'region')} for number in range(3)]
+    assert sum(len(shard_regions) for shard_regions in regions) == 7
+    with pytest.raises(ValueError):
+        registry.shard(3, 3)
+
+
+def test_localized_names(cities_file):
+    registry = CityRegistry(cities_file)
+    renderer = ResultRenderer(registry.get_translations('en', LOCALE_FIELDS['en']))
+    assert renderer.translate('CITY5') == 'City 5'
+    assert renderer.translate('rating') == 'Rating'
+    assert renderer.translate('MOSCOW') == 'MOSCOW'
+    assert dict(CITIES.get_names('ru'))['SPETERSBURG'] == 'Санкт-Петербург'
+    assert len(registry.get_names('ru')) == 0
@@ -0,0 +1,86 @@
+import math
+import os
+from threading import Lock
+
+import pytest
+
+from columnar_result import ColumnarResult, ColumnarResultWriter
+from result_writer import DEFAULT_MODE
+from tasks import DataAggregationTask, DataAnalyzingTask
+
+RESULTS = [
+    {
+        'city_name': 'MOSCOW',
+        'dates': {'26-05': {'avg_temp': 14, 'cond_hours': 3}, '27-05': {'avg_temp': 16, 'cond_hours': 5}},
+        'AVG': {'avg_temp': 15.0, 'cond_hours': 4.0},
+        'rating': 2
+    },
+    {
+        'city_name': 'CAIRO',
+        'dates': {'27-05': {'avg_temp': 30, 'cond_hours': 11}},
+        'AVG': {'avg_temp': 30.0, 'cond_hours': 11.0},
+        'rating': 1
+    },
+]
+
+
+@pytest.fixture
+def columnar_file(tmp_path):
+    file_name = str(tmp_path / 'result.bin')
+    writer = ColumnarResultWriter(file_name)
+    for result in RESULTS:
+        writer.write(result['city_name'], result)
+    writer.commit()
+    return file_name
+
+
+def test_read_cities(columnar_file):
+    with ColumnarResult(columnar_file) as result:
+        assert result.cities == ['MOSCOW', 'CAIRO']
+        assert result.dates == ['26-05', '27-05']
+        assert [result.get_city(index) for index in range(2)] == RESULTS
+
+
+def test_missing_days_are_nan(columnar_file):
+    with ColumnarResult(columnar_file) as result:
+        avg_temps = result.column('avg_temp').tolist()
+        assert avg_temps[:2] == [14, 16]
+        assert math.isnan(avg_temps[2]) and avg_temps[3] == 30
+        assert result.column('rating').tolist() == [2, 1]
+
+
+def test_numpy_view(columnar_file):
+    np = pytest.importorskip('numpy')
+    result = ColumnarResult(columnar_file)
+    avg_temps = result.array('avg_temp')
+    assert avg_temps.shape == (2, 2)
+    assert np.nanmax(avg_temps, axis=1).tolist() == [16, 30]
+    del avg_temps
+
+
+def test_file_mode(columnar_file):
+    assert os.stat(columnar_file).st_mode & 0o777 == DEFAULT_MODE
+
+
+def test_not_columnar_file(tmp_path):
+    file_name = tmp_path / 'result.json'
+    file_name.write_text('[]' * 10)
+    with pytest.raises(ValueError):
+        ColumnarResult(str(file_name))
+
+
+def test_data_analyzing_thread_reads_columnar_file(tmp_path):
+    lock = Lock()
+    columnar_file_name = str(tmp_path / 'result.bin')
+    data_aggregation_thread = DataAggregationTask(
+        lock=lock,
+        results_of_calculations=RESULTS,
+        file_name=str(tmp_path / 'result.json'),
+        columnar_file_name=columnar_file_name
+    )
+    data_aggregation_thread.start()
+    data_aggregation_thread.join()
+    data_analyzing_thread = DataAnalyzingTask(lock=lock, file_name=columnar_file_name, file_format='columnar')
+    data_analyzing_thread.start()
+    data_analyzing_thread.join()
+    assert data_analyzing_thread.best_cities == ['Каир']
@@ -0,0 +1,55 @@
+import pickle
+import sys
+from threading import Thread
+
+from conditions import ConditionRegistry, load_condition_registry
+
+
+def test_registry_of_conditions_file(bad_conditions):
+    registry = load_condition_registry()
+    assert load_condition_registry() is registry
+    assert len(registry) == 19
+    assert registry.bad_conditions == frozenset(bad_conditions)
+    assert registry.intern('clear') == 0
+    assert not registry.is_bad('clear')
+    assert registry.is_bad('thunderstorm-with-hail')
+    assert registry.bad_mask == sum(1 << registry.codes[condition] for condition in bad_conditions)
+
+
+def test_unknown_condition_is_registered():
+    registry = ConditionRegistry(['clear'], ['rain'])
+    assert registry.codes == {'clear': 0, 'rain': 1}
+    assert registry.intern('fog') == 2
+    assert not registry.is_bad('fog')
+    assert registry.bad_table == bytearray([0, 1, 0])
+    assert registry.bad_mask == 0b10
+
+
+def test_conditions_are_interned_by_threads():
+    registry = ConditionRegistry(['clear'], ['rain'])
+    conditions = ['condition-{}'.format(index) for index in range(2000)]
+    codes = []
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    try:
+        threads = [
+            Thread(target=lambda: codes.append([registry.intern(condition) for condition in conditions]))
+            for _ in range(8)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        sys.setswitchinterval(switch_interval)
+    # every thread got the same code of a condition, codes are dense
+    assert all(thread_codes == codes[0] for thread_codes in codes)
+    assert sorted(registry.codes.values()) == list(range(len(conditions) + 2))
+    assert len(registry.bad_table) == len(registry.codes)
+    assert registry.bad_mask == 0b10
+
+
+def test_registry_is_pickled():
+    registry = pickle.loads(pickle.dumps(load_condition_registry()))
+    assert registry.codes == load_condition_registry().codes
+    assert registry.intern('unknown-condition') == len(load_condition_registry())
@@ -0,0 +1,138 @@
+import json
+import os
+import signal
+import socket
+import time
+from http.client import HTTPConnection
+from multiprocessing import Event, Queue
+from threading import Thread
+
+from daemon import ForecastDaemon, RefreshSchedule, make_query_server
+from forecasting import BAD_CONDITIONS
+from pipeline import run_stages
+from stub_server import SyntheticForecasts, make_cities, run_stub_server
+from tasks import DataCalculationTask, DataFetchingTask
+
+
+START_DAY = '2022-05-26'
+FINISH_DAY = '2022-05-29'
+
+
+class UnixHTTPConnection(HTTPConnection):
+    def __init__(self, path: str) -> None:
+        super().__init__('localhost')
+        self._path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self._path)
+
+
+def query(connection: HTTPConnection, path: str) -> tuple:
+    connection.request('GET', path)
+    response = connection.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def wait_for(condition, timeout: float = 20.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+
+
+def serve(forecast_daemon: ForecastDaemon, **kwargs):
+    server = make_query_server(forecast_daemon, port=0, **kwargs)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def stop_serving(server) -> None:
+    server.shutdown()
+    server.server_close()
+
+
+def test_refresh_schedule():
+    cities = ['CITY{}'.format(index) for index in range(100)]
+    schedule = RefreshSchedule(cities, interval=10, now=0)
+    assert sorted(schedule.pop_due(0)) == sorted(cities)
+    assert schedule.pop_due(0) == []
+    first_half = schedule.pop_due(5)
+    second_half = schedule.pop_due(10)
+    assert 20 < len(first_half) < 80
+    assert sorted(first_half + second_half) == sorted(cities)
+    # every city keeps its own phase of the interval
+    assert sorted(schedule.pop_due(15)) == sorted(first_half)
+    assert sorted(schedule.pop_due(20)) == sorted(second_half)
+
+
+def test_no_ranking_before_first_results():
+    server = serve(ForecastDaemon({}, START_DAY, FINISH_DAY, use_cache=False))
+    connection = HTTPConnection(*server.server_address)
+    try:
+        assert query(connection, '/ranking')[0] == 503
+        assert query(connection, '/unknown')[0] == 404
+        status, health = query(connection, '/health')
+        assert status == 200
+        assert health['ranked'] == 0
+    finally:
+        connection.close()
+        stop_serving(server)
+
+
+def calculate_once(cities: dict) -> list:
+    queue = Queue()
+    result_queue = Queue()
+    stop_event = Event()
+    return run_stages(
+        DataFetchingTask(cities, queue, stop_event=stop_event),
+        DataCalculationTask(START_DAY, FINISH_DAY, queue, result_queue, list(BAD_CONDITIONS)),
+        queue, result_queue, stop_event
+    )
+
+
+def test_daemon_serves_refreshed_ranking(tmp_path):
+    with run_stub_server(synthetic=SyntheticForecasts(START_DAY)) as stub:
+        cities = make_cities(stub.base_url, 20)
+        expected = {city['city_name']: city for city in calculate_once(cities)}
+        forecast_daemon = ForecastDaemon(
+            cities, START_DAY, FINISH_DAY, interval=0.5, publish_interval=0.1, use_cache=False
+        )
+        with forecast_daemon:
+            server = serve(forecast_daemon)
+            unix_server = serve(forecast_daemon, socket_path=str(tmp_path / 'daemon.sock'))
+            connection = HTTPConnection(*server.server_address)
+            try:
+                wait_for(lambda: forecast_daemon.updates >= 2 * len(cities))
+                status, ranking = query(connection, '/ranking')
+                assert status == 200
+                assert {city['city_name']: city for city in ranking} == expected
+                assert [city['rating'] for city in ranking] == sorted(city['rating'] for city in ranking)
+                assert query(connection, '/ranking?top=3') == (200, ranking[:3])
+                assert query(connection, '/ranking?top=x')[0] == 400
+                assert query(connection, '/cities/CITY3') == (200, expected['CITY3'])
+                assert query(connection, '/cities/BERLIN')[0] == 404
+                status, health = query(connection, '/health')
+                assert health['cities'] == health['ranked'] == len(cities)
+                assert health['refreshes'] >= 2 * len(cities)
+                assert query(UnixHTTPConnection(str(tmp_path / 'daemon.sock')), '/ranking') == (200, ranking)
+            finally:
+                connection.close()
+                stop_serving(server)
+                stop_serving(unix_server)
+        assert not os.path.exists(tmp_path / 'daemon.sock')
+
+
+def test_failed_workers_are_restarted():
+    with run_stub_server(synthetic=SyntheticForecasts(START_DAY)) as stub:
+        cities = make_cities(stub.base_url, 5)
+        forecast_daemon = ForecastDaemon(
+            cities, START_DAY, FINISH_DAY, interval=0.5, publish_interval=0.1, use_cache=False
+        )
+        with forecast_daemon:
+            wait_for(lambda: forecast_daemon.updates >= len(cities))
+            os.kill(forecast_daemon._workers._calculation_process.pid, signal.SIGKILL)
+            wait_for(lambda: forecast_daemon.restarts == 1)
+            updates = forecast_daemon.updates
+            wait_for(lambda: forecast_daemon.updates >= updates + len(cities))
+            assert len(forecast_daemon.snapshot.cities) == len(cities)
@@ -0,0 +1,64 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import URLError
+
+import pytest
+
+from api_client import AsyncYandexWeatherAPI, YandexWeatherAPI
+from limiter import AdaptiveLimiter, AsyncAdaptiveLimiter
+from resilience import RetryPolicy
+from stub_server import make_cities, run_stub_server
+
+RETRY = RetryPolicy(attempts=20, base_delay=0.01, max_delay=0.05)
+
+
+def test_limit_grows_with_fast_responses():
+    limiter = AdaptiveLimiter(initial_limit=2, max_limit=4)
+    # latencies of 10 ms, jitter of empty requests of microseconds would look like a queue on the host
+    for _ in range(20):
+        limiter.in_flight += 1
+        limiter._on_done(time.monotonic() - 0.01, None)
+    with limiter.request():
+        pass
+    assert limiter.limit == 4
+    assert limiter.stats() == {'limit': 4, 'in_flight': 0, 'queue_depth': 0}
+
+
+def test_burst_of_failures_decreases_limit_once():
+    limiter = AdaptiveLimiter(initial_limit=16, max_limit=16)
+    started = time.monotonic()
+    limiter.in_flight = 8
+    for _ in range(8):
+        limiter._on_done(started, URLError('refused'))
+    assert limiter.limit == 8
+    with pytest.raises(URLError):
+        with limiter.request():
+            raise URLError('refused')
+    assert limiter.limit == 4
+
+
+def test_limit_under_rate_limited_server():
+    with run_stub_server(latency=0.02, max_in_flight=4) as server:
+        cities = make_cities(server.base_url, 100)
+        limiter = AdaptiveLimiter(initial_limit=10, max_limit=50)
+        api = YandexWeatherAPI(cities=cities, retry=RETRY, limiter=limiter)
+        with ThreadPoolExecutor(max_workers=limiter.max_limit) as pool:
+            responses = list(pool.map(api.get_forecasting, cities))
+        assert all('forecasts' in response for response in responses)
+        assert limiter.limit < 10
+
+
+def test_async_limit_under_slow_server():
+    async def fetch_all(api):
+        async with api:
+            return await asyncio.gather(*(api.get_forecasting(city) for city in cities))
+
+    with run_stub_server(latency=0.02) as server:
+        cities = make_cities(server.base_url, 30)
+        limiter = AsyncAdaptiveLimiter(initial_limit=2, max_limit=50)
+        api = AsyncYandexWeatherAPI(cities=cities, retry=RETRY, limiter=limiter)
+        responses = asyncio.run(fetch_all(api))
+        assert len(responses) == len(cities)
+        assert limiter.limit > 2
+        assert api.stats()['in_flight'] == 0
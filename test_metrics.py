@@ -0,0 +1,111 @@
+import json
+import time
+from multiprocessing import Queue
+
+import pytest
+
+from metrics import Histogram, Metrics
+from tasks import DataCalculationPool, DataCalculationTask, DataFetchingTask
+
+
+def get_histogram(report: dict, name: str, **labels) -> dict:
+    return next(
+        histogram for histogram in report['histograms']
+        if histogram['name'] == name and histogram['labels'] == labels
+    )
+
+
+def test_histogram():
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1]
+    assert histogram.get_quantile(0.5) == 0.1
+    assert histogram.get_quantile(0.75) == 1.0
+    assert histogram.get_quantile(1) == 2.0
+    other = Histogram((0.1, 1.0))
+    other.observe(0.01)
+    histogram.merge(other)
+    assert (histogram.count, histogram.min, histogram.max) == (5, 0.01, 2.0)
+    with pytest.raises(ValueError):
+        histogram.merge(Histogram((1.0,)))
+
+
+def test_metrics_report(tmp_path):
+    metrics = Metrics(buckets=(0.1, 1.0))
+    with metrics.timer('calc_seconds'):
+        pass
+    metrics.observe('stage_seconds', 0.5, stage='fetch')
+    metrics.gauge('queue_depth', 5)
+    metrics.gauge('queue_depth', 2)
+    report = metrics.to_dict()
+    assert get_histogram(report, 'calc_seconds')['count'] == 1
+    assert get_histogram(report, 'stage_seconds', stage='fetch')['buckets'] == {'0.1': 0, '1.0': 1, '+Inf': 0}
+    assert report['gauges'] == [{'name': 'queue_depth', 'labels': {}, 'value': 2, 'max': 5}]
+    lines = metrics.to_prometheus().splitlines()
+    assert '# TYPE weather_stage_seconds histogram' in lines
+    assert 'weather_stage_seconds_bucket{stage="fetch",le="+Inf"} 1' in lines
+    assert 'weather_stage_seconds_sum{stage="fetch"} 0.5' in lines
+    assert 'weather_queue_depth 2' in lines
+    assert 'weather_queue_depth_max 5' in lines
+    file_name = tmp_path / 'metrics.json'
+    metrics.write_report(file_name)
+    with open(file_name, encoding='utf-8') as file:
+        assert json.load(file) == report
+    with pytest.raises(ValueError):
+        metrics.write_report(file_name, 'xml')
+
+
+def test_disabled_metrics():
+    metrics = Metrics(enabled=False)
+    with metrics.stage('fetch'):
+        with metrics.timer('fetch_seconds'):
+            pass
+        metrics.gauge('queue_depth', 1)
+    assert metrics.to_dict() == {'histograms': [], 'gauges': [], 'profiles': {}}
+
+
+def test_stage_profiling():
+    metrics = Metrics(profile_stages=('analysis',), trace_memory_stages=('analysis',))
+    with metrics.stage('analysis'):
+        time.sleep(0.01)
+    profile = metrics.profiles['analysis']
+    assert 'sleep' in profile['cprofile']
+    assert profile['tracemalloc_peak'] > 0
+    assert get_histogram(metrics.to_dict(), 'stage_seconds', stage='analysis')['sum'] >= 0.01
+    assert 'weather_stage_memory_peak_bytes{stage="analysis"}' in metrics.to_prometheus()
+
+
+@pytest.mark.parametrize('task_class', [DataCalculationTask, DataCalculationPool])
+def test_metrics_of_calculation_processes(task_class, bad_conditions, synthetic_cities_data):
+    metrics = Metrics(Queue(), profile_stages=('calculation',))
+    metrics.observe('calc_seconds', 1.0)
+    queue = Queue()
+    task = task_class('2022-05-18', '2022-05-22', queue, Queue(), bad_conditions, metrics=metrics)
+    task.start()
+    for city_data in synthetic_cities_data:
+        queue.put(city_data)
+    queue.put(None)
+    task.result_queue.get()
+    task.join()
+    assert metrics.collect() >= 1
+    report = metrics.to_dict()
+    # the observation of the parent is not sent back by processes
+    assert get_histogram(report, 'calc_seconds')['count'] == len(synthetic_cities_data) + 1
+    assert get_histogram(report, 'queue_get_wait_seconds')['count'] >= len(synthetic_cities_data) + 1
+    assert get_histogram(report, 'stage_seconds', stage='calculation')['count'] == 1
+    assert 'cprofile' in report['profiles']['calculation']
+
+
+def test_metrics_of_fetching_process(stub_cities):
+    metrics = Metrics(Queue())
+    queue = Queue()
+    task = DataFetchingTask(stub_cities, queue, metrics=metrics)
+    task.start()
+    assert len(list(iter(queue.get, None))) == len(stub_cities)
+    task.join()
+    metrics.collect()
+    report = metrics.to_dict()
+    assert get_histogram(report, 'fetch_seconds')['count'] == len(stub_cities)
+    assert get_histogram(report, 'queue_put_wait_seconds')['count'] == len(stub_cities) + 1
+    assert report['gauges'][0]['name'] == 'queue_depth'
@@ -0,0 +1,115 @@
+import os
+import time
+from multiprocessing import Event, Process, Queue
+from queue import Empty, Full
+
+import pytest
+
+from limiter import AdaptiveLimiter
+from pipeline import StageFailed, StageStopped, get, put, run_stages
+from stub_server import make_cities, run_stub_server
+from tasks import DataCalculationTask, DataFetchingTask
+
+
+class CrashingCalculationTask(DataCalculationTask):
+    def run(self):
+        self._queue.get()
+        os._exit(1)
+
+
+class CrashingProducer(Process):
+    def __init__(self, queue: Queue, cities_data: list) -> None:
+        super().__init__()
+        self._queue = queue
+        self._cities_data = cities_data
+
+    def run(self):
+        for city_data in self._cities_data:
+            self._queue.put(city_data)
+        self._queue.close()
+        self._queue.join_thread()
+        os._exit(1)
+
+
+def make_calculation_task(task_class, queue, bad_conditions, **kwargs):
+    return task_class(
+        start_day='2022-05-18',
+        finish_day='2022-05-22',
+        queue=queue,
+        result_queue=Queue(),
+        bad_conditions=bad_conditions,
+        **kwargs
+    )
+
+
+def test_put_and_get_timeouts():
+    queue = Queue(maxsize=1)
+    put(queue, 'city')
+    with pytest.raises(Full):
+        put(queue, 'city', timeout=0.1)
+    stop_event = Event()
+    stop_event.set()
+    with pytest.raises(StageStopped):
+        put(queue, 'city', stop_event)
+    assert get(queue, timeout=1) == 'city'
+    with pytest.raises(Empty):
+        get(queue, timeout=0.1)
+    with pytest.raises(StageFailed):
+        get(queue, lambda: False)
+
+
+def test_fetching_waits_for_bounded_queue():
+    with run_stub_server() as server:
+        cities = make_cities(server.base_url, 40)
+        queue = Queue(maxsize=2)
+        task = DataFetchingTask(cities, queue, limiter=AdaptiveLimiter(initial_limit=2, max_limit=4))
+        task.start()
+        time.sleep(1)
+        # two cities in the queue and one in every thread waiting for a place
+        assert server.request_count <= 6
+        assert task.is_alive()
+        cities_data = list(iter(lambda: get(queue, task.is_alive), None))
+        task.join()
+        assert len(cities_data) == 40
+        assert task.exitcode == 0
+
+
+def test_dead_consumer_stops_producer(bad_conditions):
+    with run_stub_server() as server:
+        queue = Queue(maxsize=2)
+        stop_event = Event()
+        producer = DataFetchingTask(
+            make_cities(server.base_url, 200),
+            queue,
+            limiter=AdaptiveLimiter(initial_limit=4, max_limit=4),
+            stop_event=stop_event
+        )
+        consumer = make_calculation_task(CrashingCalculationTask, queue, bad_conditions)
+        started = time.monotonic()
+        with pytest.raises(StageFailed):
+            run_stages(producer, consumer, queue, consumer.result_queue, stop_event)
+        assert time.monotonic() - started < 10
+        assert consumer.exitcode == 1
+        assert producer.exitcode == 0
+        assert server.request_count < 200
+
+
+def test_dead_producer_finishes_consumer(bad_conditions, synthetic_cities_data):
+    queue = Queue(maxsize=10)
+    stop_event = Event()
+    producer = CrashingProducer(queue, synthetic_cities_data[:5])
+    consumer = make_calculation_task(DataCalculationTask, queue, bad_conditions)
+    results = run_stages(producer, consumer, queue, consumer.result_queue, stop_event, timeout=10)
+    assert producer.exitcode == 1
+    assert consumer.exitcode == 0
+    assert len(results) == 5
+
+
+def test_calculation_get_timeout(bad_conditions, synthetic_cities_data):
+    queue = Queue()
+    task = make_calculation_task(DataCalculationTask, queue, bad_conditions, get_timeout=0.2)
+    queue.put(synthetic_cities_data[0])
+    task.start()
+    results = get(task.result_queue, task.is_alive, timeout=10)
+    task.join()
+    assert [city['city_name'] for city in results] == ['CITY0']
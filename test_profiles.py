@@ -0,0 +1,172 @@
+import json
+import pickle
+from multiprocessing import Queue
+
+import pytest
+
+from forecasting import _write_results
+from metrics import Metrics
+from profiles import ScoringPlan, ScoringProfile, compile_score, get_weekends, make_window_profiles
+from stub_server import SyntheticForecasts
+from tasks import DataCalculationPool, DataCalculationTask
+from utils import project_forecast
+
+
+def make_calculation_task(task_class, queue, bad_conditions, **kwargs):
+    return task_class(
+        start_day='2022-05-18',
+        finish_day='2022-05-22',
+        queue=queue,
+        result_queue=Queue(),
+        bad_conditions=bad_conditions,
+        **kwargs
+    )
+
+
+def test_compile_score():
+    get_score, metrics = compile_score('max(avg_temp, 0) + 0.5 * cond_hours - abs(avg_wind_speed)')
+    assert metrics == ('avg_temp', 'avg_wind_speed', 'cond_hours')
+    assert get_score(avg_temp=-3.0, cond_hours=4.0, avg_wind_speed=-1.5) == 0.5
+
+
+@pytest.mark.parametrize('expression', [
+    '__import__("os")',
+    'avg_temp.real',
+    'temp + cond_hours',
+    '"text"',
+    'avg_temp if cond_hours else 0',
+])
+def test_compile_score_rejects_expression(expression):
+    with pytest.raises(ValueError):
+        compile_score(expression)
+
+
+def test_hour_fields_of_plan():
+    plan = ScoringPlan([ScoringProfile('windless', 'avg_temp - avg_wind_speed')])
+    assert plan.hour_fields == ('hour', 'temp', 'condition', 'wind_speed')
+
+
+def test_profile_is_pickled():
+    profile = pickle.loads(pickle.dumps(ScoringProfile('warm', 'avg_temp * 2')))
+    assert profile.get_score(avg_temp=1.5) == 3.0
+
+
+def test_default_profile_matches_default_scoring(bad_conditions, synthetic_cities_data):
+    task = make_calculation_task(DataCalculationTask, Queue(), bad_conditions)
+    plan = ScoringPlan([ScoringProfile('default')], bad_conditions)
+    for city_data in synthetic_cities_data:
+        days = [(task._get_formatted_date(day), day) for day in task._get_days_period(city_data)]
+        # encoded to tell 9 from 9.0
+        assert json.dumps(plan.calculate(city_data['city_name'], days)) == json.dumps({
+            'default': task._calculate_city_data(city_data)
+        })
+
+
+def test_profiles_share_day_metrics(bad_conditions, example_forecast):
+    plan = ScoringPlan([
+        ScoringProfile('default'),
+        ScoringProfile('cold', '-avg_temp'),
+        ScoringProfile('evening', bottom_day_hour=18, top_day_hour=23),
+    ], bad_conditions)
+    assert len(plan._aggregations) == 2
+    assert plan.hour_fields == ('hour', 'temp', 'condition')
+    days = [(day['date'], day) for day in example_forecast['forecasts']]
+    results = plan.calculate('MOSCOW', days)
+    assert results['cold']['dates'] is results['default']['dates']
+    assert results['cold']['total_score'] == -results['default']['AVG']['avg_temp']
+    assert results['evening']['dates'] != results['default']['dates']
+
+
+@pytest.mark.parametrize('task_class', [DataCalculationTask, DataCalculationPool])
+def test_calculation_task_with_profiles(task_class, bad_conditions, synthetic_cities_data):
+    queue = Queue()
+    task = make_calculation_task(task_class, queue, bad_conditions, profiles=[
+        ScoringProfile('warm'),
+        ScoringProfile('cold', '-avg_temp'),
+    ])
+    task.start()
+    for city_data in synthetic_cities_data:
+        queue.put(city_data)
+    queue.put(None)
+    results = task.result_queue.get()
+    task.join()
+    assert list(results) == ['warm', 'cold']
+    warm_best = {city['city_name'] for city in results['warm'] if city['rating'] == 1}
+    cold_best = {city['city_name'] for city in results['cold'] if city['rating'] == 1}
+    assert warm_best == {'CITY4', 'CITY9', 'CITY14', 'CITY19', 'CITY24', 'CITY29'}
+    assert cold_best == {'CITY0', 'CITY5', 'CITY10', 'CITY15', 'CITY20', 'CITY25'}
+
+
+def test_get_weekends():
+    assert get_weekends('2022-05-18', 2) == [('2022-05-21', '2022-05-22'), ('2022-05-28', '2022-05-29')]
+    assert get_weekends('2022-05-22', 1) == [('2022-05-21', '2022-05-22')]
+
+
+def test_windows_match_separate_runs(bad_conditions, synthetic_cities_data):
+    date_windows = [('2022-05-18', '2022-05-19'), ('2022-05-19', '2022-05-21'), ('2022-05-20', '2022-05-22')]
+    profiles = make_window_profiles(date_windows, [(9, 19), (12, 14)])
+    assert len(profiles) == 6
+    plan = ScoringPlan(profiles, bad_conditions)
+    assert plan.period == ('2022-05-18', '2022-05-22')
+    for city_data in synthetic_cities_data[:5]:
+        results = plan.calculate(city_data['city_name'], [(day['date'], day) for day in city_data['forecasts']])
+        for profile in profiles:
+            separate_plan = ScoringPlan([ScoringProfile(
+                'separate', bottom_day_hour=profile.bottom_day_hour, top_day_hour=profile.top_day_hour
+            )], bad_conditions)
+            days = [
+                (day['date'], day) for day in city_data['forecasts']
+                if profile.start_day <= day['date'] <= profile.finish_day
+            ]
+            assert results[profile.name] == separate_plan.calculate(city_data['city_name'], days)['separate']
+
+
+def test_windows_extend_period_of_task(bad_conditions, synthetic_cities_data):
+    queue = Queue()
+    task = DataCalculationTask(
+        '2022-05-18', '2022-05-18', queue, Queue(), bad_conditions,
+        profiles=[ScoringProfile('default')] + make_window_profiles([('2022-05-19', '2022-05-20')])
+    )
+    task.start()
+    for city_data in synthetic_cities_data:
+        queue.put(city_data)
+    queue.put(None)
+    results = task.result_queue.get()
+    task.join()
+    assert list(results['default'][0]['dates']) == ['18-05']
+    assert list(results['2022-05-19_2022-05-20_9-19'][0]['dates']) == ['19-05', '20-05']
+    with pytest.raises(ValueError):
+        ScoringProfile('empty', start_day='2022-05-22', finish_day='2022-05-21')
+
+
+def run_calculation(task_class, start_day: str, finish_day: str, bad_conditions, cities_data: list, **kwargs):
+    queue = Queue()
+    task = task_class(start_day, finish_day, queue, Queue(), bad_conditions, **kwargs)
+    task.start()
+    for city_data in cities_data:
+        queue.put(city_data)
+    queue.put(None)
+    results = task.result_queue.get()
+    task.join()
+    return results
+
+
+def test_weekend_file_matches_plain_run(tmp_path, bad_conditions):
+    # the weekend of the 28th and 29th has all hours in forecasts from the 27th
+    synthetic = SyntheticForecasts('2022-05-27')
+    cities_data = [
+        dict(project_forecast(synthetic.make_response(index)), city_name='CITY{}'.format(index))
+        for index in range(30)
+    ]
+    profiles = make_window_profiles(get_weekends('2022-05-27', 1))
+    weekend_results = run_calculation(
+        DataCalculationTask, '2022-05-27', '2022-05-31', bad_conditions, cities_data, profiles=profiles
+    )
+    plain_results = run_calculation(DataCalculationTask, '2022-05-28', '2022-05-29', bad_conditions, cities_data)
+    metrics = Metrics(enabled=False)
+    _write_results(weekend_results, str(tmp_path / 'weekend.json'), profiles, None, None, metrics)
+    _write_results(plain_results, str(tmp_path / 'plain.json'), None, None, None, metrics)
+    with open(tmp_path / 'weekend.2022-05-28_2022-05-29_9-19.json', 'rb') as file:
+        weekend = file.read()
+    with open(tmp_path / 'plain.json', 'rb') as file:
+        assert weekend == file.read()
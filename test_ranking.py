@@ -0,0 +1,59 @@
+import pytest
+
+from ranking import CityRanking
+
+
+@pytest.fixture
+def scores():
+    return {'MOSCOW': 20.5, 'CAIRO': 42.0, 'ROMA': 30.1, 'PARIS': 20.5, 'LONDON': 42.0, 'KAZAN': 10}
+
+
+def add_cities(ranking, scores):
+    for city_name, score in scores.items():
+        ranking.add({'city_name': city_name, 'AVG': {}, 'total_score': score})
+
+
+def test_city_ranking(scores):
+    ranking = CityRanking()
+    add_cities(ranking, scores)
+    assert len(ranking) == 6
+    assert ranking.get_top(3) == ['CAIRO', 'LONDON', 'ROMA']
+    assert ranking.get_rating('CAIRO') == 1
+    assert ranking.get_rating('PARIS') == 3
+    assert ranking.get_rating('KAZAN') == 4
+    assert ranking.get_rating('BERLIN') is None
+    results = ranking.get_results()
+    assert [city['city_name'] for city in results] == [
+        'CAIRO', 'LONDON', 'ROMA', 'MOSCOW', 'PARIS', 'KAZAN'
+    ]
+    assert [city['rating'] for city in results] == [1, 1, 2, 3, 3, 4]
+    assert list(results[0]) == ['city_name', 'AVG', 'rating']
+
+
+def test_city_ranking_rating_before_all_cities(scores):
+    ranking = CityRanking()
+    ranking.add({'city_name': 'ROMA', 'total_score': 30.1})
+    assert ranking.get_rating('ROMA') == 1
+    ranking.add({'city_name': 'CAIRO', 'total_score': 42.0})
+    assert ranking.get_rating('ROMA') == 2
+
+
+def test_city_ranking_top_ratings(scores):
+    ranking = CityRanking(top_ratings=2)
+    add_cities(ranking, scores)
+    assert len(ranking) == 3
+    assert ranking.get_rating('MOSCOW') is None
+    assert [city['rating'] for city in ranking.get_results()] == [1, 1, 2]
+
+
+def test_city_ranking_replaces_results_of_known_cities(scores):
+    ranking = CityRanking()
+    add_cities(ranking, scores)
+    ranking.add({'city_name': 'KAZAN', 'AVG': {}, 'total_score': 50.0})
+    ranking.add({'city_name': 'ROMA', 'AVG': {}, 'total_score': 20.5})
+    assert len(ranking) == 6
+    assert ranking.get_top(3) == ['KAZAN', 'CAIRO', 'LONDON']
+    assert ranking.get_rating('ROMA') == 3
+    ranking.discard('KAZAN')
+    ranking.discard('BERLIN')
+    assert [city['rating'] for city in ranking.get_results()] == [1, 1, 2, 2, 2]
@@ -0,0 +1,56 @@
+import pytest
+
+from rendering import ResultRenderer
+from utils import LOCALES
+
+
+@pytest.fixture
+def city_result():
+    return {
+        'city_name': 'MOSCOW',
+        'dates': {
+            '26-05': {'avg_temp': 14, 'cond_hours': 3},
+            '27-05': {'avg_temp': 16, 'cond_hours': 5}
+        },
+        'AVG': {'avg_temp': 15.0, 'cond_hours': 4.0},
+        'rating': 2
+    }
+
+
+def test_render_ru(city_result):
+    renderer = ResultRenderer(LOCALES['ru'])
+    assert renderer.render(city_result) == {
+        'Город': 'Москва',
+        'День': {
+            '26-05': {'Температура, среднее': 14, 'Без осадков, часов': 3},
+            '27-05': {'Температура, среднее': 16, 'Без осадков, часов': 5}
+        },
+        'Среднее': {'Температура, среднее': 15.0, 'Без осадков, часов': 4.0},
+        'Рейтинг': 2
+    }
+    assert not renderer.unknown_keys
+
+
+def test_render_en(city_result):
+    rendered = ResultRenderer(LOCALES['en']).render(city_result)
+    assert list(rendered) == ['City', 'Day', 'Average', 'Rating']
+    assert rendered['City'] == 'Moscow'
+
+
+def test_render_unknown_keys(city_result):
+    renderer = ResultRenderer(LOCALES['ru'])
+    city_result['city_name'] = 'CITY0'
+    city_result['total_score'] = 19.0
+    rendered = renderer.render(city_result)
+    assert rendered['Город'] == 'CITY0'
+    assert rendered['total_score'] == 19.0
+    assert renderer.unknown_keys == {'CITY0', 'total_score'}
+    assert renderer.get_unknown_summary() == '2 keys: CITY0, total_score'
+
+
+def test_unknown_keys_summary(city_result):
+    renderer = ResultRenderer(LOCALES['ru'])
+    for index in range(1000):
+        renderer.render(dict(city_result, city_name='CITY{:04}'.format(index)))
+    assert len(renderer.unknown_keys) == 1000
+    assert renderer.get_unknown_summary() == '1000 keys: CITY0000, CITY0001, CITY0002, CITY0003, CITY0004, ...'
@@ -0,0 +1,104 @@
+import asyncio
+import time
+
+import pytest
+
+from api_client import AsyncYandexWeatherAPI, YandexWeatherAPI
+from resilience import CircuitBreaker, CircuitBreakers, LatencyTracker, RetryPolicy
+from stub_server import Faults, make_cities, run_stub_server
+
+NO_DELAY = RetryPolicy(attempts=5, base_delay=0)
+
+
+def fetch_async(api: AsyncYandexWeatherAPI, cities: dict) -> list:
+    async def fetch_all():
+        async with api:
+            return await asyncio.gather(*(api.get_forecasting(city) for city in cities))
+
+    return asyncio.run(fetch_all())
+
+
+def test_retry_delays_are_bounded():
+    policy = RetryPolicy(attempts=10, base_delay=0.1, max_delay=0.5)
+    assert all(0 <= policy.get_delay(1) <= 0.1 for _ in range(100))
+    assert all(0 <= policy.get_delay(8) <= 0.5 for _ in range(100))
+
+
+def test_circuit_breaker():
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open
+    # the only trial request is let through after reset_timeout
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_success()
+    assert not breaker.is_open
+    assert breaker.allow() and breaker.allow()
+
+
+def test_latency_tracker():
+    tracker = LatencyTracker(percentile=95, min_samples=20)
+    for latency in range(19):
+        tracker.add(latency / 100)
+    assert tracker.get_hedge_delay() is None
+    tracker.add(1.0)
+    assert tracker.get_hedge_delay() == 1.0
+
+
+@pytest.mark.parametrize('fault', ['error', 'drop'])
+def test_retries_of_faults(fault):
+    faults = Faults(**{fault + '_rate': 0.4}, seed=1)
+    with run_stub_server(faults=faults) as server:
+        cities = make_cities(server.base_url, 20)
+        api = YandexWeatherAPI(cities=cities, retry=NO_DELAY)
+        assert all('forecasts' in api.get_forecasting(city) for city in cities)
+        assert api.stats()['retries'] == faults.counts[fault]
+        async_api = AsyncYandexWeatherAPI(cities=cities, retry=NO_DELAY)
+        assert len(fetch_async(async_api, cities)) == len(cities)
+
+
+def test_timeout():
+    with run_stub_server(faults=Faults(slow_rate=1, slow_latency=2)) as server:
+        cities = make_cities(server.base_url, 1)
+        started = time.monotonic()
+        with pytest.raises(Exception):
+            YandexWeatherAPI(cities=cities, timeout=0.1, retry=RetryPolicy(attempts=1)).get_forecasting('CITY0')
+        with pytest.raises(Exception):
+            fetch_async(AsyncYandexWeatherAPI(cities=cities, timeout=0.1, retry=RetryPolicy(attempts=1)), cities)
+        assert time.monotonic() - started < 1
+
+
+def test_open_circuit_fails_fast():
+    cities = {'BROKEN': 'http://127.0.0.1:1/'}
+    api = YandexWeatherAPI(
+        cities=cities,
+        retry=RetryPolicy(attempts=1),
+        breakers=CircuitBreakers(failure_threshold=2, reset_timeout=60)
+    )
+    for _ in range(3):
+        with pytest.raises(Exception):
+            api.get_forecasting('BROKEN')
+    assert api.stats() == {'rejected': 1}
+
+
+@pytest.mark.parametrize('asynchronous', [False, True])
+def test_hedged_requests(asynchronous):
+    faults = Faults(slow_rate=0.05, slow_latency=2, seed=3)
+    with run_stub_server(faults=faults) as server:
+        cities = make_cities(server.base_url, 40)
+        api_class = AsyncYandexWeatherAPI if asynchronous else YandexWeatherAPI
+        api = api_class(cities=cities, hedge=True)
+        for _ in range(100):
+            api._latencies.add(0.05)
+        started = time.monotonic()
+        if asynchronous:
+            fetch_async(api, cities)
+        else:
+            for city in cities:
+                api.get_forecasting(city)
+        assert time.monotonic() - started < 2
+        assert api.stats()['hedged'] >= faults.counts['slow'] > 0
@@ -0,0 +1,109 @@
+import time
+from multiprocessing import Queue
+
+import pytest
+
+from metrics import Metrics
+from profiles import ScoringProfile
+from result_store import CityResultStore, get_context, make_key
+from tasks import DataCalculationTask
+
+
+def calculate(cities_data: list, bad_conditions: list, **kwargs):
+    queue = Queue()
+    task = DataCalculationTask('2022-05-18', '2022-05-22', queue, Queue(), bad_conditions, **kwargs)
+    task.start()
+    for city_data in cities_data:
+        queue.put(city_data)
+    queue.put(None)
+    results = task.result_queue.get()
+    task.join()
+    return results
+
+
+def test_store_keeps_cities_of_last_run(tmp_path):
+    file_name = tmp_path / 'results.jsonl'
+    store = CityResultStore(file_name)
+    store.load()
+    store.put('Moscow', 'a', {'total_score': 1})
+    store.put('Paris', 'b', {'total_score': 2})
+    store.save()
+    store = CityResultStore(file_name)
+    store.load()
+    assert store.get('Moscow', 'a') == {'total_score': 1}
+    assert store.get('Paris', 'c') is None
+    assert (store.hits, store.misses) == (1, 1)
+    store.save()
+    store.load()
+    assert store.get('Moscow', 'a') == {'total_score': 1}
+    assert not store.changed
+    assert store.get('Paris', 'b') is None
+    file_name.write_text('not json\n')
+    store.load()
+    assert store.get('Moscow', 'a') is None
+
+
+def test_keys_depend_on_context():
+    context = get_context('2022-05-18', '2022-05-22', ['rain'])
+    data = [{'date': '2022-05-18', 'hours': [{'hour': '9', 'temp': 10, 'condition': 'clear'}]}]
+    assert make_key(context, data) == make_key(get_context('2022-05-18', '2022-05-22', ['rain']), data)
+    assert make_key(context, data) != make_key(get_context('2022-05-18', '2022-05-23', ['rain']), data)
+    data[0]['hours'][0]['temp'] = 11
+    assert make_key(context, data) != make_key(context, [{'date': '2022-05-18', 'hours': []}])
+
+
+def test_unchanged_cities_are_not_calculated(tmp_path, bad_conditions, synthetic_cities_data):
+    expected = calculate(synthetic_cities_data, bad_conditions)
+    file_name = tmp_path / 'results.jsonl'
+    assert calculate(synthetic_cities_data, bad_conditions, result_store=CityResultStore(file_name)) == expected
+    changed_data = [dict(city_data) for city_data in synthetic_cities_data]
+    changed_data[3]['forecasts'] = [
+        dict(day, hours=[dict(hour, temp=hour['temp'] + 20) for hour in day['hours']])
+        for day in changed_data[3]['forecasts']
+    ]
+    metrics = Metrics(Queue())
+    results = calculate(changed_data, bad_conditions, result_store=CityResultStore(file_name), metrics=metrics)
+    assert results == calculate(changed_data, bad_conditions)
+    assert results[0]['city_name'] == 'CITY3'
+    metrics.collect()
+    assert metrics.gauges[('result_store_hits', ())]['value'] == len(synthetic_cities_data) - 1
+    assert metrics.gauges[('result_store_misses', ())]['value'] == 1
+
+
+def test_stored_results_of_profiles(tmp_path, bad_conditions, synthetic_cities_data):
+    file_name = tmp_path / 'results.jsonl'
+    profiles = [ScoringProfile('default'), ScoringProfile('warm', 'avg_temp')]
+    expected = calculate(synthetic_cities_data, bad_conditions, profiles=profiles)
+    for _ in range(2):
+        results = calculate(
+            synthetic_cities_data, bad_conditions, profiles=profiles, result_store=CityResultStore(file_name)
+        )
+        assert results == expected
+    with pytest.raises(ValueError):
+        DataCalculationTask(
+            '2022-05-18', '2022-05-22', Queue(), Queue(), bad_conditions,
+            engine='numpy', result_store=CityResultStore(file_name)
+        )
+
+
+class SlowResultStore(CityResultStore):
+    def save(self) -> None:
+        time.sleep(0.5)
+        super().save()
+
+
+def test_store_is_saved_before_results(tmp_path, bad_conditions, synthetic_cities_data):
+    file_name = tmp_path / 'results.jsonl'
+    queue = Queue()
+    task = DataCalculationTask(
+        '2022-05-18', '2022-05-22', queue, Queue(), bad_conditions, result_store=SlowResultStore(file_name)
+    )
+    task.start()
+    for city_data in synthetic_cities_data:
+        queue.put(city_data)
+    queue.put(None)
+    task.result_queue.get()
+    # pipeline.run_stages may terminate the process as soon as the results are got
+    assert file_name.exists()
+    assert [path.name for path in tmp_path.iterdir()] == ['results.jsonl']
+    task.join()
@@ -0,0 +1,59 @@
+import json
+import os
+
+import pytest
+
+from result_writer import ResultWriter, read_results
+
+RECORDS = [
+    {'Город': 'Москва', 'Даты': {'26-05': {'Температура': 20, 'Без осадков': 5}}, 'Рейтинг': 2},
+    {'Город': 'Каир', 'Даты': {'26-05': {'Температура': 30, 'Без осадков': 11}}, 'Рейтинг': 1},
+]
+
+
+@pytest.mark.parametrize('records', [RECORDS, []])
+def test_pretty_format_matches_json_dump(tmp_path, records):
+    file_name = str(tmp_path / 'result.json')
+    writer = ResultWriter(file_name)
+    for record in records:
+        writer.write(record)
+    writer.commit()
+    with open(file_name, encoding='utf-8') as file:
+        assert file.read() == json.dumps(records, ensure_ascii=False, indent=2)
+
+
+@pytest.mark.parametrize('file_format', ['pretty', 'compact', 'jsonl'])
+def test_read_results(tmp_path, file_format):
+    file_name = str(tmp_path / 'result.json')
+    writer = ResultWriter(file_name, file_format)
+    for record in RECORDS:
+        writer.write(record)
+    writer.commit()
+    assert list(read_results(file_name, file_format)) == RECORDS
+
+
+def test_file_is_replaced_on_commit_only(tmp_path):
+    file_name = str(tmp_path / 'result.json')
+    writer = ResultWriter(file_name, 'jsonl')
+    writer.write(RECORDS[0])
+    assert not os.path.exists(file_name)
+    writer.abort()
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('mode', [None, 0o600, 0o640])
+def test_file_mode(tmp_path, mode):
+    file_name = str(tmp_path / 'result.json')
+    writer = ResultWriter(file_name, mode=mode)
+    writer.commit()
+    if mode is None:
+        # permissions of a file made by open
+        with open(tmp_path / 'opened.json', 'w'):
+            pass
+        mode = os.stat(tmp_path / 'opened.json').st_mode & 0o777
+    assert os.stat(file_name).st_mode & 0o777 == mode
+
+
+def test_unknown_file_format(tmp_path):
+    with pytest.raises(ValueError):
+        ResultWriter(str(tmp_path / 'result.json'), 'xml')
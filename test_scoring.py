@@ -0,0 +1,103 @@
+import json
+from multiprocessing import Queue
+
+import pytest
+
+from tasks import DataCalculationTask
+
+np = pytest.importorskip('numpy')
+
+from scoring import ColumnarCalculator  # noqa: E402
+
+
+@pytest.fixture
+def columnar_calculator(bad_conditions):
+    return ColumnarCalculator(
+        start_day='2022-05-18',
+        finish_day='2022-05-22',
+        bad_conditions=bad_conditions
+    )
+
+
+@pytest.fixture
+def python_calculation_task(bad_conditions):
+    return DataCalculationTask(
+        start_day='2022-05-18',
+        finish_day='2022-05-22',
+        queue=Queue(),
+        result_queue=Queue(),
+        bad_conditions=bad_conditions
+    )
+
+
+def test_columnar_calculator_matches_python_engine(
+        columnar_calculator,
+        python_calculation_task,
+        synthetic_cities_data
+):
+    expected = [
+        python_calculation_task._calculate_city_data(city_data)
+        for city_data in synthetic_cities_data
+    ]
+    # == takes 9 for 9.0, the written JSON does not
+    assert json.dumps(columnar_calculator.calculate(synthetic_cities_data)) == json.dumps(expected)
+
+
+def test_columnar_calculator_rounding(columnar_calculator):
+    hours = [
+        {'hour': hour, 'temp': temp, 'condition': condition}
+        for hour, temp, condition in (
+            (8, 40, 'clear'), (9, 1, 'rain'), (10, 2, 'clear'), (11, 2, 'clear'), (12, 2, 'snow')
+        )
+    ]
+    city_data = {
+        'city_name': 'CITY',
+        'forecasts': [
+            {'date': '2022-05-18', 'hours': hours[:3]},
+            {'date': '2022-05-19', 'hours': hours},
+            {'date': '2022-05-20', 'hours': hours[:1]},
+            {'date': '2022-05-25', 'hours': hours},
+        ]
+    }
+    assert json.dumps(columnar_calculator.calculate([city_data])) == json.dumps([{
+        'city_name': 'CITY',
+        'dates': {
+            '18-05': {'avg_temp': 2, 'cond_hours': 1},
+            '19-05': {'avg_temp': 2, 'cond_hours': 2}
+        },
+        'AVG': {'avg_temp': 2, 'cond_hours': 1.5},
+        'total_score': 3.5
+    }])
+
+
+def test_numpy_engine_of_calculation_task(synthetic_cities_data, bad_conditions):
+    queue = Queue()
+    result_queue = Queue()
+    for city_data in synthetic_cities_data:
+        queue.put(city_data)
+    queue.put(None)
+    data_calculation_process = DataCalculationTask(
+        start_day='2022-05-18',
+        finish_day='2022-05-22',
+        queue=queue,
+        result_queue=result_queue,
+        bad_conditions=bad_conditions,
+        engine='numpy'
+    )
+    data_calculation_process.start()
+    results = result_queue.get()
+    data_calculation_process.join()
+    assert len(results) == len(synthetic_cities_data)
+    assert results[0]['rating'] == 1
+
+
+def test_unknown_engine(bad_conditions):
+    with pytest.raises(ValueError):
+        DataCalculationTask(
+            start_day='2022-05-18',
+            finish_day='2022-05-22',
+            queue=Queue(),
+            result_queue=Queue(),
+            bad_conditions=bad_conditions,
+            engine='fortran'
+        )
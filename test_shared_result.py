@@ -0,0 +1,147 @@
+import os
+from multiprocessing import Event, Process, Queue
+
+import pytest
+
+from forecasting import _write_results
+from metrics import Metrics
+from pipeline import StageFailed, run_stages
+from profiles import ScoringProfile
+from shared_result import SharedResults
+from tasks import DataCalculationTask
+
+
+class CrashingCalculationTask(DataCalculationTask):
+    def _rank(self):
+        rankings = super()._rank()
+        # messages sent before the crash reach the parent, the rest of the task is lost
+        self._shared_results._flush()
+        self._shared_results._queue.close()
+        self._shared_results._queue.join_thread()
+        os._exit(1)
+        return rankings
+
+
+class CityProducer(Process):
+    def __init__(self, queue: Queue, count: int) -> None:
+        super().__init__()
+        self._queue = queue
+        self._count = count
+
+    def run(self):
+        for index in range(self._count):
+            forecasts = [{'date': '2022-05-18', 'hours': [{'hour': 12, 'temp': index % 30, 'condition': 'clear'}]}]
+            self._queue.put({'city_name': 'CITY{}'.format(index), 'forecasts': forecasts})
+        self._queue.put(None)
+
+
+def start_calculation(task_class, cities_data: list, bad_conditions: list, **kwargs) -> DataCalculationTask:
+    queue = Queue()
+    task = task_class('2022-05-18', '2022-05-22', queue, Queue(), bad_conditions, **kwargs)
+    task.start()
+    for city_data in cities_data:
+        queue.put(city_data)
+    queue.put(None)
+    return task
+
+
+@pytest.mark.parametrize('engine', ['python', 'numpy'])
+def test_shared_results_match_pickled_results(engine, bad_conditions, synthetic_cities_data):
+    if engine == 'numpy':
+        pytest.importorskip('numpy')
+    task = start_calculation(DataCalculationTask, synthetic_cities_data, bad_conditions, engine=engine)
+    expected = task.result_queue.get()
+    task.join()
+    shared_results = SharedResults(block_records=4, batch_records=3)
+    task = start_calculation(
+        DataCalculationTask, synthetic_cities_data, bad_conditions, engine=engine, shared_results=shared_results
+    )
+    partial = list(shared_results.iter_partial(task.is_alive, timeout=10))
+    assert task.result_queue.get() == len(synthetic_cities_data)
+    task.join()
+    try:
+        assert sorted(city['city_name'] for city in partial) == sorted(city['city_name'] for city in expected)
+        assert all('total_score' in city for city in partial)
+        assert len(shared_results) == len(expected)
+        assert list(shared_results) == expected
+        assert shared_results.dates == ['18-05', '19-05', '20-05', '21-05', '22-05']
+    finally:
+        shared_results.close()
+
+
+def test_top_ratings_are_shared(bad_conditions, synthetic_cities_data):
+    shared_results = SharedResults()
+    task = start_calculation(
+        DataCalculationTask, synthetic_cities_data, bad_conditions, top_ratings=1, shared_results=shared_results
+    )
+    shared_results.collect(task.is_alive, timeout=10)
+    task.result_queue.get()
+    task.join()
+    try:
+        assert {city['rating'] for city in shared_results} == {1}
+        assert len(shared_results) == 6
+        assert len(shared_results.cities) == len(synthetic_cities_data)
+    finally:
+        shared_results.close()
+
+
+def test_dead_process_before_ranking(bad_conditions, synthetic_cities_data):
+    shared_results = SharedResults()
+    task = start_calculation(
+        CrashingCalculationTask, synthetic_cities_data, bad_conditions, shared_results=shared_results
+    )
+    task.join()
+    try:
+        with pytest.raises(StageFailed):
+            shared_results.collect(task.is_alive)
+        assert len(shared_results.cities) == len(synthetic_cities_data)
+        assert not shared_results
+    finally:
+        shared_results.close()
+    with pytest.raises(ValueError):
+        DataCalculationTask(
+            '2022-05-18', '2022-05-22', Queue(), Queue(), bad_conditions,
+            profiles=[ScoringProfile('default')], shared_results=SharedResults()
+        )
+
+
+def test_progress_larger_than_pipe(bad_conditions):
+    # names of cities alone overflow the pipe of the progress queue, the process exits after they are read
+    count = 10000
+    queue = Queue()
+    result_queue = Queue()
+    shared_results = SharedResults()
+    task = DataCalculationTask(
+        '2022-05-18', '2022-05-22', queue, result_queue, bad_conditions, shared_results=shared_results
+    )
+    try:
+        rated = run_stages(
+            CityProducer(queue, count), task, queue, result_queue, Event(), receive=shared_results.collect
+        )
+        assert task.exitcode == 0
+        assert rated == len(shared_results) == len(shared_results.cities) == count
+        assert next(iter(shared_results))['rating'] == 1
+    finally:
+        shared_results.close()
+
+
+def test_result_file_matches_pickled_results(tmp_path, bad_conditions, synthetic_cities_data):
+    task = start_calculation(DataCalculationTask, synthetic_cities_data, bad_conditions)
+    expected = task.result_queue.get()
+    task.join()
+    shared_results = SharedResults()
+    task = start_calculation(DataCalculationTask, synthetic_cities_data, bad_conditions, shared_results=shared_results)
+    shared_results.collect(task.is_alive, timeout=10)
+    task.result_queue.get()
+    task.join()
+    contents = []
+    try:
+        for name, results in (('pickled', expected), ('shared', shared_results)):
+            file_name = str(tmp_path / '{}.json'.format(name))
+            _write_results(results, file_name, None, None, None, Metrics(enabled=False))
+            with open(file_name, 'rb') as file:
+                contents.append(file.read())
+    finally:
+        shared_results.close()
+    # whole means are written as 9 and not as 9.0 by both paths
+    assert contents[0] == contents[1]
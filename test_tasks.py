@@ -1,12 +1,22 @@
+import json
 import os
 from multiprocessing import Queue
+from queue import SimpleQueue
 from threading import Lock
 
-from tasks import (DataAggregationTask,
+import pytest
+
+from forecasting import _postprocess, forecast_weather
+from metrics import Metrics
+from stub_server import SyntheticForecasts, make_cities, run_stub_server
+from tasks import (AsyncDataFetchingTask,
+                   DataAggregationTask,
                    DataAnalyzingTask,
+                   DataCalculationPool,
                    DataCalculationTask,
-                   DataFetchingTask)
-from utils import find_file, get_bad_conditions_from_file
+                   DataFetchingTask,
+                   TaskThread)
+from utils import find_file, get_bad_conditions_from_file, project_forecast
 
 
 def test_find_file():
@@ -28,6 +38,23 @@ def test_get_bad_conditions():
     os.remove(test_file_name)
 
 
+def test_project_forecast():
+    data = {
+        'fact': {'temp': 9},
+        'forecasts': [{
+            'date': '2022-05-26',
+            'week': 21,
+            'hours': [{'hour': '9', 'temp': 12, 'condition': 'rain', 'humidity': 81}]
+        }]
+    }
+    assert project_forecast(data) == {
+        'forecasts': [{
+            'date': '2022-05-26',
+            'hours': [{'hour': 9, 'temp': 12, 'condition': 'rain'}]
+        }]
+    }
+
+
 def test_data_fetching(
         data_fetching_process_for_cities,
         cities_for_test,
@@ -44,6 +71,20 @@ def test_data_fetching(
         assert 'forecasts' in city_data
 
 
+def test_async_data_fetching(stub_cities):
+    queue = Queue()
+    data_fetching_process = AsyncDataFetchingTask(cities=stub_cities, queue=queue, concurrency=4)
+    data_fetching_process.start()
+    data_for_cities = []
+    while (data := queue.get()) is not None:
+        data_for_cities.append(data)
+    data_fetching_process.join()
+    assert len(data_for_cities) == len(stub_cities)
+    for city_data in data_for_cities:
+        assert city_data['city_name'] in stub_cities
+        assert 'forecasts' in city_data
+
+
 def test_get_days_period_method(
         city_data,
         data_calculation_process
@@ -68,6 +109,18 @@ def test_get_formatted_date_method(
     assert data_calculation_process._get_formatted_date({'date': '2022-05-17'}) == '17-05'
 
 
+def test_get_days_period_bisect(
+        data_calculation_process
+):
+    days = [{'date': '2022-05-{}'.format(day)} for day in range(24, 31)]
+    days_period = data_calculation_process._get_days_period({'forecasts': days})
+    assert [day['date'] for day in days_period] == [
+        '2022-05-26', '2022-05-27', '2022-05-28', '2022-05-29'
+    ]
+    assert data_calculation_process._get_days_period({'forecasts': days[:2]}) == []
+    assert data_calculation_process._get_formatted_date(days[3]) == '27-05'
+
+
 def test_get_filtered_dates_data_method(
         city_data,
         data_calculation_process
@@ -163,6 +216,65 @@ def test_fetching_and_calculation_processes(
         assert city_data.get('rating')
 
 
+def test_data_calculation_pool(
+        synthetic_cities_data,
+        bad_conditions
+):
+    results = {}
+    for task_class, kwargs in (
+            (DataCalculationTask, {}),
+            (DataCalculationPool, {'workers_count': 3})
+    ):
+        queue = Queue()
+        result_queue = Queue()
+        for city_data in synthetic_cities_data:
+            queue.put(city_data)
+        queue.put(None)
+        data_calculation_process = task_class(
+            start_day='2022-05-18',
+            finish_day='2022-05-22',
+            queue=queue,
+            result_queue=result_queue,
+            bad_conditions=bad_conditions,
+            **kwargs
+        )
+        data_calculation_process.start()
+        results[task_class] = result_queue.get()
+        data_calculation_process.join()
+    pool_results = results[DataCalculationPool]
+    assert len(pool_results) == len(synthetic_cities_data)
+    assert [city['rating'] for city in pool_results] == sorted(city['rating'] for city in pool_results)
+    assert pool_results[0]['rating'] == 1
+    assert pool_results[-1]['rating'] == 5
+    ratings = {city['city_name']: city['rating'] for city in results[DataCalculationTask]}
+    assert {city['city_name']: city['rating'] for city in pool_results} == ratings
+
+
+def test_data_calculation_pool_top_ratings(
+        synthetic_cities_data,
+        bad_conditions
+):
+    queue = Queue()
+    result_queue = Queue()
+    for city_data in synthetic_cities_data:
+        queue.put(city_data)
+    queue.put(None)
+    data_calculation_process = DataCalculationPool(
+        start_day='2022-05-18',
+        finish_day='2022-05-22',
+        queue=queue,
+        result_queue=result_queue,
+        bad_conditions=bad_conditions,
+        workers_count=2,
+        top_ratings=1
+    )
+    data_calculation_process.start()
+    results = result_queue.get()
+    data_calculation_process.join()
+    assert len(results) == 6
+    assert {city['rating'] for city in results} == {1}
+
+
 def test_get_renamed_dict(
         data_calculation_process,
         data_aggregation_thread,
@@ -186,6 +298,7 @@ def test_data_aggregation_thread(
         data_aggregation_thread
 ):
     data_aggregation_thread.start()
+    data_aggregation_thread.join()
     out_file_name = data_aggregation_thread._file_name
     assert find_file(out_file_name).endswith(out_file_name)
     os.remove(out_file_name)
@@ -211,6 +324,94 @@ def test_data_aggregation_and_analyzing_threads(
     )
 
     data_aggregation_thread.start()
+    data_aggregation_thread.join()
     data_analyzing_thread.start()
+    data_analyzing_thread.join()
     assert True
     os.remove(out_file_name)
+
+
+def test_data_aggregation_and_analyzing_threads_in_memory(tmp_path):
+    results_of_calculations = [
+        {
+            'city_name': city_name,
+            'dates': {'26-05': {'avg_temp': 20, 'cond_hours': 5}},
+            'AVG': {'avg_temp': 20.0, 'cond_hours': 5.0},
+            'rating': rating
+        }
+        for city_name, rating in (('MOSCOW', 2), ('CAIRO', 1), ('ROMA', 1))
+    ]
+    lock = Lock()
+    out_file_name = str(tmp_path / 'test.json')
+    aggregation_queue = SimpleQueue()
+    data_aggregation_thread = DataAggregationTask(
+        lock=lock,
+        file_name=out_file_name,
+        results_of_calculations=results_of_calculations,
+        aggregation_queue=aggregation_queue
+    )
+    data_analyzing_thread = DataAnalyzingTask(
+        lock=lock,
+        file_name=out_file_name,
+        aggregation_queue=aggregation_queue
+    )
+    data_aggregation_thread.start()
+    data_analyzing_thread.start()
+    data_analyzing_thread.join()
+    assert data_analyzing_thread.best_cities == ['Каир', 'Рим']
+    data_aggregation_thread.join()
+    with open(out_file_name, encoding='utf-8') as file:
+        assert len(json.load(file)) == 3
+
+
+def test_data_analyzing_thread_error_propagation(lock):
+    aggregation_queue = SimpleQueue()
+    aggregation_queue.put({'Город': 'Москва'})
+    data_analyzing_thread = DataAnalyzingTask(lock=lock, aggregation_queue=aggregation_queue)
+    data_analyzing_thread.start()
+    with pytest.raises(KeyError):
+        data_analyzing_thread.join()
+
+
+def test_postprocess_joins_aggregation_after_failed_analysis(tmp_path, monkeypatch, caplog):
+    def fail(self):
+        raise RuntimeError('analysis failed')
+
+    monkeypatch.setattr(DataAnalyzingTask, '_run', fail)
+    results_of_calculations = [
+        {'city_name': 'MOSCOW', 'dates': {}, 'AVG': {'avg_temp': 20.0, 'cond_hours': 5.0}, 'rating': 1}
+    ]
+    out_file_name = str(tmp_path / 'test.json')
+    _postprocess(results_of_calculations, out_file_name, None, None, Metrics(enabled=False))
+    with open(out_file_name, encoding='utf-8') as file:
+        assert len(json.load(file)) == 1
+    assert 'DataAnalyzingTask failed' in caplog.text
+    assert 'Success!' not in caplog.text
+
+
+def test_task_thread_without_run_is_not_created():
+    class IncompleteTask(TaskThread):
+        pass
+
+    with pytest.raises(TypeError):
+        IncompleteTask()
+
+
+def test_forecast_weather_with_workers(tmp_path):
+    with run_stub_server(synthetic=SyntheticForecasts('2022-05-26')) as stub:
+        cities = make_cities(stub.base_url, 20)
+        results = {}
+        for workers in (1, 3):
+            file_name = str(tmp_path / 'result.{}.json'.format(workers))
+            forecast_weather(
+                cities, file_name, '2022-05-26', '2022-05-29', use_cache=False, use_result_store=False,
+                workers=workers, metrics_file=str(tmp_path / 'metrics.{}.json'.format(workers))
+            )
+            with open(file_name, encoding='utf-8') as file:
+                # cities with the same rating come in order of calculation
+                results[workers] = sorted(json.load(file), key=lambda city: city['Город'])
+        assert results[3] == results[1]
+        with open(tmp_path / 'metrics.3.json', encoding='utf-8') as file:
+            assert 'calculation_worker' in file.read()
+        with pytest.raises(ValueError):
+            forecast_weather(cities, file_name, use_shared_memory=True, workers=2)
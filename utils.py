@@ -1,40 +1,13 @@
 import os
+import sys
 
+from city_registry import load_city_registry
 
-CITIES = {
-    "MOSCOW": "https://code.s3.yandex.net/async-module/moscow-response.json",
-    "PARIS": "https://code.s3.yandex.net/async-module/paris-response.json",
-    "LONDON": "https://code.s3.yandex.net/async-module/london-response.json",
-    "BERLIN": "https://code.s3.yandex.net/async-module/berlin-response.json",
-    "BEIJING": "https://code.s3.yandex.net/async-module/beijing-response.json",
-    "KAZAN": "https://code.s3.yandex.net/async-module/kazan-response.json",
-    "SPETERSBURG": "https://code.s3.yandex.net/async-module/spetersburg-response.json",
-    "VOLGOGRAD": "https://code.s3.yandex.net/async-module/volgograd-response.json",
-    "NOVOSIBIRSK": "https://code.s3.yandex.net/async-module/novosibirsk-response.json",
-    "KALININGRAD": "https://code.s3.yandex.net/async-module/kaliningrad-response.json",
-    "ABUDHABI": "https://code.s3.yandex.net/async-module/abudhabi-response.json",
-    "WARSZAWA": "https://code.s3.yandex.net/async-module/warszawa-response.json",
-    "BUCHAREST": "https://code.s3.yandex.net/async-module/bucharest-response.json",
-    "ROMA": "https://code.s3.yandex.net/async-module/roma-response.json",
-    "CAIRO": "https://code.s3.yandex.net/async-module/cairo-response.json",
-}
+
+# cities are read from examples/cities.csv on first use
+CITIES = load_city_registry()
 
 FIELDS_EN_TO_RUS = {
-    'ABUDHABI': 'Абу Даби',
-    'BEIJING': 'Пекин',
-    'BERLIN': 'Берлин',
-    'BUCHAREST': 'Бухарест',
-    'CAIRO': 'Каир',
-    'KALININGRAD': 'Калининград',
-    'KAZAN': 'Казань',
-    'LONDON': 'Лондон',
-    'MOSCOW': 'Москва',
-    'NOVOSIBIRSK': 'Новосибирск',
-    'PARIS': 'Париж',
-    'ROMA': 'Рим',
-    'SPETERSBURG': 'Санкт-Петербург',
-    'VOLGOGRAD': 'Волгоград',
-    'WARSZAWA': 'Варшава',
     'avg_temp': 'Температура, среднее',
     'cond_hours': 'Без осадков, часов',
     'AVG': 'Среднее',
@@ -44,6 +17,81 @@ FIELDS_EN_TO_RUS = {
 
 }
 
+FIELDS_EN_TO_EN = {
+    'avg_temp': 'Temperature, average',
+    'cond_hours': 'Without precipitation, hours',
+    'AVG': 'Average',
+    'dates': 'Day',
+    'rating': 'Rating',
+    'city_name': 'City'
+}
+
+LOCALE_FIELDS = {
+    'ru': FIELDS_EN_TO_RUS,
+    'en': FIELDS_EN_TO_EN
+}
+
+# translations of fields and of names of cities of CITIES
+LOCALES = {
+    locale: CITIES.get_translations(locale, fields)
+    for locale, fields in LOCALE_FIELDS.items()
+}
+
+
+PROJECTED_HOUR_FIELDS = ('hour', 'temp', 'condition')
+
+
+def project_hour(hour, hour_fields=PROJECTED_HOUR_FIELDS):
+    """
+    :param hour: hour of API response
+    :param hour_fields: fields kept for the hour
+    :return: dictionary with hour_fields only
+    """
+    projected_hour = {field: hour[field] for field in hour_fields}
+    if 'hour' in projected_hour:
+        projected_hour['hour'] = int(projected_hour['hour'])
+    if 'condition' in projected_hour:
+        # repeated condition strings become one object and are pickled once
+        projected_hour['condition'] = sys.intern(projected_hour['condition'])
+    return projected_hour
+
+
+def project_forecast(data, hour_fields=PROJECTED_HOUR_FIELDS):
+    """
+    Drop everything from an API response except the fields used in calculations.
+
+    :param data: decoded API response
+    :param hour_fields: fields kept for every hour
+    :return: dictionary with forecasts-key and list of days with date and hours
+    """
+    return {
+        'forecasts': [
+            {
+                'date': day['date'],
+                'hours': [project_hour(hour, hour_fields) for hour in day['hours']]
+            }
+            for day in data['forecasts']
+        ]
+    }
+
+
+def round_mean(total, count, ndigits=1):
+    """
+    Mean of whole numbers rounded like round(statistics.mean(values), ndigits).
+
+    statistics.mean of ints returns an int when the mean is whole,
+    so results of every engine are encoded to the same JSON.
+
+    :param total: sum of whole numbers
+    :param count: number of the numbers
+    :param ndigits: digits kept after the point
+    :return: int for a whole mean, float rounded to ndigits otherwise
+    """
+    total = int(total)
+    if total % count == 0:
+        return total // count
+    return round(total / count, ndigits)
+
 
 def find_file(name):
     path = os.getcwd()